@@ -72,7 +72,7 @@ echo ""
 echo "📋 Next steps:"
 echo ""
 echo "1. Start Celery worker (in a new terminal):"
-echo "   celery -A spielberg_project worker --loglevel=info"
+echo "   celery -A spielberg_project worker -Q scenes,scripts,long-form,batch,maintenance --loglevel=info"
 echo ""
 echo "2. Start Django server (in another terminal):"
 echo "   python manage.py runserver"
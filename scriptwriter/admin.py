@@ -1,16 +1,29 @@
 from django.contrib import admin
-from .models import ScriptProject, Character, Script, ScriptVersion, Scene, Job
+from .models import ScriptProject, Character, Script, ScriptVersion, Scene, Job, ArchivedJob, TextBlob, SceneSummary
+from .search import matching_ids
+
+
+class FullTextSearchMixin:
+    """Answer admin searches from the full-text index instead of icontains scans"""
+    search_kind = None
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=matching_ids(self.search_kind, search_term)), False
 
 
 @admin.register(Character)
-class CharacterAdmin(admin.ModelAdmin):
+class CharacterAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_kind = 'character'
     list_display = ['name', 'user', 'created_at']
     list_filter = ['user', 'created_at']
     search_fields = ['name', 'personality', 'goals']
 
 
 @admin.register(Script)
-class ScriptAdmin(admin.ModelAdmin):
+class ScriptAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_kind = 'script'
     list_display = ['title', 'user', 'genre', 'tone', 'created_at', 'updated_at']
     list_filter = ['genre', 'tone', 'user', 'created_at']
     search_fields = ['title', 'logline']
@@ -18,25 +31,54 @@ class ScriptAdmin(admin.ModelAdmin):
 
 
 @admin.register(ScriptVersion)
-class ScriptVersionAdmin(admin.ModelAdmin):
+class ScriptVersionAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_kind = 'version'
     list_display = ['script', 'version_number', 'created_at']
     list_filter = ['script', 'created_at']
     search_fields = ['script__title', 'notes']
+    # The text fields belong to ScriptVersion.objects.append() and the delta encoding
+    readonly_fields = ['content', 'content_blob', 'content_hash', 'delta', 'is_delta', 'created_at']
 
 
 @admin.register(Scene)
-class SceneAdmin(admin.ModelAdmin):
+class SceneAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_kind = 'scene'
     list_display = ['script_version', 'scene_number', 'setting', 'created_at']
     list_filter = ['script_version', 'created_at']
     search_fields = ['setting', 'goal', 'tension']
+    readonly_fields = ['content_blob', 'created_at', 'updated_at']
 
 
 @admin.register(Job)
 class JobAdmin(admin.ModelAdmin):
     list_display = ['job_id', 'user', 'job_type', 'status', 'created_at', 'completed_at']
-    list_filter = ['status', 'job_type', 'user', 'created_at']
-    search_fields = ['job_id', 'prompt']
-    readonly_fields = ['job_id', 'created_at', 'started_at', 'completed_at']
+    list_filter = ['status', 'job_type', 'priority', 'served_from_cache', 'user', 'created_at']
+    search_fields = ['job_id', 'idempotency_key', 'batch_id', 'prompt']
+    readonly_fields = ['job_id', 'idempotency_key', 'batch_id', 'served_from_cache', 'result_blob', 'input_tokens', 'output_tokens', 'cache_creation_input_tokens',
+                       'cache_read_input_tokens', 'time_to_first_token_ms', 'rate_limit_wait_ms', 'model', 'queue_wait_ms',
+                       'model_time_ms', 'db_write_ms', 'created_at', 'started_at', 'completed_at']
+
+
+@admin.register(ArchivedJob)
+class ArchivedJobAdmin(admin.ModelAdmin):
+    list_display = ['job_id', 'user', 'job_type', 'status', 'created_at', 'archived_at']
+    list_filter = ['status', 'job_type', 'archived_at']
+    search_fields = ['job_id']
+    readonly_fields = [field.name for field in ArchivedJob._meta.fields]
+
+
+@admin.register(TextBlob)
+class TextBlobAdmin(admin.ModelAdmin):
+    list_display = ['hash', 'size', 'created_at']
+    search_fields = ['hash']
+    readonly_fields = ['hash', 'size', 'created_at']
+
+
+@admin.register(SceneSummary)
+class SceneSummaryAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'model', 'created_at']
+    search_fields = ['content_hash', 'summary']
+    readonly_fields = ['content_hash', 'model', 'created_at']
 
 
 @admin.register(ScriptProject)
@@ -0,0 +1,129 @@
+"""
+Process-wide Anthropic clients.
+
+Creating ``Anthropic(...)`` per call builds a new httpx client, so every
+generation paid for a fresh TLS handshake. Clients here are created lazily
+once per process and reused, with connection limits, keep-alive and
+timeouts from settings:
+
+- ``get_client()`` returns the client for the server's ANTHROPIC_API_KEY.
+- ``get_client(api_key)`` serves per-request keys (the legacy endpoint)
+  from a small LRU. Evicted clients are only dropped, not closed, since a
+  request may still be using them; their connections close once unreferenced.
+- ``get_task_client()`` shares the server client's connections but makes no
+  SDK retries, for generation tasks that retry through celery instead (see
+  ``tasks.retry_if_transient``), behind the rate limiter.
+
+``build_async_client()`` creates the AsyncAnthropic client of an async
+worker (async_worker.py), which owns it for the life of its event loop. It
+makes no SDK retries either; the worker retries transient errors itself.
+
+Sockets must not be shared with a forked child (celery prefork workers), so
+the registry is emptied in the child after ``fork()`` and rebuilt on first use.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic, DefaultAsyncHttpxClient, DefaultHttpxClient
+from django.conf import settings
+
+_lock = threading.Lock()
+_default_client = None
+_task_client = None
+_keyed_clients = OrderedDict()
+
+
+def _reset_after_fork():
+    global _lock, _default_client, _task_client, _keyed_clients
+    # Drop, don't close: the parent process still owns those connections
+    _lock = threading.Lock()
+    _default_client = None
+    _task_client = None
+    _keyed_clients = OrderedDict()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _build_client(api_key):
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.ANTHROPIC_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return Anthropic(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=httpx.Timeout(settings.ANTHROPIC_TIMEOUT, connect=settings.ANTHROPIC_CONNECT_TIMEOUT),
+        max_retries=settings.ANTHROPIC_MAX_RETRIES,
+    )
+
+
+def get_client(api_key=None):
+    """
+    Return a shared client for ``api_key``, or for the server's key when omitted.
+
+    Raises ValueError if no key is given and ANTHROPIC_API_KEY is not set.
+    """
+    global _default_client
+
+    if api_key is None:
+        if _default_client is None:
+            server_key = os.environ.get('ANTHROPIC_API_KEY')
+            if not server_key:
+                raise ValueError("ANTHROPIC_API_KEY not found in environment")
+            with _lock:
+                if _default_client is None:
+                    _default_client = _build_client(server_key)
+        return _default_client
+
+    digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    with _lock:
+        client = _keyed_clients.get(digest)
+        if client is not None:
+            _keyed_clients.move_to_end(digest)
+            return client
+        client = _keyed_clients[digest] = _build_client(api_key)
+        while len(_keyed_clients) > settings.ANTHROPIC_CLIENT_CACHE_SIZE:
+            _keyed_clients.popitem(last=False)
+    return client
+
+
+def get_task_client():
+    """The server's client without SDK retries. Raises ValueError like ``get_client()``"""
+    global _task_client
+
+    if _task_client is None:
+        client = get_client()
+        with _lock:
+            if _task_client is None:
+                _task_client = client.with_options(max_retries=0)
+    return _task_client
+
+
+def build_async_client(max_connections):
+    """
+    AsyncAnthropic client for the server's key, sized for ``max_connections``
+    concurrent requests. Raises ValueError if ANTHROPIC_API_KEY is not set.
+    """
+    server_key = os.environ.get('ANTHROPIC_API_KEY')
+    if not server_key:
+        raise ValueError("ANTHROPIC_API_KEY not found in environment")
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.ANTHROPIC_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return AsyncAnthropic(
+        api_key=server_key,
+        http_client=http_client,
+        timeout=httpx.Timeout(settings.ANTHROPIC_TIMEOUT, connect=settings.ANTHROPIC_CONNECT_TIMEOUT),
+        max_retries=0,
+    )
@@ -0,0 +1,216 @@
+"""
+Asyncio generation worker.
+
+A prefork celery child is blocked for the whole of a generation, so every
+generation in flight costs a process. For lanes listed in
+ASYNC_GENERATION_LANES the scheduler instead pushes jobs onto one Redis
+list, consumed by ``manage.py run_async_worker``: a single process running
+up to ASYNC_WORKER_CONCURRENCY script and scene generations at once on one
+AsyncAnthropic client.
+
+Everything on the event loop is non-blocking: streaming, buffers and events
+use redis.asyncio, job rows are written through the async ORM, and the
+composite sync helpers shared with the celery tasks (building requests,
+completing or failing a job) run through ``sync_to_async``. Transient API
+errors are retried in place with the same jittered backoff as the tasks.
+
+A taken job is moved to the worker's processing list and removed when it
+ends. A worker restarted under the same ``--worker-id`` puts jobs left there
+by a crash back in line. The id is held as a Redis lock while the worker
+runs, so a second process started under it waits rather than requeueing
+jobs the first one is still generating.
+"""
+import asyncio
+import json
+import logging
+import random
+import signal
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis import asyncio as aioredis
+
+from . import generation_cache, scheduler
+from .anthropic_clients import build_async_client
+from .events import apublish_job_event
+from .models import Job, Scene, Script
+from .redis_client import key
+from .streaming import AsyncPartialBuffer, astream_message
+from .tasks import (
+    build_scene_request, build_script_request, complete_scene_job, complete_script_job, fail_job, is_transient,
+    request_scene_summaries,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def queue_key():
+    return key('async-jobs')
+
+
+def processing_key(worker_id):
+    return key('async-jobs', 'processing', worker_id)
+
+
+def worker_lock_key(worker_id):
+    return key('async-jobs', 'worker', worker_id)
+
+
+# Seconds a worker id stays locked after its worker last renewed it
+WORKER_LOCK_TTL = 30
+
+
+async def generate_script(client, redis, job, prompt, script_id=None, script_type='screenplay'):
+    """Async counterpart of generate_script_task"""
+    script = await Script.objects.aget(id=script_id) if script_id else None
+    params = await sync_to_async(build_script_request)(prompt, script, script_type)
+
+    buffer = AsyncPartialBuffer(job, redis)
+    await buffer.reset()
+    message = await astream_message(client, buffer, **params)
+
+    await sync_to_async(complete_script_job)(
+        job, script, message.content[0].text, message, **buffer.timings()
+    )
+    await buffer.discard()
+    await sync_to_async(generation_cache.store)(params, job.result_blob)
+
+
+async def generate_scene(client, redis, job, scene_id, prompt):
+    """Async counterpart of generate_scene_task"""
+    scene = await Scene.objects.select_related('script_version__script').aget(id=scene_id)
+    params, missing_summaries = await sync_to_async(build_scene_request)(scene, prompt)
+    if missing_summaries:
+        await sync_to_async(request_scene_summaries)(scene.script_version_id)
+
+    buffer = AsyncPartialBuffer(job, redis)
+    await buffer.reset()
+    message = await astream_message(client, buffer, **params)
+
+    await sync_to_async(complete_scene_job)(
+        job, scene, message.content[0].text, message, **buffer.timings()
+    )
+    await buffer.discard()
+    await sync_to_async(generation_cache.store)(params, job.result_blob)
+
+
+HANDLERS = {
+    'scriptwriter.tasks.generate_script_task': generate_script,
+    'scriptwriter.tasks.generate_scene_task': generate_scene,
+}
+
+
+async def run_job(client, redis, handler, job_id, *args):
+    """Run ``handler``, retrying transient errors with backoff and failing the job otherwise"""
+    job = await Job.objects.aget(job_id=job_id)
+    attempt = 0
+    while True:
+        # Guarded on the status, so a job that has already finished is left alone
+        if not await sync_to_async(job.start)():
+            return
+        await apublish_job_event(redis, job, 'running', status=job.status, started_at=job.started_at)
+        try:
+            return await handler(client, redis, job, *args)
+        except Exception as e:
+            if not is_transient(e) or attempt >= settings.GENERATION_MAX_RETRIES:
+                await sync_to_async(fail_job)(job, str(e))
+                return
+            attempt += 1
+            if not await sync_to_async(job.transition)('pending', ('running',)):
+                return
+            await apublish_job_event(redis, job, 'retrying', status=job.status, attempt=attempt, error=str(e))
+            countdown = min(settings.GENERATION_RETRY_BACKOFF * 2 ** (attempt - 1), settings.GENERATION_RETRY_BACKOFF_MAX)
+            await asyncio.sleep(random.uniform(0, countdown))
+
+
+class AsyncWorker:
+    def __init__(self, concurrency, worker_id):
+        self.concurrency = concurrency
+        self.worker_id = worker_id
+        self.lock_token = uuid.uuid4().hex
+        self.stopping = asyncio.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    async def acquire_worker_id(self):
+        """Wait until no other live process holds this worker id; False if stopped meanwhile"""
+        lock = worker_lock_key(self.worker_id)
+        waiting = False
+        while not self.stopping.is_set():
+            if await self.redis.set(lock, self.lock_token, nx=True, ex=WORKER_LOCK_TTL):
+                return True
+            if not waiting:
+                logger.warning("Worker id %s is held by another process; waiting for it", self.worker_id)
+                waiting = True
+            await asyncio.sleep(1)
+        return False
+
+    async def renew_worker_id(self):
+        lock = worker_lock_key(self.worker_id)
+        while not self.stopping.is_set():
+            await asyncio.sleep(WORKER_LOCK_TTL / 3)
+            if await self.redis.get(lock) != self.lock_token.encode():
+                logger.error("Worker id %s was lost to another process; stopping", self.worker_id)
+                self.stop()
+                return
+            await self.redis.expire(lock, WORKER_LOCK_TTL)
+
+    async def release_worker_id(self):
+        lock = worker_lock_key(self.worker_id)
+        if await self.redis.get(lock) == self.lock_token.encode():
+            await self.redis.delete(lock)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+
+        self.redis = aioredis.Redis.from_url(settings.REDIS_URL)
+        self.client = build_async_client(self.concurrency)
+        processing = processing_key(self.worker_id)
+        renewal = None
+        try:
+            if not await self.acquire_worker_id():
+                return
+            renewal = asyncio.create_task(self.renew_worker_id())
+
+            # Jobs this worker had taken when it last stopped without finishing them
+            while await self.redis.lmove(processing, queue_key(), 'RIGHT', 'LEFT'):
+                pass
+
+            slots = asyncio.Semaphore(self.concurrency)
+            running = set()
+            while not self.stopping.is_set():
+                await slots.acquire()
+                entry = await self.redis.blmove(queue_key(), processing, 1, 'LEFT', 'RIGHT')
+                if entry is None:
+                    slots.release()
+                    continue
+                task = asyncio.create_task(self.handle(entry))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: slots.release())
+
+            # Stop taking jobs, let the ones in flight finish
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        finally:
+            if renewal is not None:
+                renewal.cancel()
+                await self.release_worker_id()
+            await self.client.close()
+            await self.redis.aclose()
+
+    async def handle(self, entry):
+        payload = json.loads(entry)
+        job_id = payload['args'][0]
+        try:
+            await run_job(self.client, self.redis, HANDLERS[payload['task']], *payload['args'])
+        except Exception:
+            logger.exception("Async generation of job %s failed", job_id)
+        finally:
+            await self.redis.lrem(processing_key(self.worker_id), 1, entry)
+            # Blocking Redis client; off the event loop
+            await asyncio.to_thread(scheduler.release, job_id)
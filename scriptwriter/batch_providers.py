@@ -0,0 +1,102 @@
+"""
+Message Batch providers for batch-priority jobs.
+
+Batch-priority jobs are not picked up by a worker when they are created.
+``submit_batch_jobs`` collects pending ones into a single Message Batch and
+``poll_batch_jobs`` writes the results of ended batches back into Job and
+ScriptVersion rows (both in tasks.py, run by celery beat). The provider is
+chosen by the BATCH_PROVIDER setting:
+
+- ``AnthropicBatchProvider`` uses the Message Batches API through the shared
+  client; setting ANTHROPIC_BASE_URL points it at a local fake batch server.
+- ``LocalBatchProvider`` needs no batch support at all: it keeps submitted
+  requests in the Django cache and answers each one with a regular Messages
+  API call when the batch is first polled.
+"""
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from anthropic import APIError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from . import rate_limit
+from .anthropic_clients import get_client
+
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    message: object = None
+    error: str = ''
+
+
+class BatchProvider(ABC):
+    """Interface: requests are ``(custom_id, params)`` pairs of Messages API parameters"""
+
+    @abstractmethod
+    def submit(self, requests):
+        """Submit requests as one batch and return its id"""
+
+    @abstractmethod
+    def is_finished(self, batch_id):
+        """True once every request of the batch has a result"""
+
+    @abstractmethod
+    def results(self, batch_id):
+        """Yield a BatchResult per request of a finished batch"""
+
+
+class AnthropicBatchProvider(BatchProvider):
+    def submit(self, requests):
+        batch = get_client().messages.batches.create(
+            requests=[{'custom_id': custom_id, 'params': params} for custom_id, params in requests]
+        )
+        return batch.id
+
+    def is_finished(self, batch_id):
+        return get_client().messages.batches.retrieve(batch_id).processing_status == 'ended'
+
+    def results(self, batch_id):
+        for entry in get_client().messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == 'succeeded':
+                yield BatchResult(entry.custom_id, message=result.message)
+            elif result.type == 'errored':
+                yield BatchResult(entry.custom_id, error=result.error.error.message)
+            else:
+                # canceled or expired
+                yield BatchResult(entry.custom_id, error=f"Batch request {result.type}")
+
+
+class LocalBatchProvider(BatchProvider):
+    def _key(self, batch_id):
+        return f'message-batch:{batch_id}'
+
+    def submit(self, requests):
+        batch_id = f'local_{uuid.uuid4().hex}'
+        cache.set(self._key(batch_id), list(requests), timeout=settings.BATCH_LOCAL_TIMEOUT)
+        return batch_id
+
+    def is_finished(self, batch_id):
+        return True
+
+    def results(self, batch_id):
+        requests = cache.get(self._key(batch_id)) or []
+        client = get_client()
+        for custom_id, params in requests:
+            try:
+                reserved_tokens, _ = rate_limit.acquire(params)
+                message = client.messages.create(**params)
+            except (APIError, rate_limit.RateLimitTimeout) as e:
+                yield BatchResult(custom_id, error=str(e))
+                continue
+            rate_limit.settle(reserved_tokens, message.usage)
+            yield BatchResult(custom_id, message=message)
+        cache.delete(self._key(batch_id))
+
+
+def get_batch_provider():
+    return import_string(settings.BATCH_PROVIDER)()
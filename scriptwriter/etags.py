@@ -0,0 +1,88 @@
+"""
+Cheap ETag validators for conditional GETs.
+
+Each validator is computed from a few small columns (timestamps, counters,
+status) without loading any text, so a client whose copy is still current
+gets a ``304 Not Modified`` before anything is serialized.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Job, Script, ScriptVersion
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _first_row(build_queryset, *fields):
+    try:
+        return build_queryset().values_list(*fields).first()
+    except (TypeError, ValueError):
+        # Malformed id in the URL; let the view answer with its usual 404
+        return None
+
+
+def script_etag(user, pk):
+    # updated_at is touched by version appends and scene/character changes (see signals.py)
+    row = _first_row(lambda: Script.objects.filter(pk=pk, user=user), 'updated_at', 'version_count')
+    return make_etag('script', pk, *row) if row else None
+
+
+def version_etag(user, pk):
+    # Version text never changes; only its nested scenes can
+    row = _first_row(
+        lambda: ScriptVersion.objects.filter(pk=pk, script__user=user).annotate(
+            scene_count=Count('scenes'), scenes_updated=Max('scenes__updated_at')
+        ),
+        'scene_count', 'scenes_updated',
+    )
+    return make_etag('version', pk, *row) if row else None
+
+
+# Job columns a job's ETag covers, read from its row or its Redis status record
+JOB_ETAG_FIELDS = (
+    'status', 'started_at', 'completed_at', 'segments_total', 'segments_completed', 'rate_limit_wait_ms',
+)
+
+
+def job_state_etag(pk, values):
+    """
+    ETag of a job from its JOB_ETAG_FIELDS ``values``. They are JSON-encoded
+    as in the status record, so a row and its record give the same ETag.
+    """
+    return make_etag('job', pk, *(json.dumps(value, cls=DjangoJSONEncoder) for value in values))
+
+
+def job_etag(user, **lookup):
+    row = _first_row(lambda: Job.objects.filter(user=user, **lookup), 'pk', *JOB_ETAG_FIELDS)
+    return job_state_etag(row[0], row[1:]) if row else None
+
+
+def conditional_response(request, etag, render):
+    """
+    Return 304 if the request's If-None-Match covers ``etag``, otherwise call
+    ``render()`` and attach the validator to its response.
+    """
+    if etag is None:
+        return render()
+
+    headers = {'ETag': etag, 'Cache-Control': CACHE_CONTROL}
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in if_none_match or etag in if_none_match:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response = render()
+    if response.status_code == status.HTTP_200_OK:
+        for header, value in headers.items():
+            response[header] = value
+    return response
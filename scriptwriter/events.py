@@ -0,0 +1,100 @@
+"""
+Job lifecycle events over Redis pub/sub.
+
+Views and celery tasks publish small JSON events (queued, running, progress,
+completed, failed) on one channel per user. ``job_events`` holds a single
+Server-Sent Events connection per browser tab and relays that user's
+channel, replacing per-job status polling. It is an async view and needs
+the ASGI application (spielberg_project/asgi.py); under WSGI it would tie
+up a worker for the lifetime of the connection.
+
+Events carry ids, statuses and streamed text deltas only, never full
+results; clients fetch those once a job completes. Each event also updates
+the job's status record (status_cache.py).
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from . import status_cache
+from .redis_client import get_redis, key
+
+
+def channel(user_id):
+    return key('job-events', user_id)
+
+
+def _event_message(job, event, data):
+    payload = {'event': event, 'job_id': job.job_id, **data}
+    if job.parent_id:
+        # Outline and segment jobs; clients track them through their parent's 'segment' events
+        payload['parent'] = job.parent_id
+    return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+def publish_job_event(job, event, **data):
+    """
+    Publish ``event`` for ``job`` to its owner's channel and update the job's
+    status record; never raises on Redis errors
+    """
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.publish(channel(job.user_id), _event_message(job, event, data))
+        status_cache.add_event(pipe, job, event, data)
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+async def apublish_job_event(redis, job, event, **data):
+    """publish_job_event for async code, on an asyncio Redis client"""
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.publish(channel(job.user_id), _event_message(job, event, data))
+        status_cache.add_event(pipe, job, event, data)
+        await pipe.execute()
+    except RedisError:
+        pass
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {data}\n\n'
+
+
+async def _relay(user_id):
+    client = aioredis.Redis.from_url(settings.REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(channel(user_id))
+        # Reconnect delay for EventSource after a dropped connection
+        yield f'retry: {settings.JOB_EVENTS_RETRY_MS}\n\n'
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=settings.JOB_EVENTS_HEARTBEAT
+            )
+            if message is None:
+                # Comment line: keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            data = message['data'].decode('utf-8')
+            yield _sse(json.loads(data).get('event', 'message'), data)
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def job_events(request):
+    """Server-Sent Events stream of the current user's job events"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+
+    response = StreamingHttpResponse(_relay(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,69 @@
+"""
+Sparse fieldsets for the REST API.
+
+GET requests may pass ``?fields=a,b`` to limit the top-level fields that are
+rendered and ``?expand=x,y`` to include nested relations that are left out by
+default. The serializer mixin drops the unused fields and the view mixin
+defers the model columns behind them, so unused text is never loaded.
+"""
+
+
+def parse_list_param(request, name):
+    """Return the comma-separated query parameter as a set, or None if absent"""
+    if request is None or request.method != 'GET':
+        return None
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class SparseFieldsSerializerMixin:
+    """Serializer mixin honouring ?fields= and ?expand="""
+    # Nested fields that are only rendered when listed in ?expand=
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+
+        fields = parse_list_param(request, 'fields')
+        expand = parse_list_param(request, 'expand') or set()
+
+        for name in list(self.fields):
+            if name in self.expandable_fields and name not in expand:
+                self.fields.pop(name)
+            elif fields is not None and name not in fields and name not in expand and name != 'id':
+                self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """ViewSet mixin that defers the columns of fields a GET will not render"""
+    # Serializer field name -> model columns that only that field needs
+    heavy_fields = {}
+
+    def is_rendered(self, name):
+        """Whether the serializer for this request will output ``name``"""
+        if self.request.method != 'GET':
+            return True
+
+        fields = parse_list_param(self.request, 'fields')
+        expand = parse_list_param(self.request, 'expand') or set()
+        expandable = getattr(self.get_serializer_class(), 'expandable_fields', ())
+
+        if name in expand:
+            return True
+        if name in expandable:
+            return False
+        return fields is None or name in fields
+
+    def defer_unrendered(self, queryset):
+        deferred = [
+            column
+            for name, columns in self.heavy_fields.items()
+            if not self.is_rendered(name)
+            for column in columns
+        ]
+        return queryset.defer(*deferred) if deferred else queryset
@@ -0,0 +1,53 @@
+"""
+Exact-match cache of generated text.
+
+Every successful generation is recorded under a content-addressed key of
+its request: model, a hash of the system blocks, a hash of the messages and
+max_tokens. The cache entry points at the TextBlob holding the result, so
+nothing is stored twice. Callers that opt in (``allow_cached`` on job
+creation) get an identical earlier request answered from that blob instead
+of a new generation.
+
+Entries whose blob has since been pruned are treated as misses, and Redis
+errors never fail a request.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+from .models import TextBlob
+
+
+def _digest(value):
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    ).hexdigest()
+
+
+def request_key(params):
+    """Cache key for Messages API parameters"""
+    parts = [params['model'], _digest(params['system']), _digest(params['messages']), params['max_tokens']]
+    return 'generation:' + hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def lookup(params):
+    """Return the TextBlob of an earlier identical request, or None"""
+    try:
+        blob_hash = cache.get(request_key(params))
+    except RedisError:
+        return None
+    if blob_hash is None:
+        return None
+    return TextBlob.objects.filter(hash=blob_hash).first()
+
+
+def store(params, blob):
+    if blob is None:
+        return
+    try:
+        cache.set(request_key(params), blob.hash, timeout=settings.GENERATION_CACHE_TIMEOUT)
+    except RedisError:
+        pass
@@ -0,0 +1,67 @@
+"""
+Long-form (feature-length) generation helpers.
+
+A single request is capped by ``max_tokens``, roughly four screenplay pages.
+Long-form jobs first ask for an outline divided into numbered sequences,
+then generate every sequence concurrently from that outline (see the
+long-form tasks in tasks.py) and stitch the results in order into one
+screenplay.
+"""
+import re
+from dataclasses import dataclass
+
+# "SEQUENCE 3: The Heist", "**Sequence 3 - The Heist**", "## SEQUENCE 3. The Heist"
+SEQUENCE_HEADING = re.compile(
+    r'^[ \t>#*_]*SEQUENCE[ \t]+(\d+)[ \t]*[:.\-–—][ \t]*([^\n]*?)[ \t*_#]*$',
+    re.MULTILINE | re.IGNORECASE,
+)
+
+
+@dataclass
+class OutlineSegment:
+    number: int
+    title: str
+    beats: str
+
+
+def outline_instructions(segments):
+    return (
+        f"\n\nDivide the story into exactly {segments} sequences of roughly equal length. "
+        "Start each sequence with a line of the form 'SEQUENCE <number>: <title>' "
+        "followed by its beats."
+    )
+
+
+def parse_outline(text):
+    """Return the numbered sequences in an outline, in order of appearance"""
+    matches = list(SEQUENCE_HEADING.finditer(text))
+    segments = []
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        segments.append(OutlineSegment(
+            number=index + 1,
+            title=match.group(2).strip() or f"Sequence {index + 1}",
+            beats=text[match.end():end].strip(),
+        ))
+    return segments
+
+
+def segment_prompt(outline, segment, total):
+    """User prompt for writing one sequence of the outline"""
+    if segment.number == 1:
+        boundaries = "Open with FADE IN:."
+    elif segment.number == total:
+        boundaries = "End the screenplay with FADE OUT."
+    else:
+        boundaries = "Do not add a title, FADE IN: or FADE OUT."
+    return (
+        f"Outline of the full screenplay:\n\n{outline}\n\n"
+        f"Write sequence {segment.number} of {total}, \"{segment.title}\", in full screenplay format. "
+        f"Cover only the beats of this sequence and start with its first scene heading. {boundaries}\n\n"
+        f"Beats of this sequence:\n{segment.beats}"
+    )
+
+
+def stitch(texts):
+    """Join generated sequences into one screenplay"""
+    return '\n\n'.join(text.strip() for text in texts if text and text.strip()) + '\n'
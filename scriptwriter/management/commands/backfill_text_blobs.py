@@ -0,0 +1,85 @@
+"""
+Move inline version, scene and job text into the content-addressed blob table.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scriptwriter.models import Job, Scene, ScriptVersion, TextBlob, text_hash
+
+
+class Command(BaseCommand):
+    help = "Backfill TextBlob references for existing versions, scenes and jobs in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows processed per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.backfill(
+            'script versions',
+            ScriptVersion.objects.filter(is_delta=False).exclude(content=''),
+            'content', 'content_blob', batch_size,
+            extra=lambda blob: {'content_hash': blob.hash},
+        )
+        self.backfill(
+            'scenes',
+            Scene.objects.exclude(content=''),
+            'content', 'content_blob', batch_size,
+        )
+        self.backfill(
+            'jobs',
+            Job.objects.exclude(result=''),
+            'result', 'result_blob', batch_size,
+        )
+        self.hash_deltas(batch_size)
+
+    def backfill(self, label, queryset, text_field, blob_field, batch_size, extra=None):
+        model = queryset.model
+        moved = 0
+        last_pk = 0
+
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', text_field)[:batch_size]
+            )
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for pk, text in batch:
+                    blob = TextBlob.objects.intern(text)
+                    fields = {text_field: '', blob_field: blob}
+                    if extra:
+                        fields.update(extra(blob))
+                    model.objects.filter(pk=pk).update(**fields)
+
+            moved += len(batch)
+            last_pk = batch[-1][0]
+            self.stdout.write(f"  {label}: {moved} rows moved")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {moved} {label}"))
+
+    def hash_deltas(self, batch_size):
+        """Delta-encoded versions have no blob, but still need a content hash"""
+        queryset = ScriptVersion.objects.filter(is_delta=True, content_hash='')
+        hashed = 0
+        last_pk = 0
+
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for version in batch:
+                    ScriptVersion.objects.filter(pk=version.pk).update(
+                        content_hash=text_hash(version.get_content())
+                    )
+
+            hashed += len(batch)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f"Hashed {hashed} delta-encoded versions"))
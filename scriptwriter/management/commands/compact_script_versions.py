@@ -0,0 +1,34 @@
+"""
+Delta-encode script versions that were stored as full text.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scriptwriter.models import Script, ScriptVersion
+from scriptwriter.versioning import is_keyframe
+
+
+class Command(BaseCommand):
+    help = "Re-encode existing script versions as reverse deltas, keeping keyframes and the latest version in full"
+
+    def handle(self, *args, **options):
+        encoded = 0
+        scripts = 0
+
+        for script_id in Script.objects.values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                versions = (
+                    ScriptVersion.objects
+                    .filter(script_id=script_id)
+                    .order_by('version_number')
+                    .select_for_update()
+                )
+                previous = None
+                for version in versions.iterator():
+                    if previous and not previous.is_delta and not is_keyframe(previous.version_number):
+                        if previous.encode_against(version.get_content()):
+                            encoded += 1
+                    previous = version
+            scripts += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Encoded {encoded} versions across {scripts} scripts"))
@@ -0,0 +1,49 @@
+"""
+Report prompt cache effectiveness from recorded job usage.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from scriptwriter.models import Job
+
+
+class Command(BaseCommand):
+    help = "Show cached input token share and time to first token with and without prompt cache hits"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Only jobs completed in the last N days")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        jobs = Job.objects.filter(status='completed', completed_at__gte=since, input_tokens__isnull=False)
+        hit = Q(cache_read_input_tokens__gt=0)
+
+        rows = jobs.values('job_type').annotate(
+            jobs=Count('id'),
+            cache_hits=Count('id', filter=hit),
+            uncached_tokens=Sum('input_tokens'),
+            written_tokens=Sum('cache_creation_input_tokens'),
+            read_tokens=Sum('cache_read_input_tokens'),
+            ttft_hit=Avg('time_to_first_token_ms', filter=hit),
+            ttft_miss=Avg('time_to_first_token_ms', filter=~hit),
+        ).order_by('job_type')
+
+        if not rows:
+            self.stdout.write("No completed jobs with recorded usage")
+            return
+
+        for row in rows:
+            total = row['uncached_tokens'] + row['written_tokens'] + row['read_tokens']
+            share = row['read_tokens'] / total if total else 0
+            self.stdout.write(
+                f"{row['job_type']}: {row['jobs']} jobs, {row['cache_hits']} cache hits, "
+                f"{row['read_tokens']}/{total} input tokens from cache ({share:.1%})"
+            )
+            if row['ttft_hit'] is not None and row['ttft_miss'] is not None:
+                self.stdout.write(
+                    f"  time to first token: {row['ttft_hit']:.0f} ms with cache hit, "
+                    f"{row['ttft_miss']:.0f} ms without (saves {row['ttft_miss'] - row['ttft_hit']:.0f} ms)"
+                )
@@ -0,0 +1,38 @@
+"""
+Rebuild the full-text search index from scratch.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scriptwriter.models import Character, Scene, Script, ScriptVersion
+from scriptwriter.search import index_instance
+
+
+class Command(BaseCommand):
+    help = "Index every script, version, scene and character for /api/search/"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help="Objects indexed per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        querysets = [
+            Script.objects.all(),
+            ScriptVersion.objects.select_related('script', 'content_blob'),
+            Scene.objects.select_related('script_version__script', 'content_blob'),
+            Character.objects.all(),
+        ]
+
+        for queryset in querysets:
+            indexed = 0
+            last_pk = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                with transaction.atomic():
+                    for instance in batch:
+                        index_instance(instance)
+                indexed += len(batch)
+                last_pk = batch[-1].pk
+            self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} {queryset.model._meta.verbose_name_plural}"))
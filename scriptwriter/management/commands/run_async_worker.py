@@ -0,0 +1,36 @@
+"""
+Run the asyncio generation worker for lanes listed in ASYNC_GENERATION_LANES.
+"""
+import asyncio
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scriptwriter.async_worker import AsyncWorker
+
+
+class Command(BaseCommand):
+    help = "Consume async generation jobs, running many generations concurrently in one process"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.ASYNC_WORKER_CONCURRENCY,
+            help="Generations in flight at once",
+        )
+        parser.add_argument(
+            '--worker-id', default=socket.gethostname(),
+            help=(
+                "Stable id of this worker; a restart under the same id resumes jobs it had taken. "
+                "Give each worker process on a host its own id: a second process under a held id waits"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if not settings.ASYNC_GENERATION_LANES:
+            self.stderr.write("ASYNC_GENERATION_LANES is empty; no jobs will be sent to this worker")
+        self.stdout.write(
+            f"Async worker {options['worker_id']}: up to {options['concurrency']} generations "
+            f"for lanes {', '.join(settings.ASYNC_GENERATION_LANES) or '(none)'}"
+        )
+        asyncio.run(AsyncWorker(options['concurrency'], options['worker_id']).run())
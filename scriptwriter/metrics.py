@@ -0,0 +1,136 @@
+"""
+Generation telemetry in Prometheus text format.
+
+Celery workers, the async worker and the web app are separate processes
+(and containers), so counters and histograms are aggregated in one Redis
+hash rather than in process memory; ``render()`` turns it into the text
+served at ``/metrics``. Each finished job adds:
+
+- ``spielberg_jobs_total`` by job type, model and status;
+- ``spielberg_tokens_total`` by job type, model and kind, for jobs that
+  called the model themselves (a long-form job's tokens are its segments');
+- histograms of queue wait, time to first token, model time and result
+  write time, by job type and model.
+
+Redis errors never fail a job; the observations are lost instead.
+"""
+from collections import defaultdict
+
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis, key
+
+PREFIX = 'spielberg_'
+
+# Upper bounds in seconds, from DB writes (milliseconds) to long-form generations (minutes)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+COUNTERS = {
+    'jobs_total': ('Finished jobs', ('job_type', 'model', 'status')),
+    'tokens_total': ('Tokens of model requests, by kind', ('job_type', 'model', 'kind')),
+}
+
+# Histogram name -> (help, Job field in milliseconds)
+HISTOGRAMS = {
+    'queue_wait_seconds': ('Time from job creation until a worker started it', 'queue_wait_ms'),
+    'time_to_first_token_seconds': ('Time from sending a request until its first token', 'time_to_first_token_ms'),
+    'model_time_seconds': ('Time from sending a request until its complete response', 'model_time_ms'),
+    'db_write_seconds': ('Time spent storing a job result', 'db_write_ms'),
+}
+HISTOGRAM_LABELS = ('job_type', 'model')
+
+TOKEN_FIELDS = {
+    'input': 'input_tokens',
+    'output': 'output_tokens',
+    'cache_creation': 'cache_creation_input_tokens',
+    'cache_read': 'cache_read_input_tokens',
+}
+
+# Fields of the metrics hash are tab-separated: metric name, label values, then the
+# series ('count', 'sum' or a bucket bound) for histograms
+SEPARATOR = '\t'
+
+
+def metrics_key():
+    return key('metrics')
+
+
+def _field(*parts):
+    return SEPARATOR.join(str(part) for part in parts)
+
+
+def _bucket(seconds):
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return bound
+    return '+Inf'
+
+
+def observe_job(job, called_model=False):
+    """Record a finished job; ``called_model`` if its own request used the reported tokens"""
+    model = job.model or 'none'
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hincrby(metrics_key(), _field('jobs_total', job.job_type, model, job.status), 1)
+    if called_model:
+        for kind, field in TOKEN_FIELDS.items():
+            tokens = getattr(job, field)
+            if tokens:
+                pipe.hincrby(metrics_key(), _field('tokens_total', job.job_type, model, kind), tokens)
+    for name, (_, field) in HISTOGRAMS.items():
+        milliseconds = getattr(job, field)
+        if milliseconds is None:
+            continue
+        seconds = milliseconds / 1000
+        pipe.hincrby(metrics_key(), _field(name, job.job_type, model, _bucket(seconds)), 1)
+        pipe.hincrby(metrics_key(), _field(name, job.job_type, model, 'count'), 1)
+        pipe.hincrbyfloat(metrics_key(), _field(name, job.job_type, model, 'sum'), seconds)
+    try:
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    raw = get_redis().hgetall(metrics_key())
+    counters = defaultdict(dict)
+    histograms = defaultdict(lambda: defaultdict(dict))
+    for field, value in raw.items():
+        name, *parts = field.decode('utf-8').split(SEPARATOR)
+        if name in COUNTERS:
+            counters[name][tuple(parts)] = float(value)
+        elif name in HISTOGRAMS:
+            *labels, series = parts
+            histograms[name][tuple(labels)][series] = float(value)
+
+    lines = []
+    for name, (help_text, label_names) in COUNTERS.items():
+        lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} counter']
+        for labels, value in sorted(counters[name].items()):
+            lines.append(f'{PREFIX}{name}{_labels(label_names, labels)} {_number(value)}')
+    for name, (help_text, _) in HISTOGRAMS.items():
+        lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} histogram']
+        for labels, series in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound in BUCKETS:
+                cumulative += series.get(str(bound), 0)
+                lines.append(f'{PREFIX}{name}_bucket{_labels(HISTOGRAM_LABELS, labels, le=bound)} {_number(cumulative)}')
+            lines.append(
+                f'{PREFIX}{name}_bucket{_labels(HISTOGRAM_LABELS, labels, le="+Inf")} {_number(series.get("count", 0))}'
+            )
+            lines.append(f'{PREFIX}{name}_sum{_labels(HISTOGRAM_LABELS, labels)} {_number(series.get("sum", 0))}')
+            lines.append(f'{PREFIX}{name}_count{_labels(HISTOGRAM_LABELS, labels)} {_number(series.get("count", 0))}')
+    return '\n'.join(lines) + '\n'
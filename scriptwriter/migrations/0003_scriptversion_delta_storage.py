@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0002_scene_character_script_job_scriptversion_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scriptversion',
+            name='delta',
+            field=models.TextField(blank=True, help_text='Reverse delta against the next version'),
+        ),
+        migrations.AddField(
+            model_name='scriptversion',
+            name='is_delta',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='scriptversion',
+            name='content',
+            field=models.TextField(blank=True, help_text='Full text; empty when stored as a delta'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0003_scriptversion_delta_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scriptversion',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='Hash of the full text, also set for deltas', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='result',
+            field=models.TextField(blank=True, help_text='Legacy inline result, moved to result_blob by backfill_text_blobs'),
+        ),
+        migrations.AlterField(
+            model_name='scene',
+            name='content',
+            field=models.TextField(blank=True, help_text='Legacy inline text, moved to content_blob on save'),
+        ),
+        migrations.AlterField(
+            model_name='scriptversion',
+            name='content',
+            field=models.TextField(blank=True, help_text='Legacy inline text, moved to content_blob by backfill_text_blobs'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='result_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='scriptwriter.textblob'),
+        ),
+        migrations.AddField(
+            model_name='scene',
+            name='content_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='scriptwriter.textblob'),
+        ),
+        migrations.AddField(
+            model_name='scriptversion',
+            name='content_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='scriptwriter.textblob'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_latest_versions(apps, schema_editor):
+    Script = apps.get_model('scriptwriter', 'Script')
+    ScriptVersion = apps.get_model('scriptwriter', 'ScriptVersion')
+
+    # version_count is the number of versions that exist, as append/removed keep it
+    scripts = Script.objects.annotate(versions_present=models.Count('versions')).filter(versions_present__gt=0)
+    for script in scripts.iterator():
+        latest = (
+            ScriptVersion.objects
+            .filter(script_id=script.pk)
+            .order_by('-version_number')
+            .only('id', 'version_number')
+            .first()
+        )
+        Script.objects.filter(pk=script.pk).update(
+            latest_version_id=latest.pk, version_count=script.versions_present
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0004_text_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='script',
+            name='latest_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scriptwriter.scriptversion'),
+        ),
+        migrations.AddField(
+            model_name='script',
+            name='version_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_latest_versions, migrations.RunPython.noop),
+    ]
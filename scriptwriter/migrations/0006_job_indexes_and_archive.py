@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0005_script_latest_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_id', models.CharField(max_length=255, unique=True)),
+                ('job_type', models.CharField(choices=[('script_generation', 'Script Generation'), ('scene_generation', 'Scene Generation'), ('script_refinement', 'Script Refinement')], max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], max_length=20)),
+                ('script_id', models.BigIntegerField(blank=True, null=True)),
+                ('prompt_excerpt', models.CharField(blank=True, max_length=500)),
+                ('result_hash', models.CharField(blank=True, max_length=64)),
+                ('result_size', models.PositiveIntegerField(default=0)),
+                ('error_message', models.CharField(blank=True, max_length=1000)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'job_type'], name='job_status_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'completed_at'], name='job_status_completed_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedjob',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedjob',
+            index=models.Index(fields=['user', '-created_at'], name='archivedjob_user_created_idx'),
+        ),
+    ]
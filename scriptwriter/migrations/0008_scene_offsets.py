@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scene',
+            name='end_offset',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scene',
+            name='start_offset',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
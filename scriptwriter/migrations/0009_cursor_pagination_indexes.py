@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0008_scene_offsets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_user_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='job_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='script',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='script_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scriptversion',
+            index=models.Index(fields=['-created_at', '-id'], name='scriptversion_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0009_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='partial_result',
+            field=models.TextField(blank=True, help_text='Streamed output so far, flushed periodically from the Redis buffer'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0010_job_partial_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='cache_creation_input_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='cache_read_input_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='input_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='output_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='time_to_first_token_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0011_job_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client-supplied Idempotency-Key header', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='served_from_cache',
+            field=models.BooleanField(default=False, help_text='Completed from an identical earlier generation'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('user', 'idempotency_key'), name='job_user_idempotency_key_uniq'),
+        ),
+    ]
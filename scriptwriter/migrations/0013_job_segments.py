@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0012_job_idempotency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='scriptwriter.job'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='segment_index',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='segments_completed',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='segments_total',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='archivedjob',
+            name='job_type',
+            field=models.CharField(choices=[('script_generation', 'Script Generation'), ('scene_generation', 'Scene Generation'), ('script_refinement', 'Script Refinement'), ('long_form_generation', 'Long-Form Script Generation'), ('outline_generation', 'Outline Generation'), ('segment_generation', 'Segment Generation')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='job_type',
+            field=models.CharField(choices=[('script_generation', 'Script Generation'), ('scene_generation', 'Scene Generation'), ('script_refinement', 'Script Refinement'), ('long_form_generation', 'Long-Form Script Generation'), ('outline_generation', 'Outline Generation'), ('segment_generation', 'Segment Generation')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0013_job_segments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedjob',
+            name='job_type',
+            field=models.CharField(choices=[('script_generation', 'Script Generation'), ('scene_generation', 'Scene Generation'), ('script_refinement', 'Script Refinement'), ('long_form_generation', 'Long-Form Script Generation'), ('outline_generation', 'Outline Generation'), ('segment_generation', 'Segment Generation'), ('scene_batch_regeneration', 'Scene Batch Regeneration')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='job_type',
+            field=models.CharField(choices=[('script_generation', 'Script Generation'), ('scene_generation', 'Scene Generation'), ('script_refinement', 'Script Refinement'), ('long_form_generation', 'Long-Form Script Generation'), ('outline_generation', 'Outline Generation'), ('segment_generation', 'Segment Generation'), ('scene_batch_regeneration', 'Scene Batch Regeneration')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0014_job_scene_batch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='batch_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Message Batch this job was submitted in', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('batch', 'Batch')], default='interactive', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='script_type',
+            field=models.CharField(default='screenplay', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['priority', 'status'], name='job_priority_status_idx'),
+        ),
+    ]
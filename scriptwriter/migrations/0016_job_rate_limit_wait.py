@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0015_job_batch_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='rate_limit_wait_ms',
+            field=models.PositiveIntegerField(default=0, help_text='Time spent waiting for the cluster-wide rate limiter, over all attempts'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0016_job_rate_limit_wait'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='db_write_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='Time spent storing the result', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='model',
+            field=models.CharField(blank=True, help_text='Model that answered the request', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='model_time_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='From sending the request until the complete response', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='queue_wait_ms',
+            field=models.PositiveIntegerField(blank=True, help_text='From creation until a worker first started the job', null=True),
+        ),
+    ]
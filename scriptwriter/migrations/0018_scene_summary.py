@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scriptwriter', '0017_job_telemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SceneSummary',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('summary', models.TextField()),
+                ('model', models.CharField(blank=True, help_text='Model that wrote the summary', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
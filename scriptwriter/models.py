@@ -1,5 +1,45 @@
-from django.db import models
+import hashlib
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .versioning import MissingFullText, apply_delta, is_keyframe, make_delta, rebuilt_texts
+
+
+def text_hash(text):
+    """SHA-256 hex digest used to address stored text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TextBlobManager(models.Manager):
+    def intern(self, text):
+        """Return the blob holding ``text``, storing it only if it is new"""
+        digest = text_hash(text)
+        blob, _ = self.get_or_create(hash=digest, defaults={'content': text, 'size': len(text)})
+        return blob
+    
+    def unreferenced(self):
+        """Blobs no version, scene or job points at any more"""
+        return self.exclude(
+            models.Exists(ScriptVersion.objects.filter(content_blob=models.OuterRef('pk')))
+        ).exclude(
+            models.Exists(Scene.objects.filter(content_blob=models.OuterRef('pk')))
+        ).exclude(
+            models.Exists(Job.objects.filter(result_blob=models.OuterRef('pk')))
+        )
+
+
+class TextBlob(models.Model):
+    """Content-addressed text shared by versions, scenes and job results"""
+    hash = models.CharField(max_length=64, primary_key=True)
+    content = models.TextField()
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = TextBlobManager()
+    
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} chars)"
 
 
 class Character(models.Model):
@@ -52,33 +92,175 @@ class Script(models.Model):
     tone = models.CharField(max_length=50, choices=TONE_CHOICES, default='dramatic')
     logline = models.TextField(blank=True)
     characters = models.ManyToManyField(Character, related_name='scripts', blank=True)
+    
+    # Maintained by ScriptVersion.objects.append() in the same transaction as the insert,
+    # and by ScriptVersion.objects.removed() after a version is deleted
+    latest_version = models.ForeignKey(
+        'ScriptVersion', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    version_count = models.PositiveIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Cursor pagination key for a user's script list
+            models.Index(fields=['user', '-updated_at', '-id'], name='script_user_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.user.username})"
     
     def get_latest_version(self):
-        return self.versions.order_by('-version_number').first()
+        return self.latest_version
+
+
+class ScriptVersionManager(models.Manager):
+    def append(self, script, content, notes=''):
+        """
+        Add a new version to a script.
+
+        The new version always keeps its full text. The previous latest
+        version is re-encoded as a reverse delta against it unless it is a
+        keyframe.
+        """
+        blob = TextBlob.objects.intern(content)
+        
+        with transaction.atomic():
+            # Lock the script row so concurrent appends get consecutive numbers
+            locked = (
+                Script.objects
+                .select_for_update(of=('self',))
+                .select_related('latest_version__content_blob')
+                .get(pk=script.pk)
+            )
+            previous = locked.latest_version
+            version_number = previous.version_number + 1 if previous else 1
+
+            version = self.create(
+                script=locked,
+                version_number=version_number,
+                content_blob=blob,
+                content_hash=blob.hash,
+                notes=notes
+            )
+            
+            now = timezone.now()
+            version_count = locked.version_count + 1
+            Script.objects.filter(pk=locked.pk).update(
+                latest_version=version, version_count=version_count, updated_at=now
+            )
+            script.latest_version, script.version_count, script.updated_at = version, version_count, now
+
+            if previous and not previous.is_delta and not is_keyframe(previous.version_number):
+                previous.encode_against(content)
+
+        return version
+    
+    def removed(self, script_id):
+        """
+        Point a script at its highest remaining version and drop one from its
+        count after one of its versions was deleted.
+        """
+        with transaction.atomic():
+            locked = Script.objects.select_for_update().filter(pk=script_id).first()
+            if locked is None:
+                return
+            latest = self.filter(script_id=script_id).order_by('-version_number').only('pk').first()
+            Script.objects.filter(pk=script_id).update(
+                latest_version=latest,
+                version_count=max(locked.version_count - 1, 0),
+                updated_at=timezone.now(),
+            )
 
 
 class ScriptVersion(models.Model):
     """Model for storing script versions"""
     script = models.ForeignKey(Script, on_delete=models.CASCADE, related_name='versions')
     version_number = models.PositiveIntegerField()
-    content = models.TextField()
+    content = models.TextField(blank=True, help_text="Legacy inline text, moved to content_blob by backfill_text_blobs")
+    content_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    content_hash = models.CharField(max_length=64, blank=True, help_text="Hash of the full text, also set for deltas")
+    delta = models.TextField(blank=True, help_text="Reverse delta against the next version")
+    is_delta = models.BooleanField(default=False)
     notes = models.TextField(blank=True, help_text="Notes about this version")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = ScriptVersionManager()
+    
     class Meta:
         ordering = ['-version_number']
         unique_together = ['script', 'version_number']
+        indexes = [
+            # Cursor pagination key for the version list
+            models.Index(fields=['-created_at', '-id'], name='scriptversion_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.script.title} v{self.version_number}"
+    
+    def _full_text(self):
+        if self.content_blob_id:
+            return self.content_blob.content
+        return self.content
+    
+    def get_content(self):
+        """Return the full text, rebuilding it from deltas if needed"""
+        if not self.is_delta:
+            return self._full_text()
+        
+        cached = rebuilt_texts.get(self.pk)
+        if cached is not None:
+            return cached
+        
+        # Walk forward to the nearest full copy (or cached rebuild)
+        chain = [self]
+        newer_versions = (
+            ScriptVersion.objects
+            .filter(script_id=self.script_id, version_number__gt=self.version_number)
+            .order_by('version_number')
+            .select_related('content_blob')
+        )
+        text = None
+        for newer in newer_versions.iterator():
+            text = newer._full_text() if not newer.is_delta else rebuilt_texts.get(newer.pk)
+            if text is not None:
+                break
+            chain.append(newer)
+        
+        if text is None:
+            raise MissingFullText(f"No full-text version found to rebuild {self}")
+        
+        for version in reversed(chain):
+            text = apply_delta(text, version.delta)
+            rebuilt_texts.put(version.pk, text)
+        return text
+    
+    def encode_against(self, next_content):
+        """Replace the stored full text with a reverse delta from ``next_content``"""
+        content = self._full_text()
+        delta = make_delta(next_content, content)
+        if len(delta) >= len(content):
+            return False
+        
+        rebuilt_texts.put(self.pk, content)
+        ScriptVersion.objects.filter(pk=self.pk).update(
+            content='', content_blob=None, content_hash=text_hash(content), delta=delta, is_delta=True
+        )
+        self.content, self.content_blob, self.delta, self.is_delta = '', None, delta, True
+        return True
+    
+    def decode(self):
+        """Store the full text again in place of the delta, e.g. before the next version goes away"""
+        if not self.is_delta:
+            return False
+        
+        blob = TextBlob.objects.intern(self.get_content())
+        ScriptVersion.objects.filter(pk=self.pk).update(content_blob=blob, delta='', is_delta=False)
+        self.content_blob, self.delta, self.is_delta = blob, '', False
+        return True
 
 
 class Scene(models.Model):
@@ -89,7 +271,13 @@ class Scene(models.Model):
     goal = models.TextField(help_text="What the scene aims to accomplish")
     tension = models.TextField(help_text="Source of conflict or tension")
     tone = models.CharField(max_length=50, blank=True, help_text="Specific tone for this scene")
-    content = models.TextField()
+    content = models.TextField(blank=True, help_text="Legacy inline text, moved to content_blob on save")
+    content_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    
+    # Character offsets into the version text for scenes parsed from it
+    start_offset = models.PositiveIntegerField(null=True, blank=True)
+    end_offset = models.PositiveIntegerField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -99,6 +287,62 @@ class Scene(models.Model):
     
     def __str__(self):
         return f"Scene {self.scene_number}: {self.setting}"
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        # New text is always moved into the shared blob store
+        if self.content:
+            self.content_blob = TextBlob.objects.intern(self.content)
+            self.content = ''
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content', 'content_blob'}
+        elif update_fields is not None and 'content' in update_fields and 'content_blob' not in update_fields:
+            # Text explicitly cleared: '' is also how stored text looks, so only
+            # a save naming 'content' (and no new blob) drops the old text
+            self.content_blob = None
+            kwargs['update_fields'] = {*update_fields, 'content_blob'}
+        super().save(*args, **kwargs)
+    
+    def get_content(self):
+        if self.content_blob_id:
+            return self.content_blob.content
+        if not self.content and self.start_offset is not None:
+            return self.script_version.get_content()[self.start_offset:self.end_offset]
+        return self.content
+
+
+class SceneSummary(models.Model):
+    """
+    Short summary of a scene's text, addressed by the text's hash, so a scene
+    carried over unchanged into a new version keeps its summary.
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    summary = models.TextField()
+    model = models.CharField(max_length=100, blank=True, help_text="Model that wrote the summary")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]}: {self.summary[:60]}"
+
+
+class JobManager(models.Manager):
+    def create_idempotent(self, user, idempotency_key='', **fields):
+        """
+        Create a job, or return the one ``user`` already created with the same
+        ``idempotency_key``. Returns ``(job, created)``.
+        """
+        if not idempotency_key:
+            return self.create(user=user, **fields), True
+        
+        existing = self.filter(user=user, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+        try:
+            with transaction.atomic():
+                return self.create(user=user, idempotency_key=idempotency_key, **fields), True
+        except IntegrityError:
+            # A concurrent request with the same key won the insert
+            return self.get(user=user, idempotency_key=idempotency_key), False
 
 
 class Job(models.Model):
@@ -114,6 +358,18 @@ class Job(models.Model):
         ('script_generation', 'Script Generation'),
         ('scene_generation', 'Scene Generation'),
         ('script_refinement', 'Script Refinement'),
+        ('long_form_generation', 'Long-Form Script Generation'),
+        ('outline_generation', 'Outline Generation'),
+        ('segment_generation', 'Segment Generation'),
+        ('scene_batch_regeneration', 'Scene Batch Regeneration'),
+    ]
+    
+    ACTIVE_STATUSES = ('pending', 'running')
+    
+    # Batch jobs are submitted together as a Message Batch: cheaper, but may take hours
+    PRIORITY_CHOICES = [
+        ('interactive', 'Interactive'),
+        ('batch', 'Batch'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
@@ -121,14 +377,41 @@ class Job(models.Model):
     job_type = models.CharField(max_length=50, choices=JOB_TYPE_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     prompt = models.TextField()
+    script_type = models.CharField(max_length=20, default='screenplay')
+    priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='interactive')
+    batch_id = models.CharField(max_length=255, blank=True, db_index=True, help_text="Message Batch this job was submitted in")
+    idempotency_key = models.CharField(max_length=255, blank=True, help_text="Client-supplied Idempotency-Key header")
     
     # Related objects
     script = models.ForeignKey(Script, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
     scene = models.ForeignKey(Scene, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
     
+    # Multi-step jobs: children (outline, segments) point at their parent job
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    segment_index = models.PositiveSmallIntegerField(null=True, blank=True)
+    segments_total = models.PositiveSmallIntegerField(default=0)
+    segments_completed = models.PositiveSmallIntegerField(default=0)
+    
     # Results
-    result = models.TextField(blank=True)
+    result = models.TextField(blank=True, help_text="Legacy inline result, moved to result_blob by backfill_text_blobs")
+    result_blob = models.ForeignKey(TextBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    partial_result = models.TextField(blank=True, help_text="Streamed output so far, flushed periodically from the Redis buffer")
     error_message = models.TextField(blank=True)
+    served_from_cache = models.BooleanField(default=False, help_text="Completed from an identical earlier generation")
+    
+    # Usage reported by the API; cache_read_input_tokens were served from the prompt cache
+    input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    output_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cache_creation_input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    cache_read_input_tokens = models.PositiveIntegerField(null=True, blank=True)
+    time_to_first_token_ms = models.PositiveIntegerField(null=True, blank=True)
+    rate_limit_wait_ms = models.PositiveIntegerField(default=0, help_text="Time spent waiting for the cluster-wide rate limiter, over all attempts")
+    
+    # Latency breakdown, exported as histograms by metrics.py
+    model = models.CharField(max_length=100, blank=True, help_text="Model that answered the request")
+    queue_wait_ms = models.PositiveIntegerField(null=True, blank=True, help_text="From creation until a worker first started the job")
+    model_time_ms = models.PositiveIntegerField(null=True, blank=True, help_text="From sending the request until the complete response")
+    db_write_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Time spent storing the result")
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -137,9 +420,136 @@ class Job(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # JobViewSet: filter by user, newest first; also the cursor pagination key
+            models.Index(fields=['user', '-created_at', '-id'], name='job_user_created_idx'),
+            # Admin filters and the retention sweep
+            models.Index(fields=['status', 'job_type'], name='job_status_type_idx'),
+            models.Index(fields=['status', 'completed_at'], name='job_status_completed_idx'),
+            # Batch submission and polling
+            models.Index(fields=['priority', 'status'], name='job_priority_status_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                condition=~models.Q(idempotency_key=''),
+                name='job_user_idempotency_key_uniq',
+            ),
+        ]
+    
+    objects = JobManager()
     
     def __str__(self):
         return f"Job {self.job_id} - {self.status}"
+    
+    def get_result(self):
+        if self.result_blob_id:
+            return self.result_blob.content
+        return self.result
+    
+    def transition(self, status, from_statuses, **fields):
+        """
+        Set ``status`` and ``fields`` in one UPDATE of just those columns,
+        guarded by the current status. Returns False, changing nothing, if the
+        job is no longer in one of ``from_statuses`` (another run got there first).
+        """
+        if not Job.objects.filter(pk=self.pk, status__in=from_statuses).update(status=status, **fields):
+            return False
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+    
+    def start(self):
+        """
+        Mark the job running; False if it has already finished. A running job
+        may be started again by a task redelivered after its worker died.
+        """
+        now = timezone.now()
+        fields = {'started_at': now}
+        if self.queue_wait_ms is None:
+            fields['queue_wait_ms'] = round((now - self.created_at).total_seconds() * 1000)
+        return self.transition('running', self.ACTIVE_STATUSES, **fields)
+    
+    def finish(self, status, **fields):
+        """Complete or fail the job; False if it had already finished"""
+        return self.transition(status, self.ACTIVE_STATUSES, completed_at=timezone.now(), **fields)
+    
+    @staticmethod
+    def usage_fields(message):
+        """Job fields for the model and token usage of an API Message"""
+        usage = message.usage
+        return {
+            'model': message.model,
+            'input_tokens': usage.input_tokens,
+            'output_tokens': usage.output_tokens,
+            'cache_creation_input_tokens': usage.cache_creation_input_tokens or 0,
+            'cache_read_input_tokens': usage.cache_read_input_tokens or 0,
+        }
+    
+    def add_rate_limit_wait(self, waited_ms):
+        """Add limiter wait time to the job, on the instance and the stored row"""
+        Job.objects.filter(pk=self.pk).update(rate_limit_wait_ms=models.F('rate_limit_wait_ms') + waited_ms)
+        self.rate_limit_wait_ms += waited_ms
+
+
+class ArchivedJob(models.Model):
+    """Compact record of a finished job moved out of the Job table"""
+    job_id = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_jobs')
+    job_type = models.CharField(max_length=50, choices=Job.JOB_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Job.STATUS_CHOICES)
+    script_id = models.BigIntegerField(null=True, blank=True)
+    prompt_excerpt = models.CharField(max_length=500, blank=True)
+    result_hash = models.CharField(max_length=64, blank=True)
+    result_size = models.PositiveIntegerField(default=0)
+    error_message = models.CharField(max_length=1000, blank=True)
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archivedjob_user_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archived job {self.job_id} - {self.status}"
+
+
+class SearchEntry(models.Model):
+    """
+    Denormalized search document for one script, version, scene or character.
+    
+    The full-text index itself (a generated tsvector column with a GIN index
+    on PostgreSQL, an FTS5 table on SQLite) is created by migration 0007 and
+    kept in sync by the database; see search.py.
+    """
+    KIND_CHOICES = [
+        ('script', 'Script'),
+        ('version', 'Script Version'),
+        ('scene', 'Scene'),
+        ('character', 'Character'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    script = models.ForeignKey(Script, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=500)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['kind', 'object_id']
+        indexes = [
+            models.Index(fields=['user', 'kind'], name='searchentry_user_kind_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.object_id}: {self.title}"
 
 
 class ScriptProject(models.Model):
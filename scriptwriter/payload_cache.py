@@ -0,0 +1,123 @@
+"""
+Redis cache for serialized API payloads.
+
+Serialized scripts, versions, scenes and characters are cached per user,
+object and representation (``?fields=``/``?expand=``). Every object has a
+generation stamp; signal receivers replace the stamp when the object or
+anything nested in it changes, which orphans every cached representation at
+once (see signals.py). Hits and misses are counted per kind in Redis.
+"""
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from redis.exceptions import RedisError
+from rest_framework.response import Response
+
+from .fieldsets import parse_list_param
+from .redis_client import get_redis, key
+
+KINDS = ('script', 'version', 'scene', 'character')
+STATS_KEY = key('payload-cache', 'stats')
+
+
+def _generation_key(kind, pk):
+    return f'payload-gen:{kind}:{pk}'
+
+
+def _generation(kind, pk):
+    generation_key = _generation_key(kind, pk)
+    generation = cache.get(generation_key)
+    if generation is None:
+        # Unknown (never set or evicted): start a fresh generation so older payloads can't match
+        cache.add(generation_key, time.time_ns(), timeout=None)
+        generation = cache.get(generation_key)
+    return generation
+
+
+def _count(kind, outcome):
+    try:
+        get_redis().hincrby(STATS_KEY, f'{kind}:{outcome}', 1)
+    except RedisError:
+        pass
+
+
+def representation_variant(request):
+    """Cache-key part for the query parameters that change the payload"""
+    parts = []
+    for name in ('fields', 'expand'):
+        values = parse_list_param(request, name)
+        parts.append(','.join(sorted(values)) if values is not None else '*')
+    return '|'.join(parts)
+
+
+def get_or_build(kind, user_id, pk, variant, build):
+    """Return the cached payload, or ``build()`` it and store it"""
+    try:
+        payload_key = f'payload:{kind}:{user_id}:{pk}:{_generation(kind, pk)}:{variant}'
+        data = cache.get(payload_key)
+    except RedisError:
+        return build()
+
+    if data is not None:
+        _count(kind, 'hits')
+        return data
+
+    _count(kind, 'misses')
+    data = build()
+    try:
+        cache.set(payload_key, data, timeout=settings.API_PAYLOAD_CACHE_TIMEOUT)
+    except RedisError:
+        pass
+    return data
+
+
+def invalidate(kind, *pks):
+    for pk in pks:
+        try:
+            cache.set(_generation_key(kind, pk), time.time_ns(), timeout=None)
+        except RedisError:
+            pass
+
+
+def invalidate_on_commit(kind, *pks):
+    """invalidate() once the current transaction commits (right away outside one)"""
+    # After commit: a reader between the invalidation and the commit would
+    # cache the old rows under the new generation stamp
+    transaction.on_commit(partial(invalidate, kind, *pks))
+
+
+def stats():
+    """Hit and miss counters per kind"""
+    try:
+        raw = get_redis().hgetall(STATS_KEY)
+    except RedisError:
+        raw = {}
+    counters = {field.decode(): int(value) for field, value in raw.items()}
+
+    result = {}
+    for kind in KINDS:
+        hits = counters.get(f'{kind}:hits', 0)
+        misses = counters.get(f'{kind}:misses', 0)
+        total = hits + misses
+        result[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }
+    return result
+
+
+class CachedRetrieveMixin:
+    """ViewSet mixin that serves ``retrieve`` from the payload cache"""
+    cache_kind = None
+    
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        data = get_or_build(
+            self.cache_kind, request.user.pk, pk, representation_variant(request),
+            lambda: self.get_serializer(self.get_object()).data,
+        )
+        return Response(data)
@@ -0,0 +1,144 @@
+"""
+System prompts for script generation.
+
+Prompts are sent as two system blocks so Anthropic prompt caching can reuse
+them across requests:
+
+1. The static instructions for a ``script_type``. They never change, so
+   they come first, are rendered once per process and end in a cache
+   breakpoint.
+2. The per-script context (genre, tone, characters), which repeats across
+   generations for the same script and ends in a second breakpoint.
+
+The provider only caches prefixes above a model-specific minimum length;
+shorter prompts are simply billed as regular input.
+"""
+from functools import lru_cache
+
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+BASE_PROMPT = """You are an expert screenwriter and script consultant with deep knowledge of storytelling, 
+    character development, and screenplay formatting. You understand the principles of dramatic structure, 
+    including the three-act structure, character arcs, and compelling dialogue."""
+
+FORMAT_INSTRUCTIONS = {
+    'screenplay': """SCREENPLAY FORMAT RULES:
+1. Use proper screenplay formatting with scene headings, action lines, character names, and dialogue
+2. Scene headings: INT./EXT. LOCATION - TIME OF DAY (e.g., INT. COFFEE SHOP - DAY)
+3. Action lines: Present tense, active voice, describing what we see and hear
+4. Character names: ALL CAPS when they first appear and above dialogue
+5. Dialogue: Character name centered, dialogue below
+6. Parentheticals: Brief direction for how a line should be delivered
+7. Transitions: FADE IN:, CUT TO:, FADE OUT: (use sparingly)
+
+STORYTELLING PRINCIPLES:
+- Strong opening hook that establishes the world and protagonist
+- Clear character motivations and goals
+- Rising tension and conflict
+- Well-paced scenes with purpose
+- Subtext in dialogue - show don't tell
+- Visual storytelling over exposition
+- Satisfying character arcs
+- Three-act structure: Setup, Confrontation, Resolution
+
+Generate professional, properly formatted screenplay content. Focus on vivid visual storytelling, 
+authentic dialogue, and compelling character development.""",
+    'treatment': """TREATMENT FORMAT:
+- Write in present tense, third person
+- Describe the story chronologically from beginning to end
+- Include major plot points, character arcs, and turning points
+- Paint a vivid picture of the story world
+- Convey the tone and style of the piece
+- No dialogue, just narrative description
+- 3-5 pages for a short treatment, 10-30 for a full treatment
+
+Focus on compelling story structure and emotional journey.""",
+    'scene': """SCENE GENERATION:
+- Write a complete, well-structured scene
+- Include proper scene heading
+- Clear visual action and character behavior
+- Authentic dialogue with subtext
+- Scene should have a clear beginning, middle, and end
+- Advance the plot or develop character
+- Maintain consistent tone and pacing""",
+    'outline': """OUTLINE FORMAT:
+- Organized by acts and sequences
+- Clear beat sheet of major story moments
+- Character introductions and arc progressions
+- Key plot points and turning points
+- Theme development
+- Conflict escalation
+
+Structure:
+ACT ONE: Setup
+- Opening Image
+- Inciting Incident
+- First Plot Point
+
+ACT TWO: Confrontation
+- Rising Action
+- Midpoint
+- Complications
+- Crisis
+
+ACT THREE: Resolution
+- Climax
+- Falling Action
+- Resolution
+- Closing Image
+
+Provide a comprehensive story outline with dramatic beats.""",
+}
+
+
+def _known_script_type(script_type):
+    """``script_type`` if it has format instructions, else the outline format"""
+    return script_type if script_type in FORMAT_INSTRUCTIONS else 'outline'
+
+
+def static_system_prompt(script_type):
+    """Instructions shared by every request of ``script_type``; unknown types get the outline format"""
+    return _static_prompt(_known_script_type(script_type))
+
+
+# Keyed on known types only, so arbitrary client values cannot grow the caches
+@lru_cache(maxsize=None)
+def _static_prompt(script_type):
+    return f"{BASE_PROMPT}\n\n{FORMAT_INSTRUCTIONS[script_type]}"
+
+
+@lru_cache(maxsize=None)
+def _static_block(script_type):
+    return {'type': 'text', 'text': _static_prompt(script_type), 'cache_control': CACHE_CONTROL}
+
+
+def script_context(genre='', tone='', characters=None):
+    """Genre, tone and character notes for one script"""
+    context = ''
+    if genre:
+        context += f"This is a {genre} script."
+    if tone:
+        context += f" The tone should be {tone}."
+    
+    if characters:
+        context += "\n\nCHARACTERS IN THIS SCRIPT:\n"
+        for char in characters:
+            context += f"\n{char.name}:"
+            if char.personality:
+                context += f"\n  Personality: {char.personality}"
+            if char.goals:
+                context += f"\n  Goals: {char.goals}"
+            if char.voice:
+                context += f"\n  Voice: {char.voice}"
+            if char.backstory:
+                context += f"\n  Backstory: {char.backstory}"
+    return context.strip()
+
+
+def get_script_writing_system_prompt(script_type='screenplay', genre='', tone='', characters=None):
+    """Get the system prompt blocks for script writing based on type"""
+    blocks = [_static_block(_known_script_type(script_type))]
+    context = script_context(genre, tone, characters)
+    if context:
+        blocks.append({'type': 'text', 'text': context, 'cache_control': CACHE_CONTROL})
+    return blocks
@@ -0,0 +1,172 @@
+"""
+Cluster-wide rate limiting of Anthropic API calls.
+
+Every worker takes from the same two token buckets in Redis before it sends
+a request: one for requests per minute and one for tokens per minute. Each
+bucket holds one minute's allowance and refills continuously, so bursts up
+to the limit go straight through and sustained load is paced at the account
+limit instead of running into 429s.
+
+A request reserves its estimated input tokens plus ``max_tokens``; ``settle``
+hands back what it did not use once the real usage is known. If Redis is
+unavailable, requests are not throttled.
+"""
+import asyncio
+import json
+import random
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis, key
+
+# Rough size of a token in characters, for estimating input tokens before a request
+CHARS_PER_TOKEN = 4
+
+# KEYS: request bucket, token bucket. ARGV: rpm, request cost, tpm, token cost.
+# Takes both costs only if both buckets can cover them; otherwise takes
+# nothing and returns the seconds until they could. A limit of 0 is off.
+TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local wait = 0
+local buckets = {}
+for i = 1, 2 do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local cost = tonumber(ARGV[i * 2])
+    if capacity > 0 then
+        local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+        local level = tonumber(state[1]) or capacity
+        local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+        level = math.min(capacity, level + elapsed * capacity / 60)
+        -- A request larger than the whole bucket waits for a full bucket
+        cost = math.min(cost, capacity)
+        if level < cost then
+            wait = math.max(wait, (cost - level) * 60 / capacity)
+        end
+        buckets[i] = {level, cost, capacity}
+    end
+end
+for i = 1, 2 do
+    if buckets[i] then
+        local level = buckets[i][1]
+        if wait == 0 then
+            -- Refunds (negative costs) never overfill the bucket
+            level = math.min(buckets[i][3], level - buckets[i][2])
+        end
+        redis.call('HSET', KEYS[i], 'level', level, 'ts', now)
+        redis.call('EXPIRE', KEYS[i], 120)
+    end
+end
+return tostring(wait)
+"""
+
+
+class RateLimitTimeout(Exception):
+    """The limiter could not admit a request within ANTHROPIC_RATE_LIMIT_MAX_WAIT"""
+
+
+@lru_cache(maxsize=1)
+def _take_script():
+    return get_redis().register_script(TAKE_SCRIPT)
+
+
+def _take_arguments(requests, tokens):
+    return {
+        'keys': [key('rate-limit', 'requests'), key('rate-limit', 'tokens')],
+        'args': [settings.ANTHROPIC_RATE_LIMIT_RPM, requests, settings.ANTHROPIC_RATE_LIMIT_TPM, tokens],
+    }
+
+
+def _take(requests, tokens):
+    return float(_take_script()(**_take_arguments(requests, tokens)))
+
+
+async def _atake(redis, requests, tokens):
+    return float(await redis.register_script(TAKE_SCRIPT)(**_take_arguments(requests, tokens)))
+
+
+def _limits_off():
+    return not settings.ANTHROPIC_RATE_LIMIT_RPM and not settings.ANTHROPIC_RATE_LIMIT_TPM
+
+
+def _unused(reserved_tokens, usage):
+    used = usage.input_tokens + usage.output_tokens + (usage.cache_creation_input_tokens or 0)
+    return max(reserved_tokens - used, 0)
+
+
+def estimate_tokens(params):
+    """Upper estimate of the tokens a request counts against the per-minute limit"""
+    prompt = json.dumps([params.get('system'), params['messages']])
+    return len(prompt) // CHARS_PER_TOKEN + params['max_tokens']
+
+
+def acquire(params):
+    """
+    Block until the request described by ``params`` is within the limits.
+
+    Returns ``(reserved_tokens, seconds_waited)``. Raises RateLimitTimeout
+    rather than wait longer than ANTHROPIC_RATE_LIMIT_MAX_WAIT in total.
+    """
+    if _limits_off():
+        return 0, 0.0
+    cost = estimate_tokens(params)
+    waited = 0.0
+    while True:
+        try:
+            wait = _take(1, cost)
+        except RedisError:
+            return 0, waited
+        if wait <= 0:
+            return cost, waited
+        wait = _next_wait(waited, wait)
+        time.sleep(wait)
+        waited += wait
+
+
+async def aacquire(redis, params):
+    """acquire() for async code, on an asyncio Redis client"""
+    if _limits_off():
+        return 0, 0.0
+    cost = estimate_tokens(params)
+    waited = 0.0
+    while True:
+        try:
+            wait = await _atake(redis, 1, cost)
+        except RedisError:
+            return 0, waited
+        if wait <= 0:
+            return cost, waited
+        wait = _next_wait(waited, wait)
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+def _next_wait(waited, wait):
+    if waited + wait > settings.ANTHROPIC_RATE_LIMIT_MAX_WAIT:
+        raise RateLimitTimeout(f"Rate limiter wait exceeded {settings.ANTHROPIC_RATE_LIMIT_MAX_WAIT}s")
+    # Jitter, so workers blocked on the same bucket don't all retry at once
+    return wait * (1 + random.random() * 0.1)
+
+
+def settle(reserved_tokens, usage):
+    """Return the unused part of a reservation to the token bucket"""
+    unused = _unused(reserved_tokens, usage)
+    if not unused:
+        return
+    try:
+        _take(0, -unused)
+    except RedisError:
+        pass
+
+
+async def asettle(redis, reserved_tokens, usage):
+    unused = _unused(reserved_tokens, usage)
+    if not unused:
+        return
+    try:
+        await _atake(redis, 0, -unused)
+    except RedisError:
+        pass
@@ -0,0 +1,20 @@
+"""
+Shared raw Redis connection for features that need more than the Django
+cache API (counters, buffers, pub/sub, Lua scripts).
+"""
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+KEY_PREFIX = 'spielberg:'
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    # redis-py connection pools detect forks and reconnect in the child
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+def key(*parts):
+    return KEY_PREFIX + ':'.join(str(part) for part in parts)
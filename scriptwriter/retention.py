@@ -0,0 +1,115 @@
+"""
+Retention policy for finished jobs.
+
+Completed and failed jobs older than ``JOB_RETENTION_DAYS`` are copied into
+the compact ArchivedJob table and removed from Job in bounded batches, so the
+hot table only holds recent work. Text blobs left without any reference are
+pruned afterwards.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedJob, Job, TextBlob
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+def archive_finished_jobs(retention_days=None, batch_size=None, max_batches=None):
+    """
+    Archive finished jobs past the retention window; returns the number moved.
+
+    Only top-level jobs are selected. Child jobs (outline, segments, scene
+    batches) go with their parent in the same batch, since deleting the parent
+    cascades to them; a parent with a child still in flight is left for a
+    later sweep.
+    """
+    retention_days = retention_days or settings.JOB_RETENTION_DAYS
+    batch_size = batch_size or settings.JOB_ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.JOB_ARCHIVE_MAX_BATCHES
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    candidates = Job.objects.filter(
+        status__in=FINISHED_STATUSES, completed_at__lt=cutoff, parent__isnull=True,
+    ).exclude(
+        children__status__in=Job.ACTIVE_STATUSES,
+    )
+    archived = 0
+
+    for _ in range(max_batches):
+        with transaction.atomic():
+            parents = _locked_jobs(candidates.order_by('completed_at')[:batch_size])
+            if not parents:
+                break
+
+            jobs = parents + _descendants(parents)
+            ArchivedJob.objects.bulk_create([_archived(job) for job in jobs], ignore_conflicts=True)
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+
+        archived += len(jobs)
+        if len(parents) < batch_size:
+            break
+
+    return archived
+
+
+def _locked_jobs(queryset, skip_locked=True):
+    return list(
+        queryset
+        .select_related('result_blob')
+        .defer('result_blob__content')
+        .select_for_update(skip_locked=skip_locked, of=('self',))
+    )
+
+
+def _descendants(jobs):
+    """All child jobs below ``jobs``, locked for the archiving transaction"""
+    descendants = []
+    level = jobs
+    while level:
+        # Wait rather than skip: a skipped child would be deleted unarchived
+        children = Job.objects.filter(parent__in=[job.pk for job in level]).order_by('pk')
+        level = _locked_jobs(children, skip_locked=False)
+        descendants.extend(level)
+    return descendants
+
+
+def _archived(job):
+    return ArchivedJob(
+        job_id=job.job_id,
+        user_id=job.user_id,
+        job_type=job.job_type,
+        status=job.status,
+        script_id=job.script_id,
+        prompt_excerpt=job.prompt[:500],
+        result_hash=job.result_blob_id or '',
+        result_size=job.result_blob.size if job.result_blob_id else len(job.result),
+        error_message=job.error_message[:1000],
+        created_at=job.created_at,
+        started_at=job.started_at,
+        completed_at=job.completed_at,
+    )
+
+
+def prune_text_blobs(grace_hours=24, batch_size=None):
+    """Delete blobs nothing references, skipping recently created ones"""
+    batch_size = batch_size or settings.JOB_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    pruned = 0
+
+    while True:
+        hashes = list(
+            TextBlob.objects.unreferenced()
+            .filter(created_at__lt=cutoff)
+            .values_list('hash', flat=True)[:batch_size]
+        )
+        if not hashes:
+            break
+        # Re-check references at delete time in case a blob was reused meanwhile
+        pruned += TextBlob.objects.unreferenced().filter(hash__in=hashes).delete()[0]
+        if len(hashes) < batch_size:
+            break
+
+    return pruned
@@ -0,0 +1,175 @@
+"""
+Cached scene summaries for bounded scene-generation context.
+
+A scene rewrite needs to know what happens around it, but sending the whole
+version grows with the script. Instead every scene gets a short summary,
+stored as a SceneSummary addressed by the hash of the scene's text: a scene
+carried over unchanged into a new version keeps its summary, and only
+scenes whose text changed are summarized again.
+
+``summarize_version`` fills in the missing summaries of a version (run by
+``summarize_scenes_task`` whenever scenes are created or rewritten).
+``neighbour_context`` picks the summaries of the nearest scenes, closest
+first, until SCENE_CONTEXT_TOKEN_BUDGET is used up, so the context of a
+scene rewrite stays the same size however long the script gets. Scenes not
+summarized yet fall back to their heading and opening lines.
+"""
+import logging
+import re
+
+from anthropic import APIError
+from django.conf import settings
+
+from . import rate_limit
+from .anthropic_clients import get_client
+from .models import SceneSummary, text_hash
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize each of these screenplay scenes in at most two sentences for a writer's continuity "
+    "notes: who is in it, what happens, and how it ends. Reply with one line per scene, in the form "
+    "'<number>: <summary>', and nothing else."
+)
+
+# Scenes summarized per request, so a new script costs a few requests rather than one per scene
+SUMMARY_BATCH_SIZE = 20
+
+# Longest scene text sent to be summarized; anything after it is left out
+SUMMARY_INPUT_CHARS = 6000
+
+# '<number>: <summary>', also as '**Scene 3.** ...', '3) ...' and the like
+SUMMARY_LINE = re.compile(r'^\W*(?:scene\s*)?(\d+)\W*?[:.)-][\s*_]*(.+)$', re.IGNORECASE)
+
+# Length of the fallback summary of a scene that has not been summarized yet
+FALLBACK_CHARS = 300
+
+
+def scene_text(scene, version_text):
+    """Text of ``scene``, slicing ``version_text`` for scenes that point into it"""
+    if scene.content_blob_id:
+        return scene.content_blob.content
+    if not scene.content and scene.start_offset is not None:
+        return version_text[scene.start_offset:scene.end_offset]
+    return scene.content
+
+
+def scene_hash(scene, version_text):
+    """Hash of the scene's text, which addresses its summary"""
+    if scene.content_blob_id:
+        # Blobs are addressed by the same hash
+        return scene.content_blob_id
+    return text_hash(scene_text(scene, version_text))
+
+
+def summarize_texts(texts):
+    """
+    Ask the model for summaries of several scene texts in one request.
+
+    Returns ``(summaries, model)``, with None for any scene the reply skipped.
+    """
+    scenes = '\n\n'.join(f"### Scene {number}\n{text[:SUMMARY_INPUT_CHARS]}" for number, text in enumerate(texts, 1))
+    params = {
+        'model': settings.SCENE_SUMMARY_MODEL,
+        'max_tokens': settings.SCENE_SUMMARY_MAX_TOKENS * len(texts),
+        'messages': [{'role': 'user', 'content': f"{SUMMARY_INSTRUCTIONS}\n\n{scenes}"}],
+    }
+    reserved_tokens, _ = rate_limit.acquire(params)
+    message = get_client().messages.create(**params)
+    rate_limit.settle(reserved_tokens, message.usage)
+
+    summaries = [None] * len(texts)
+    for line in message.content[0].text.splitlines():
+        match = SUMMARY_LINE.match(line.strip())
+        if match and 1 <= int(match.group(1)) <= len(texts):
+            summaries[int(match.group(1)) - 1] = match.group(2).strip()
+    return summaries, message.model
+
+
+def summarize_version(version):
+    """Summarize the version's scenes that have no summary yet; returns how many were written"""
+    scenes = list(version.scenes.select_related('content_blob').order_by('scene_number'))
+    if not scenes:
+        return 0
+    version_text = version.get_content()
+    texts = {}
+    for scene in scenes:
+        text = scene_text(scene, version_text)
+        if text.strip():
+            texts[scene_hash(scene, version_text)] = text
+    existing = set(SceneSummary.objects.filter(content_hash__in=texts).values_list('content_hash', flat=True))
+
+    missing = [(content_hash, text) for content_hash, text in texts.items() if content_hash not in existing]
+    written = 0
+    for start in range(0, len(missing), SUMMARY_BATCH_SIZE):
+        batch = missing[start:start + SUMMARY_BATCH_SIZE]
+        try:
+            summaries, model = summarize_texts([text for _, text in batch])
+        except (APIError, rate_limit.RateLimitTimeout) as e:
+            # Left to the fallback until the next run
+            logger.warning("Could not summarize %d scenes of version %s: %s", len(batch), version.pk, e)
+            continue
+        rows = [
+            SceneSummary(content_hash=content_hash, summary=summary, model=model)
+            for (content_hash, _), summary in zip(batch, summaries)
+            if summary
+        ]
+        SceneSummary.objects.bulk_create(rows, ignore_conflicts=True)
+        written += len(rows)
+    return written
+
+
+def fallback_summary(scene, text):
+    """The scene's setting and opening lines, for scenes without a summary"""
+    lines = [line.strip(' \t*_#>') for line in text.splitlines()]
+    # The first line is the heading, already given as the setting
+    body = ' '.join(line for line in lines[1:] if line)
+    summary = ' '.join(part for part in (scene.goal, body) if part)
+    if len(summary) > FALLBACK_CHARS:
+        summary = summary[:FALLBACK_CHARS].rsplit(' ', 1)[0] + '...'
+    return summary
+
+
+def neighbour_context(scene):
+    """
+    Summaries of the scenes around ``scene``, nearest first, within
+    SCENE_CONTEXT_TOKEN_BUDGET. Returns ``(lines, missing)``: the context
+    lines in scene order and whether any fell back for lack of a summary.
+    """
+    budget = settings.SCENE_CONTEXT_TOKEN_BUDGET * rate_limit.CHARS_PER_TOKEN
+    reach = settings.SCENE_CONTEXT_MAX_NEIGHBOURS
+    if budget <= 0 or reach <= 0:
+        return [], False
+
+    neighbours = list(
+        scene.script_version.scenes
+        .filter(scene_number__gte=scene.scene_number - reach, scene_number__lte=scene.scene_number + reach)
+        .exclude(pk=scene.pk)
+        .select_related('content_blob')
+    )
+    if not neighbours:
+        return [], False
+    version_text = ''
+    if any(not neighbour.content_blob_id and not neighbour.content for neighbour in neighbours):
+        version_text = scene.script_version.get_content()
+    hashes = {neighbour.pk: scene_hash(neighbour, version_text) for neighbour in neighbours}
+    summaries = dict(
+        SceneSummary.objects.filter(content_hash__in=hashes.values()).values_list('content_hash', 'summary')
+    )
+
+    # Nearest first; at equal distance the earlier scene
+    neighbours.sort(key=lambda neighbour: (abs(neighbour.scene_number - scene.scene_number), neighbour.scene_number))
+    chosen = []
+    used = 0
+    missing = False
+    for neighbour in neighbours:
+        summary = summaries.get(hashes[neighbour.pk])
+        if summary is None:
+            missing = True
+            summary = fallback_summary(neighbour, scene_text(neighbour, version_text))
+        line = f"Scene {neighbour.scene_number} ({neighbour.setting}): {summary}"
+        if used + len(line) > budget:
+            break
+        chosen.append((neighbour.scene_number, line))
+        used += len(line) + 1
+    return [line for _, line in sorted(chosen)], missing
@@ -0,0 +1,243 @@
+"""
+Fair-share dispatch of generation jobs to celery.
+
+Jobs are not sent to celery as soon as they are created. Each lane (one
+celery queue per kind of job: quick scene rewrites, scripts, long-form)
+keeps a Redis list of waiting jobs per user, and ``dispatch`` moves jobs
+from those lists into celery:
+
+- a user has at most SCHEDULER_MAX_IN_FLIGHT_PER_USER jobs sent per lane;
+- users with waiting jobs take turns, so one user's hundred queued scripts
+  do not hold up everyone else's.
+
+A job's slot is released when its task finishes (``task_postrun``, not on
+retries), after which the lane is dispatched again. The ``dispatch_jobs``
+beat task releases slots of jobs that finished without a signal (a worker
+was killed) and dispatches every lane. The child jobs a long-form job or a
+scene batch fans out are submitted here too, each holding a slot in its
+parent's lane, so fanning out does not get around the cap.
+
+Lanes listed in ASYNC_GENERATION_LANES send their script and scene jobs to
+the asyncio worker (async_worker.py) instead of celery; it releases their
+slots itself. If Redis is unavailable jobs are sent to celery directly.
+"""
+import json
+from functools import lru_cache
+
+import redis
+from celery import current_app
+from celery.signals import task_postrun
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .redis_client import get_redis, key
+
+# Fair-share lanes, each also the celery queue its first task is routed to (CELERY_TASK_ROUTES)
+LANES = {
+    'scene_generation': 'scenes',
+    'script_generation': 'scripts',
+    'script_refinement': 'scripts',
+    'long_form_generation': 'long-form',
+    'segment_generation': 'long-form',
+}
+
+# Tasks whose first argument is the job_id of a scheduled job
+SCHEDULED_TASKS = {
+    'scriptwriter.tasks.generate_scene_task',
+    'scriptwriter.tasks.generate_script_task',
+    'scriptwriter.tasks.generate_long_form_task',
+    'scriptwriter.tasks.generate_segment_task',
+    'scriptwriter.tasks.generate_batch_scene_task',
+}
+
+# Tasks the async worker can run instead, for lanes in ASYNC_GENERATION_LANES
+ASYNC_TASKS = {
+    'scriptwriter.tasks.generate_scene_task',
+    'scriptwriter.tasks.generate_script_task',
+}
+
+# KEYS: users waiting in the lane (sorted set, lowest score served first), job ids
+# in flight in the lane, job id -> owner hash. ARGV: key prefix of the lane, cap, lane.
+# Pops the next entry of the first waiting user under the cap and moves that
+# user to the back of the turn order.
+TAKE_NEXT_SCRIPT = """
+local users = redis.call('ZRANGE', KEYS[1], 0, -1)
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+for _, user in ipairs(users) do
+    local in_flight = ARGV[1] .. 'in-flight:' .. user
+    if redis.call('SCARD', in_flight) < tonumber(ARGV[2]) then
+        local queue = ARGV[1] .. 'waiting:' .. user
+        local entry = redis.call('LPOP', queue)
+        if entry then
+            local job_id = string.match(entry, '^(%S+)')
+            redis.call('SADD', in_flight, job_id)
+            redis.call('SADD', KEYS[2], job_id)
+            redis.call('HSET', KEYS[3], job_id, ARGV[3] .. ' ' .. user)
+            if redis.call('LLEN', queue) == 0 then
+                redis.call('ZREM', KEYS[1], user)
+            else
+                redis.call('ZADD', KEYS[1], now, user)
+            end
+            return entry
+        end
+        redis.call('ZREM', KEYS[1], user)
+    end
+end
+return false
+"""
+
+
+def _lane_prefix(lane):
+    return key('scheduler', lane, '')
+
+
+def _users_key(lane):
+    return key('scheduler', lane, 'users')
+
+
+def _in_flight_key(lane):
+    return key('scheduler', lane, 'in-flight')
+
+
+def _owners_key():
+    return key('scheduler', 'owners')
+
+
+@lru_cache(maxsize=1)
+def _take_next_script():
+    return get_redis().register_script(TAKE_NEXT_SCRIPT)
+
+
+@lru_cache(maxsize=None)
+def _broker_redis():
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+
+def _send(lane, payload):
+    if lane in settings.ASYNC_GENERATION_LANES and payload['task'] in ASYNC_TASKS:
+        # Consumed by the async worker (async_worker.py) instead of a celery worker
+        get_redis().rpush(key('async-jobs'), json.dumps(payload))
+        return
+    current_app.signature(payload['task'], args=payload['args']).apply_async()
+
+
+def submit(job, task, *args):
+    """Queue ``task(*args)`` for ``job`` behind the user's other jobs in its lane"""
+    lane = LANES[job.job_type]
+    payload = {'task': task.name, 'args': list(args)}
+    try:
+        pipe = get_redis().pipeline()
+        pipe.rpush(_lane_prefix(lane) + f'waiting:{job.user_id}', f'{job.job_id} {json.dumps(payload)}')
+        # A user who was not waiting goes ahead of users who have already been served
+        pipe.zadd(_users_key(lane), {job.user_id: 0}, nx=True)
+        pipe.execute()
+    except RedisError:
+        current_app.signature(payload['task'], args=payload['args']).apply_async()
+        return
+    dispatch(lane)
+
+
+def dispatch(lane):
+    """Send waiting jobs of ``lane`` to celery while their users are under the cap; return how many"""
+    sent = 0
+    while True:
+        try:
+            entry = _take_next_script()(
+                keys=[_users_key(lane), _in_flight_key(lane), _owners_key()],
+                args=[_lane_prefix(lane), settings.SCHEDULER_MAX_IN_FLIGHT_PER_USER, lane],
+            )
+        except RedisError:
+            return sent
+        if entry is None:
+            return sent
+        job_id, payload = entry.decode('utf-8').split(' ', 1)
+        try:
+            _send(lane, json.loads(payload))
+        except Exception:
+            _requeue(job_id, entry)
+            raise
+        sent += 1
+
+
+def _requeue(job_id, entry):
+    """Give back the slot of a job that could not be sent and put it first in its user's queue"""
+    try:
+        redis_client = get_redis()
+        lane, user_id = redis_client.hget(_owners_key(), job_id).decode('utf-8').split(' ')
+        release(job_id, redispatch=False)
+        pipe = redis_client.pipeline()
+        pipe.lpush(_lane_prefix(lane) + f'waiting:{user_id}', entry)
+        pipe.zadd(_users_key(lane), {user_id: 0}, nx=True)
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+def release(job_id, redispatch=True):
+    """Free the slot held by ``job_id``, if any, and let the next job of its lane go"""
+    try:
+        redis_client = get_redis()
+        owner = redis_client.hget(_owners_key(), job_id)
+        if owner is None:
+            return
+        lane, user_id = owner.decode('utf-8').split(' ')
+        pipe = redis_client.pipeline()
+        pipe.srem(_lane_prefix(lane) + f'in-flight:{user_id}', job_id)
+        pipe.srem(_in_flight_key(lane), job_id)
+        pipe.hdel(_owners_key(), job_id)
+        pipe.execute()
+    except RedisError:
+        return
+    if redispatch:
+        dispatch(lane)
+
+
+def in_flight(lane):
+    """Job ids currently holding a slot in ``lane``"""
+    try:
+        return [job_id.decode('utf-8') for job_id in get_redis().smembers(_in_flight_key(lane))]
+    except RedisError:
+        return []
+
+
+def lane_stats():
+    """Per lane: users and jobs waiting for a slot, jobs in flight and messages in the celery queue"""
+    stats = {}
+    redis_client = get_redis()
+    for lane in sorted(set(LANES.values())):
+        users = [user.decode('utf-8') for user in redis_client.zrange(_users_key(lane), 0, -1)]
+        pipe = redis_client.pipeline(transaction=False)
+        for user in users:
+            pipe.llen(_lane_prefix(lane) + f'waiting:{user}')
+        pipe.scard(_in_flight_key(lane))
+        *waiting, running = pipe.execute()
+        stats[lane] = {
+            'users_waiting': len(users),
+            'waiting': sum(waiting),
+            'in_flight': running,
+        }
+    for lane, depth in queue_depths().items():
+        stats.setdefault(lane, {})['queued'] = depth
+    if settings.ASYNC_GENERATION_LANES:
+        stats['async'] = {'queued': redis_client.llen(key('async-jobs'))}
+    return stats
+
+
+def queue_depths():
+    """Messages waiting in each routed celery queue, when the broker is Redis"""
+    if not settings.CELERY_BROKER_URL.startswith('redis'):
+        return {}
+    queues = {route['queue'] for route in settings.CELERY_TASK_ROUTES.values()}
+    queues.add(settings.CELERY_TASK_DEFAULT_QUEUE)
+    pipe = _broker_redis().pipeline(transaction=False)
+    for queue in sorted(queues):
+        pipe.llen(queue)
+    return dict(zip(sorted(queues), pipe.execute()))
+
+
+@task_postrun.connect
+def _release_after_task(sender=None, args=None, state=None, **kwargs):
+    if sender is None or sender.name not in SCHEDULED_TASKS or state == 'RETRY' or not args:
+        return
+    release(args[0])
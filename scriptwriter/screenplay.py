@@ -0,0 +1,164 @@
+"""
+Screenplay parsing helpers.
+
+Generated screenplays arrive as one block of (often markdown-decorated)
+text. ``parse_scenes`` finds the INT./EXT. scene headings in a single regex
+pass and returns character offsets, so Scene rows can point into the
+version text instead of copying it. ``replace_scenes`` goes the other way
+and splices rewritten scenes back into a new version.
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Scene, Script, ScriptVersion, TextBlob
+from .payload_cache import invalidate_on_commit
+from .search import index_instance, is_current
+
+# A scene heading on its own line, e.g. "INT. COFFEE SHOP - DAY",
+# "**EXT. ROOFTOP - NIGHT**", "### 12 INT./EXT. CAR - MOVING", "EXT.CAR - NIGHT"
+SCENE_HEADING = re.compile(
+    r'^[ \t>#*_]*'                                  # markdown decoration
+    r'(?:\d+[A-Z]?[.)]?[ \t]+)?'                    # optional scene number
+    r'((?:INT\.?/EXT|EXT\.?/INT|I/E|INT|EXT|EST)'   # heading prefix
+    r'(?:\.[ \t]*|:?[ \t]+)[^\n]*?)'                # location and time
+    r'[ \t*_#]*$',
+    re.MULTILINE,
+)
+
+
+@dataclass
+class ParsedScene:
+    number: int
+    heading: str
+    start: int
+    end: int
+
+
+def parse_scenes(text):
+    """Return the scenes in ``text``; anything before the first heading is skipped"""
+    matches = list(SCENE_HEADING.finditer(text))
+    scenes = []
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        scenes.append(ParsedScene(
+            number=index + 1,
+            heading=match.group(1).strip(),
+            start=match.start(),
+            end=end,
+        ))
+    return scenes
+
+
+def touch_script(script_id):
+    # Script.updated_at is the script's ETag validator (see signals.py)
+    Script.objects.filter(pk=script_id).update(updated_at=timezone.now())
+
+
+def create_scenes(version, text=None):
+    """
+    Bulk-create Scene rows for every heading in a version's text.
+
+    Scenes store offsets into the version rather than their own copy of the
+    text. Versions that already have scenes are left alone.
+    """
+    if text is None:
+        text = version.get_content()
+    parsed = parse_scenes(text)
+    if not parsed or version.scenes.exists():
+        return []
+
+    with transaction.atomic():
+        scenes = Scene.objects.bulk_create([
+            Scene(
+                script_version=version,
+                scene_number=scene.number,
+                setting=scene.heading[:500],
+                start_offset=scene.start,
+                end_offset=scene.end,
+            )
+            for scene in parsed
+        ])
+
+        # bulk_create skips post_save, so touch, index and invalidate explicitly
+        touch_script(version.script_id)
+        current = is_current(version)
+        for scene in scenes:
+            scene.script_version = version
+            index_instance(scene, current)
+        invalidate_on_commit('version', version.pk)
+        invalidate_on_commit('script', version.script_id)
+    return scenes
+
+
+def replace_scenes(version, replacements, notes=''):
+    """
+    Append a new version of the script with the scenes in ``replacements``
+    (scene id -> new text) rewritten and every other scene carried over.
+
+    Scenes that point into the version text are spliced into the new text,
+    together with any earlier in-place rewrite of them, and keep pointing
+    into it. Scenes with only their own content keep that content.
+    Everything happens in one transaction.
+    """
+    text = version.get_content()
+    scenes = list(version.scenes.select_related('content_blob').order_by('scene_number'))
+    placed = sorted(
+        (scene for scene in scenes if scene.start_offset is not None and scene.end_offset is not None),
+        key=lambda scene: scene.start_offset,
+    )
+
+    pieces = []
+    length = 0
+    cursor = 0
+    new_offsets = {}
+    for scene in placed:
+        if scene.start_offset < cursor:
+            # Overlapping offsets; leave this scene out of the text
+            continue
+        gap = text[cursor:scene.start_offset]
+        original = text[scene.start_offset:scene.end_offset]
+        if scene.pk in replacements or scene.content_blob_id:
+            current = replacements[scene.pk] if scene.pk in replacements else scene.get_content()
+            # Keep the blank lines that separated the scene from the next heading
+            body = current.strip() + (original[len(original.rstrip()):] or '\n')
+        else:
+            body = original
+        pieces += [gap, body]
+        start = length + len(gap)
+        length = start + len(body)
+        new_offsets[scene.pk] = (start, length)
+        cursor = scene.end_offset
+    pieces.append(text[cursor:])
+    new_text = ''.join(pieces)
+
+    with transaction.atomic():
+        new_version = ScriptVersion.objects.append(version.script, new_text, notes=notes)
+        copies = []
+        for scene in scenes:
+            copy = Scene(
+                script_version=new_version,
+                scene_number=scene.scene_number,
+                setting=scene.setting,
+                goal=scene.goal,
+                tension=scene.tension,
+                tone=scene.tone,
+            )
+            if scene.pk in new_offsets:
+                copy.start_offset, copy.end_offset = new_offsets[scene.pk]
+            else:
+                content = replacements[scene.pk] if scene.pk in replacements else scene.get_content()
+                copy.content_blob = TextBlob.objects.intern(content) if content else None
+            copies.append(copy)
+        copies = Scene.objects.bulk_create(copies)
+
+        # bulk_create skips post_save, so touch, index and invalidate explicitly
+        touch_script(new_version.script_id)
+        for scene in copies:
+            scene.script_version = new_version
+            index_instance(scene, current=True)
+        invalidate_on_commit('version', new_version.pk)
+        invalidate_on_commit('script', new_version.script_id)
+    return new_version
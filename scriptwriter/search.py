@@ -0,0 +1,228 @@
+"""
+Full-text search over scripts, versions, scenes and characters.
+
+Every indexed object has one SearchEntry row that is refreshed from
+``post_save`` and removed from ``post_delete`` (see signals.py). The
+database keeps the actual index in sync with those rows:
+
+- PostgreSQL: a generated ``tsvector`` column with a GIN index, ranked with
+  ``ts_rank_cd`` and highlighted with ``ts_headline``.
+- SQLite: an external-content FTS5 table maintained by triggers, ranked
+  with ``bm25`` and highlighted with ``snippet``.
+
+Other backends fall back to a plain ``icontains`` scan.
+
+Only a script's latest version and its scenes are indexed with their full
+text. Older versions keep just their notes, and their scenes their goal and
+tension: indexing every version's text would store a full copy of each one
+again, which the delta and blob storage of versions exists to avoid. When a
+version is appended, ``supersede_previous`` drops the text of the one
+before it.
+"""
+from functools import lru_cache
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Character, Scene, Script, ScriptVersion, SearchEntry
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'scriptwriter_searchentry_fts'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+INDEXED_MODELS = {
+    Script: 'script',
+    ScriptVersion: 'version',
+    Scene: 'scene',
+    Character: 'character',
+}
+
+
+def is_current(version):
+    """Whether ``version`` is its script's latest version"""
+    return not ScriptVersion.objects.filter(
+        script_id=version.script_id, version_number__gt=version.version_number
+    ).exists()
+
+
+def build_document(instance, current=None):
+    """
+    Return the SearchEntry field values for a model instance. ``current``
+    says whether the version (or the scene's version) is the latest one,
+    and is looked up when not given.
+    """
+    if isinstance(instance, Script):
+        return {
+            'user_id': instance.user_id,
+            'script_id': instance.pk,
+            'title': instance.title,
+            'body': instance.logline,
+        }
+    if isinstance(instance, ScriptVersion):
+        script = instance.script
+        if current is None:
+            current = is_current(instance)
+        return {
+            'user_id': script.user_id,
+            'script_id': script.pk,
+            'title': f"{script.title} v{instance.version_number}",
+            'body': '\n\n'.join(filter(None, [instance.notes, instance.get_content() if current else ''])),
+        }
+    if isinstance(instance, Scene):
+        script = instance.script_version.script
+        if current is None:
+            current = is_current(instance.script_version)
+        return {
+            'user_id': script.user_id,
+            'script_id': script.pk,
+            'title': f"Scene {instance.scene_number}: {instance.setting}"[:500],
+            'body': '\n\n'.join(filter(None, [
+                instance.goal, instance.tension, instance.get_content() if current else ''
+            ])),
+        }
+    return {
+        'user_id': instance.user_id,
+        'script_id': None,
+        'title': instance.name,
+        'body': '\n\n'.join(filter(None, [
+            instance.personality, instance.goals, instance.voice, instance.backstory
+        ])),
+    }
+
+
+def index_instance(instance, current=None):
+    kind = INDEXED_MODELS[type(instance)]
+    SearchEntry.objects.update_or_create(
+        kind=kind, object_id=instance.pk, defaults=build_document(instance, current)
+    )
+
+
+def supersede_previous(version):
+    """Re-index the version before ``version``, and its scenes, without their text"""
+    previous = (
+        ScriptVersion.objects
+        .filter(script_id=version.script_id, version_number__lt=version.version_number)
+        .select_related('script')
+        .order_by('-version_number')
+        .first()
+    )
+    if previous is None:
+        return
+    index_instance(previous, current=False)
+    for scene in previous.scenes.all():
+        scene.script_version = previous
+        index_instance(scene, current=False)
+
+
+def unindex_instance(instance):
+    kind = INDEXED_MODELS[type(instance)]
+    SearchEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+
+@lru_cache(maxsize=None)
+def _sqlite_fts_available(alias):
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def _fts5_query(query):
+    """Quote each term so user input can't use FTS5 query syntax"""
+    terms = query.split()
+    return ' '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+
+def search(query, user=None, kinds=None, limit=20, offset=0):
+    """
+    Return ranked hits for ``query`` as dicts with kind, object_id,
+    script_id, title, rank and snippet.
+
+    ``user=None`` searches every user's documents (used by the admin).
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    filters = []
+    params = []
+    if user is not None:
+        filters.append("e.user_id = %s")
+        params.append(user.pk)
+    if kinds:
+        filters.append("e.kind IN (%s)" % ', '.join(['%s'] * len(kinds)))
+        params.extend(kinds)
+    where = ''.join(f" AND {clause}" for clause in filters)
+
+    if connection.vendor == 'postgresql':
+        # Rank and page first, then build headlines only for the rows returned
+        sql = f"""
+            SELECT hits.kind, hits.object_id, hits.script_id, hits.title, hits.rank,
+                   ts_headline(%s, hits.body, query,
+                               'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=25, MinWords=8')
+            FROM (
+                SELECT e.kind, e.object_id, e.script_id, e.title, e.body,
+                       ts_rank_cd(e.search_vector, query) AS rank, query
+                FROM scriptwriter_searchentry e, websearch_to_tsquery(%s, %s) query
+                WHERE e.search_vector @@ query{where}
+                ORDER BY rank DESC, e.id
+                LIMIT %s OFFSET %s
+            ) hits
+            ORDER BY hits.rank DESC
+        """
+        params = [SEARCH_CONFIG, SEARCH_CONFIG, query, *params, limit, offset]
+    elif connection.vendor == 'sqlite' and _sqlite_fts_available(connection.alias):
+        sql = f"""
+            SELECT e.kind, e.object_id, e.script_id, e.title, bm25({FTS_TABLE}, 10.0, 1.0) AS rank,
+                   snippet({FTS_TABLE}, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '...', 24)
+            FROM {FTS_TABLE}
+            JOIN scriptwriter_searchentry e ON e.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s{where}
+            ORDER BY rank, e.id
+            LIMIT %s OFFSET %s
+        """
+        params = [_fts5_query(query), *params, limit, offset]
+    else:
+        return _fallback_search(query, user, kinds, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'kind': kind,
+            'object_id': object_id,
+            'script_id': script_id,
+            'title': title,
+            # bm25 scores are negative, lower is better; flip so higher is better everywhere
+            'rank': float(rank) if connection.vendor == 'postgresql' else -float(rank),
+            'snippet': snippet,
+        }
+        for kind, object_id, script_id, title, rank, snippet in rows
+    ]
+
+
+def _fallback_search(query, user, kinds, limit, offset):
+    entries = SearchEntry.objects.filter(Q(title__icontains=query) | Q(body__icontains=query))
+    if user is not None:
+        entries = entries.filter(user=user)
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+
+    hits = []
+    for entry in entries.order_by('-updated_at')[offset:offset + limit]:
+        position = entry.body.lower().find(query.lower())
+        start = max(position, 0)
+        hits.append({
+            'kind': entry.kind,
+            'object_id': entry.object_id,
+            'script_id': entry.script_id,
+            'title': entry.title,
+            'rank': 0.0,
+            'snippet': entry.body[max(start - 80, 0):start + 160],
+        })
+    return hits
+
+
+def matching_ids(kind, query, limit=1000):
+    """Object ids of ``kind`` matching ``query`` across all users, best first"""
+    return [hit['object_id'] for hit in search(query, kinds=[kind], limit=limit)]
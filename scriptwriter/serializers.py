@@ -2,8 +2,11 @@
 Serializers for the scriptwriter app.
 """
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
+from .fieldsets import SparseFieldsSerializerMixin
 from .models import Character, Script, ScriptVersion, Scene, Job
+from .prompts import FORMAT_INSTRUCTIONS
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,6 +16,17 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class StoredTextField(serializers.CharField):
+    """Text field read through a model accessor, e.g. one backed by a TextBlob"""
+    
+    def __init__(self, getter, **kwargs):
+        self.getter = getter
+        super().__init__(**kwargs)
+    
+    def get_attribute(self, instance):
+        return getattr(instance, self.getter)()
+
+
 class CharacterSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     
@@ -26,14 +40,25 @@ class CharacterSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class SceneSerializer(serializers.ModelSerializer):
+class SceneSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    content = StoredTextField('get_content', allow_blank=True)
+    
     class Meta:
         model = Scene
-        fields = ['id', 'script_version', 'scene_number', 'setting', 'goal', 'tension', 'tone', 'content', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'script_version', 'scene_number', 'setting', 'goal', 'tension', 'tone', 'content',
+                  'start_offset', 'end_offset', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'start_offset', 'end_offset', 'created_at', 'updated_at']
+    
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Naming the edited columns lets Scene.save tell an emptied content from stored text
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
 
 
-class ScriptVersionSerializer(serializers.ModelSerializer):
+class ScriptVersionSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    content = StoredTextField('get_content', read_only=True)
     scenes = SceneSerializer(many=True, read_only=True)
     
     class Meta:
@@ -42,7 +67,27 @@ class ScriptVersionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class ScriptSerializer(serializers.ModelSerializer):
+class ScriptSummarySerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    """Lightweight list representation of a script: counts and timestamps, no text"""
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    latest_version = serializers.PrimaryKeyRelatedField(read_only=True)
+    latest_version_number = serializers.IntegerField(read_only=True)
+    scene_count = serializers.IntegerField(read_only=True)
+    character_count = serializers.IntegerField(read_only=True)
+    characters = CharacterSerializer(many=True, read_only=True)
+    versions = ScriptVersionSerializer(many=True, read_only=True)
+    
+    expandable_fields = ('characters', 'versions')
+    
+    class Meta:
+        model = Script
+        fields = ['id', 'user', 'title', 'genre', 'tone', 'logline', 'latest_version', 'latest_version_number',
+                  'version_count', 'scene_count', 'character_count', 'characters', 'versions',
+                  'created_at', 'updated_at']
+        read_only_fields = fields
+
+
+class ScriptSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     characters = CharacterSerializer(many=True, read_only=True)
     character_ids = serializers.PrimaryKeyRelatedField(
@@ -53,19 +98,16 @@ class ScriptSerializer(serializers.ModelSerializer):
         required=False
     )
     versions = ScriptVersionSerializer(many=True, read_only=True)
-    latest_version = serializers.SerializerMethodField()
+    latest_version = serializers.PrimaryKeyRelatedField(read_only=True)
+    latest_version_number = serializers.IntegerField(
+        source='latest_version.version_number', read_only=True, allow_null=True
+    )
     
     class Meta:
         model = Script
         fields = ['id', 'user', 'title', 'genre', 'tone', 'logline', 'characters', 'character_ids', 
-                  'versions', 'latest_version', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'user', 'created_at', 'updated_at']
-    
-    def get_latest_version(self, obj):
-        latest = obj.get_latest_version()
-        if latest:
-            return ScriptVersionSerializer(latest).data
-        return None
+                  'versions', 'latest_version', 'latest_version_number', 'version_count', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'version_count', 'created_at', 'updated_at']
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -78,29 +120,68 @@ class ScriptSerializer(serializers.ModelSerializer):
         characters = validated_data.pop('characters', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
-        
+        # Only the edited columns: latest_version and version_count belong to
+        # ScriptVersion.objects.append(), and this instance's copies may be stale
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+
         if characters is not None:
             instance.characters.set(characters)
         
         return instance
 
 
-class JobSerializer(serializers.ModelSerializer):
+class JobSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
+    result = StoredTextField('get_result', read_only=True)
     
     class Meta:
         model = Job
-        fields = ['id', 'user', 'job_id', 'job_type', 'status', 'prompt', 'script', 'scene', 
-                  'result', 'error_message', 'created_at', 'started_at', 'completed_at']
-        read_only_fields = ['id', 'user', 'job_id', 'status', 'result', 'error_message', 
-                            'created_at', 'started_at', 'completed_at']
+        fields = ['id', 'user', 'job_id', 'job_type', 'priority', 'status', 'prompt', 'script', 'scene', 
+                  'parent', 'segment_index', 'segments_total', 'segments_completed', 
+                  'result', 'error_message', 'served_from_cache', 'input_tokens', 'output_tokens', 
+                  'cache_creation_input_tokens', 'cache_read_input_tokens', 'time_to_first_token_ms', 'rate_limit_wait_ms', 
+                  'model', 'queue_wait_ms', 'model_time_ms', 'db_write_ms', 'created_at', 'started_at', 'completed_at']
+        read_only_fields = ['id', 'user', 'job_id', 'priority', 'status', 'parent', 'segment_index', 'segments_total', 
+                            'segments_completed', 'result', 'error_message', 'served_from_cache', 
+                            'input_tokens', 'output_tokens', 'cache_creation_input_tokens', 
+                            'cache_read_input_tokens', 'time_to_first_token_ms', 'rate_limit_wait_ms', 
+                            'model', 'queue_wait_ms', 'model_time_ms', 'db_write_ms', 'created_at', 'started_at', 'completed_at']
+
+
+# Created by other jobs or by dedicated endpoints, not through /api/jobs/create/
+INTERNAL_JOB_TYPES = ('outline_generation', 'segment_generation', 'scene_batch_regeneration')
 
 
 class JobCreateSerializer(serializers.Serializer):
     """Serializer for creating a new job"""
     prompt = serializers.CharField()
-    job_type = serializers.ChoiceField(choices=Job.JOB_TYPE_CHOICES)
+    job_type = serializers.ChoiceField(choices=[
+        choice for choice in Job.JOB_TYPE_CHOICES if choice[0] not in INTERNAL_JOB_TYPES
+    ])
     script_id = serializers.IntegerField(required=False, allow_null=True)
     scene_id = serializers.IntegerField(required=False, allow_null=True)
-    script_type = serializers.CharField(required=False, default='screenplay')
+    script_type = serializers.ChoiceField(choices=list(FORMAT_INSTRUCTIONS), required=False, default='screenplay')
+    # Complete immediately from an identical earlier generation, if there is one
+    allow_cached = serializers.BooleanField(required=False, default=False)
+    # Long-form jobs: number of outline sequences generated in parallel
+    segments = serializers.IntegerField(required=False, min_value=1, max_value=settings.LONG_FORM_MAX_SEGMENTS)
+    # 'batch' jobs are submitted with others as a Message Batch instead of generated right away
+    priority = serializers.ChoiceField(choices=Job.PRIORITY_CHOICES, required=False, default='interactive')
+    
+    def validate(self, attrs):
+        if attrs['priority'] == 'batch' and attrs['job_type'] == 'long_form_generation':
+            raise serializers.ValidationError({'priority': "Long-form jobs cannot run at batch priority"})
+        return attrs
+
+
+class SceneBatchRegenerateSerializer(serializers.Serializer):
+    """Scenes of a version to rewrite: explicit ids or numbers, or a filter; all scenes if none given"""
+    prompt = serializers.CharField(required=False, default='Regenerate this scene with improvements.')
+    scene_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    scene_numbers = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    setting = serializers.CharField(required=False, help_text="Only scenes whose setting contains this text")
+    tone = serializers.CharField(required=False, help_text="Only scenes with this tone")
+    concurrency = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.SCENE_BATCH_MAX_CONCURRENCY,
+        default=settings.SCENE_BATCH_DEFAULT_CONCURRENCY,
+    )
@@ -0,0 +1,144 @@
+"""
+Signal receivers for the scriptwriter app.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Character, Scene, Script, ScriptVersion
+from .payload_cache import invalidate_on_commit
+from .search import index_instance, supersede_previous, unindex_instance
+
+
+@receiver(post_save, sender=Script)
+@receiver(post_save, sender=ScriptVersion)
+@receiver(post_save, sender=Scene)
+@receiver(post_save, sender=Character)
+def update_search_entry(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    index_instance(instance)
+    if created and sender is ScriptVersion:
+        # Only the latest version keeps its text in the index
+        supersede_previous(instance)
+
+
+@receiver(post_delete, sender=Script)
+@receiver(post_delete, sender=ScriptVersion)
+@receiver(post_delete, sender=Scene)
+@receiver(post_delete, sender=Character)
+def remove_search_entry(sender, instance, **kwargs):
+    unindex_instance(instance)
+
+
+def _deleting_versions(origin):
+    # False when the versions go away because their whole script is being deleted
+    return isinstance(origin, ScriptVersion) or getattr(origin, 'model', None) is ScriptVersion
+
+
+@receiver(pre_delete, sender=ScriptVersion)
+def decode_older_version(sender, instance, origin=None, **kwargs):
+    # The version before this one may be a reverse delta against it; give it
+    # back its full text.
+    if not _deleting_versions(origin):
+        return
+    older = (
+        ScriptVersion.objects
+        .filter(script_id=instance.script_id, version_number__lt=instance.version_number)
+        .order_by('-version_number')
+        .first()
+    )
+    if older is not None:
+        older.decode()
+
+
+@receiver(post_delete, sender=ScriptVersion)
+def repoint_latest_version(sender, instance, origin=None, **kwargs):
+    # latest_version is SET_NULL when it is the deleted row; fall back to the next highest
+    if not _deleting_versions(origin):
+        return
+    ScriptVersion.objects.removed(instance.script_id)
+
+
+@receiver(post_save, sender=Scene)
+@receiver(post_delete, sender=Scene)
+def touch_script_for_scene(sender, instance, raw=False, **kwargs):
+    # Script.updated_at doubles as the ETag validator for the nested script tree
+    if raw:
+        return
+    Script.objects.filter(versions=instance.script_version_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Character)
+def touch_scripts_for_character(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Script.objects.filter(characters=instance).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Character)
+def touch_scripts_for_deleted_character(sender, instance, **kwargs):
+    # pre_delete: the cast rows are removed without m2m_changed and are gone by post_delete
+    Script.objects.filter(characters=instance).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Script.characters.through)
+def touch_script_for_cast_change(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Script):
+        Script.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+    elif pk_set:
+        Script.objects.filter(pk__in=pk_set).update(updated_at=timezone.now())
+
+
+# ----------------------------------------------------------------------------
+# Payload cache invalidation: an object and everything that nests it
+# ----------------------------------------------------------------------------
+
+@receiver(post_save, sender=Script)
+@receiver(post_delete, sender=Script)
+def invalidate_script_payload(sender, instance, **kwargs):
+    invalidate_on_commit('script', instance.pk)
+
+
+@receiver(post_save, sender=ScriptVersion)
+@receiver(post_delete, sender=ScriptVersion)
+def invalidate_version_payload(sender, instance, **kwargs):
+    invalidate_on_commit('version', instance.pk)
+    invalidate_on_commit('script', instance.script_id)
+
+
+@receiver(post_save, sender=Scene)
+@receiver(post_delete, sender=Scene)
+def invalidate_scene_payload(sender, instance, **kwargs):
+    invalidate_on_commit('scene', instance.pk)
+    invalidate_on_commit('version', instance.script_version_id)
+    script_id = (
+        ScriptVersion.objects
+        .filter(pk=instance.script_version_id)
+        .values_list('script_id', flat=True)
+        .first()
+    )
+    if script_id:
+        invalidate_on_commit('script', script_id)
+
+
+@receiver(post_save, sender=Character)
+@receiver(pre_delete, sender=Character)
+def invalidate_character_payload(sender, instance, **kwargs):
+    # pre_delete: the cast rows linking scripts are gone by post_delete
+    invalidate_on_commit('character', instance.pk)
+    invalidate_on_commit('script', *Script.objects.filter(characters=instance).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Script.characters.through)
+def invalidate_cast_payload(sender, instance, action, pk_set, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_on_commit('script', instance.pk)
+    elif pk_set:
+        invalidate_on_commit('script', *pk_set)
+    elif action == 'pre_clear':
+        invalidate_on_commit('script', *instance.scripts.values_list('pk', flat=True))
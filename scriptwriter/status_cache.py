@@ -0,0 +1,132 @@
+"""
+Redis record of each job's status and progress.
+
+Every job event (see events.py) also updates a small hash per job, so
+``job_status`` and ``JobViewSet.status`` can answer polling clients without
+a database query. The record is written through by the same code that
+changes the job, and is filled from the job row (never overwriting newer
+values) when a reader finds it missing or incomplete.
+
+Not every change publishes an event (a segment starting, an admin edit),
+and events can be lost, so the record of a pending or running job expires
+JOB_STATUS_ACTIVE_TTL seconds after its last update and is then filled
+from the row again. A finished job's record is kept for JOB_STATUS_TTL.
+
+Records hold statuses, timestamps and counters only, never generated text.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from redis.exceptions import RedisError
+
+from .etags import JOB_ETAG_FIELDS, job_state_etag
+from .models import Job
+from .redis_client import get_redis, key
+
+# Event data kept on the record, by record field
+EVENT_FIELDS = {
+    'status': 'status',
+    'job_type': 'job_type',
+    'created_at': 'created_at',
+    'started_at': 'started_at',
+    'completed_at': 'completed_at',
+    'segments_total': 'segments_total',
+    'segments_completed': 'segments_completed',
+    'rate_limit_wait_ms': 'rate_limit_wait_ms',
+    # Only from 'failed' events; a retry's error is not the job's
+    'error': 'error_message',
+    # UTF-8 bytes generated so far (the partial buffer offset), from streaming progress events
+    'next_offset': 'generated_bytes',
+}
+
+# Job columns a complete record holds
+RECORD_FIELDS = (
+    'id', 'user_id', 'job_type', 'status', 'segments_total', 'segments_completed', 'error_message',
+    'created_at', 'started_at', 'completed_at', 'rate_limit_wait_ms',
+)
+
+
+def record_key(job_id):
+    return key('job-status', job_id)
+
+
+def alias_key(pk):
+    """job_id of the job with primary key ``pk``, for lookups by pk"""
+    return key('job-status', 'pk', pk)
+
+
+def _ttl(status):
+    """Seconds to keep a record whose job has ``status`` (None if no event said)"""
+    if status is None or status in Job.ACTIVE_STATUSES:
+        return settings.JOB_STATUS_ACTIVE_TTL
+    return settings.JOB_STATUS_TTL
+
+
+def _encode(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def _event_mapping(job, event, data):
+    mapping = {'id': job.pk, 'user_id': job.user_id}
+    for name, field in EVENT_FIELDS.items():
+        if name in data and (name != 'error' or event == 'failed'):
+            mapping[field] = data[name]
+    return {field: _encode(value) for field, value in mapping.items()}
+
+
+def add_event(pipe, job, event, data):
+    """Queue the record update for ``event`` on a (sync or async) pipeline"""
+    record = record_key(job.job_id)
+    pipe.hset(record, mapping=_event_mapping(job, event, data))
+    pipe.expire(record, _ttl(data.get('status')))
+    pipe.set(alias_key(job.pk), job.job_id, ex=settings.JOB_STATUS_TTL)
+
+
+def _decode(raw):
+    record = {field.decode('utf-8'): json.loads(value) for field, value in raw.items()}
+    if not all(field in record for field in RECORD_FIELDS):
+        return None
+    return record
+
+
+def read(user, job_id=None, pk=None):
+    """
+    The complete status record of ``user``'s job, by job_id or pk.
+
+    Returns None if there is no complete record (or Redis is unavailable),
+    and the caller reads the job row instead.
+    """
+    try:
+        redis = get_redis()
+        if job_id is None:
+            job_id = redis.get(alias_key(pk))
+            if job_id is None:
+                return None
+            job_id = job_id.decode('utf-8')
+        record = _decode(redis.hgetall(record_key(job_id)))
+    except RedisError:
+        return None
+    if record is None or record.pop('user_id') != user.pk:
+        return None
+    record['job_id'] = job_id
+    return record
+
+
+def fill(job):
+    """Complete the record of ``job`` from its row; fields already set are kept as newer"""
+    record = record_key(job.job_id)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for field in RECORD_FIELDS:
+            pipe.hsetnx(record, field, _encode(getattr(job, field)))
+        pipe.expire(record, _ttl(job.status))
+        pipe.set(alias_key(job.pk), job.job_id, ex=settings.JOB_STATUS_TTL)
+        pipe.execute()
+    except RedisError:
+        pass
+
+
+def record_etag(record):
+    """ETag of a status record; equal to etags.job_etag of the job row it matches"""
+    return job_state_etag(record['id'], [record[field] for field in JOB_ETAG_FIELDS])
@@ -0,0 +1,250 @@
+"""
+Streaming generation into a per-job partial-result buffer.
+
+Tasks stream Claude's answer and append every text delta to a Redis string,
+so readers fetch only the bytes they have not seen yet (``GETRANGE`` from
+their offset). Every few seconds the text so far is copied to
+``Job.partial_result``, which is what readers fall back to if the buffer is
+gone. The final result is still written by the task exactly as before.
+New text is also published as ``progress`` events (see events.py), batched
+to at most one event per ``JOB_EVENTS_PROGRESS_INTERVAL``.
+
+The async worker (async_worker.py) streams through AsyncPartialBuffer and
+``astream_message``, the same buffer on asyncio Redis and the async ORM.
+
+Offsets are byte offsets into the UTF-8 text. Deltas are appended whole, so
+every offset handed out is on a character boundary.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from . import rate_limit
+from .events import apublish_job_event, publish_job_event
+from .models import Job
+from .redis_client import get_redis, key
+
+
+def _buffer_key(job_id):
+    return key('job-partial', job_id)
+
+
+class _PartialText:
+    """Text and progress bookkeeping shared by the sync and async buffers"""
+
+    def __init__(self, job):
+        self.job = job
+        self.job_id = job.job_id
+        self.chunks = []
+        self.length = 0
+        self.redis_available = True
+        self.last_flush = time.monotonic()
+        self.unpublished = []
+        self.published_offset = 0
+        self.last_publish = time.monotonic()
+        self.request_started = None
+        self.time_to_first_token_ms = None
+        self.model_time_ms = None
+
+    def _record(self, text):
+        if self.time_to_first_token_ms is None and self.request_started is not None:
+            self.time_to_first_token_ms = round((time.monotonic() - self.request_started) * 1000)
+        self.chunks.append(text)
+        self.unpublished.append(text)
+        self.length += len(text.encode('utf-8'))
+
+    def _take_progress(self):
+        """Data of the next progress event, or None if nothing new was streamed"""
+        self.last_publish = time.monotonic()
+        if not self.unpublished:
+            return None
+        data = {
+            'offset': self.published_offset, 'next_offset': self.length, 'text': ''.join(self.unpublished),
+            'rate_limit_wait_ms': self.job.rate_limit_wait_ms,
+        }
+        self.unpublished = []
+        self.published_offset = self.length
+        return data
+
+    def _publish_due(self):
+        return time.monotonic() - self.last_publish >= settings.JOB_EVENTS_PROGRESS_INTERVAL
+
+    def _flush_due(self):
+        return time.monotonic() - self.last_flush >= settings.JOB_PARTIAL_FLUSH_INTERVAL
+
+    def text(self):
+        return ''.join(self.chunks)
+
+    def _record_end(self):
+        self.model_time_ms = round((time.monotonic() - self.request_started) * 1000)
+
+    def timings(self):
+        """Job fields for the latency of the streamed request"""
+        return {'time_to_first_token_ms': self.time_to_first_token_ms, 'model_time_ms': self.model_time_ms}
+
+
+class PartialBuffer(_PartialText):
+    """Append-only output buffer for one running job"""
+
+    def __init__(self, job):
+        super().__init__(job)
+        # A retried task starts over
+        self._redis_call(lambda redis: redis.delete(_buffer_key(self.job_id)))
+
+    def _redis_call(self, command):
+        if not self.redis_available:
+            return
+        try:
+            command(get_redis())
+        except RedisError:
+            # Keep generating; readers get the periodic DB copy instead
+            self.redis_available = False
+
+    def append(self, text):
+        if not text:
+            return
+        self._record(text)
+
+        def write(redis):
+            buffer_key = _buffer_key(self.job_id)
+            pipe = redis.pipeline(transaction=False)
+            pipe.append(buffer_key, text.encode('utf-8'))
+            pipe.expire(buffer_key, settings.JOB_PARTIAL_BUFFER_TTL)
+            pipe.execute()
+
+        self._redis_call(write)
+        if self._publish_due():
+            self.publish_progress()
+        if self._flush_due():
+            self.flush()
+
+    def publish_progress(self):
+        data = self._take_progress()
+        if data:
+            publish_job_event(self.job, 'progress', **data)
+
+    def flush(self):
+        Job.objects.filter(job_id=self.job_id).update(partial_result=self.text())
+        self.last_flush = time.monotonic()
+
+    def discard(self):
+        """Drop the Redis copy once the final result has been saved"""
+        self._redis_call(lambda redis: redis.delete(_buffer_key(self.job_id)))
+
+
+class AsyncPartialBuffer(_PartialText):
+    """
+    PartialBuffer for the async worker: Redis through an asyncio client and
+    the DB copy through the async ORM, so streaming never blocks the event loop.
+    Call ``reset()`` before the first ``append()``.
+    """
+
+    def __init__(self, job, redis):
+        super().__init__(job)
+        self.redis = redis
+
+    async def _redis_call(self, command):
+        if not self.redis_available:
+            return
+        try:
+            await command(self.redis)
+        except RedisError:
+            self.redis_available = False
+
+    async def reset(self):
+        await self._redis_call(lambda redis: redis.delete(_buffer_key(self.job_id)))
+
+    async def append(self, text):
+        if not text:
+            return
+        self._record(text)
+
+        async def write(redis):
+            buffer_key = _buffer_key(self.job_id)
+            pipe = redis.pipeline(transaction=False)
+            pipe.append(buffer_key, text.encode('utf-8'))
+            pipe.expire(buffer_key, settings.JOB_PARTIAL_BUFFER_TTL)
+            await pipe.execute()
+
+        await self._redis_call(write)
+        if self._publish_due():
+            await self.publish_progress()
+        if self._flush_due():
+            await self.flush()
+
+    async def publish_progress(self):
+        data = self._take_progress()
+        if data:
+            await apublish_job_event(self.redis, self.job, 'progress', **data)
+
+    async def flush(self):
+        await Job.objects.filter(job_id=self.job_id).aupdate(partial_result=self.text())
+        self.last_flush = time.monotonic()
+
+    async def discard(self):
+        await self._redis_call(lambda redis: redis.delete(_buffer_key(self.job_id)))
+
+
+def stream_message(client, buffer, **params):
+    """
+    ``client.messages.create`` with streaming: text deltas go to ``buffer``
+    as they arrive and the complete Message is returned.
+    
+    Waits for the cluster-wide rate limiter first; the wait is added to the job.
+    """
+    reserved_tokens, waited = rate_limit.acquire(params)
+    if waited:
+        buffer.job.add_rate_limit_wait(round(waited * 1000))
+    buffer.request_started = time.monotonic()
+    with client.messages.stream(**params) as stream:
+        for text in stream.text_stream:
+            buffer.append(text)
+        buffer.publish_progress()
+        message = stream.get_final_message()
+    buffer._record_end()
+    rate_limit.settle(reserved_tokens, message.usage)
+    return message
+
+
+async def astream_message(client, buffer, **params):
+    """stream_message() for the async worker: an AsyncAnthropic client and an AsyncPartialBuffer"""
+    reserved_tokens, waited = await rate_limit.aacquire(buffer.redis, params)
+    if waited:
+        await sync_to_async(buffer.job.add_rate_limit_wait)(round(waited * 1000))
+    buffer.request_started = time.monotonic()
+    async with client.messages.stream(**params) as stream:
+        async for text in stream.text_stream:
+            await buffer.append(text)
+        await buffer.publish_progress()
+        message = await stream.get_final_message()
+    buffer._record_end()
+    await rate_limit.asettle(buffer.redis, reserved_tokens, message.usage)
+    return message
+
+
+def read_partial(job, offset=0):
+    """
+    Return ``(text, next_offset)``: the job's output after byte ``offset``.
+
+    Finished jobs are read from their result; running jobs from the Redis
+    buffer, or from the last DB flush if the buffer is unavailable.
+    """
+    data = None
+    if job.status == 'completed':
+        data = job.get_result().encode('utf-8')
+    else:
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.strlen(_buffer_key(job.job_id))
+            pipe.getrange(_buffer_key(job.job_id), offset, -1)
+            length, tail = pipe.execute()
+            if length:
+                # An append can land between the two reads; the offset follows the bytes returned
+                return tail.decode('utf-8', errors='replace'), offset + len(tail)
+        except RedisError:
+            pass
+        data = job.partial_result.encode('utf-8')
+
+    return data[offset:].decode('utf-8', errors='replace'), max(len(data), offset)
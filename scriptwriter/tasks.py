@@ -1,284 +1,802 @@
 """
 Celery tasks for async script generation.
 """
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from anthropic import APIConnectionError, APIStatusError
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
 from django.utils import timezone
-from anthropic import Anthropic
-import os
-from .models import Job, Script, ScriptVersion, Scene, Character
+from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
+from .models import Job, Script, ScriptVersion, Scene, Character, TextBlob
+from . import generation_cache, metrics
+from .anthropic_clients import get_task_client
+from .batch_providers import get_batch_provider
+from .events import publish_job_event
+from .long_form import OutlineSegment, outline_instructions, parse_outline, segment_prompt, stitch
+from .prompts import get_script_writing_system_prompt
+from .rate_limit import RateLimitTimeout
+from .retention import FINISHED_STATUSES, archive_finished_jobs, prune_text_blobs
+from .scene_summaries import neighbour_context, summarize_version
+from . import scheduler
+from .screenplay import create_scenes, replace_scenes
+from .streaming import PartialBuffer, stream_message
+
+
+logger = logging.getLogger(__name__)
+
+GENERATION_MODEL = "claude-opus-4-5-20251101"
+
+
+class TransientGenerationError(Exception):
+    """A generation failed in a way that is worth retrying later"""
+
 
+# Generation tasks: transient API errors are retried by celery with jittered exponential backoff
+GENERATION_TASK_OPTIONS = {
+    'bind': True,
+    'autoretry_for': (TransientGenerationError,),
+    'max_retries': settings.GENERATION_MAX_RETRIES,
+    'retry_backoff': settings.GENERATION_RETRY_BACKOFF,
+    'retry_backoff_max': settings.GENERATION_RETRY_BACKOFF_MAX,
+    'retry_jitter': True,
+}
 
-def get_script_writing_system_prompt(script_type='screenplay', genre='', tone='', characters=None):
-    """Get the system prompt for script writing based on type"""
+
+def is_transient(exc):
+    """Rate limit (429), overloaded (529) and other server errors, connection errors and limiter timeouts"""
+    if isinstance(exc, (APIConnectionError, RateLimitTimeout)):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+
+def retry_if_transient(task, job, exc):
+    """
+    Hand a transient error to celery's autoretry while retries remain.
+    
+    The job goes back to pending until the retry runs. Returns without
+    raising if the error is permanent or retries are used up, and the caller
+    fails the job as usual.
+    """
+    if job is None or not is_transient(exc) or task.request.retries >= task.max_retries:
+        return
+    if job.transition('pending', ('running',)):
+        publish_job_event(job, 'retrying', status=job.status, attempt=task.request.retries + 1, error=str(exc))
+    raise TransientGenerationError(str(exc)) from exc
+
+
+def build_script_request(prompt, script=None, script_type='screenplay'):
+    """Messages API parameters for generating a script"""
+    characters = []
+    genre = ''
+    tone = ''
+    
+    if script:
+        characters = list(script.characters.all())
+        genre = script.get_genre_display()
+        tone = script.get_tone_display()
+    
+    return {
+        'model': GENERATION_MODEL,
+        'max_tokens': 4096,
+        'system': get_script_writing_system_prompt(
+            script_type=script_type,
+            genre=genre,
+            tone=tone,
+            characters=characters
+        ),
+        'messages': [
+            {"role": "user", "content": prompt}
+        ],
+    }
+
+
+def build_scene_request(scene, prompt):
+    """
+    Messages API parameters for generating or rewriting a scene, and whether
+    any surrounding scene had no summary yet (see request_scene_summaries).
+    """
+    script = scene.script_version.script
+    characters = list(script.characters.all())
     
-    base_prompt = """You are an expert screenwriter and script consultant with deep knowledge of storytelling, 
-    character development, and screenplay formatting. You understand the principles of dramatic structure, 
-    including the three-act structure, character arcs, and compelling dialogue."""
+    # Build scene-specific prompt
+    scene_context = f"""
+Scene {scene.scene_number}:
+Setting: {scene.setting}
+"""
+    if scene.goal:
+        scene_context += f"Goal: {scene.goal}\n"
+    if scene.tension:
+        scene_context += f"Tension: {scene.tension}\n"
+    if scene.tone:
+        scene_context += f"Tone: {scene.tone}\n"
     
-    # Add genre and tone context
-    if genre:
-        base_prompt += f"\n\nThis is a {genre} script."
-    if tone:
-        base_prompt += f" The tone should be {tone}."
+    # What happens around the scene, as cached summaries within a fixed budget
+    neighbours, missing_summaries = neighbour_context(scene)
+    if neighbours:
+        scene_context += "\nSurrounding scenes:\n" + "\n".join(neighbours) + "\n"
     
-    # Add character context
-    if characters:
-        base_prompt += "\n\nCHARACTERS IN THIS SCRIPT:\n"
-        for char in characters:
-            base_prompt += f"\n{char.name}:"
-            if char.personality:
-                base_prompt += f"\n  Personality: {char.personality}"
-            if char.goals:
-                base_prompt += f"\n  Goals: {char.goals}"
-            if char.voice:
-                base_prompt += f"\n  Voice: {char.voice}"
-            if char.backstory:
-                base_prompt += f"\n  Backstory: {char.backstory}"
+    # Scenes parsed from a generated version are rewritten from their current text
+    current_draft = scene.get_content()
+    if current_draft:
+        scene_context += f"\nCurrent draft of this scene:\n{current_draft}\n"
     
-    if script_type == 'screenplay':
-        base_prompt += """
-
-SCREENPLAY FORMAT RULES:
-1. Use proper screenplay formatting with scene headings, action lines, character names, and dialogue
-2. Scene headings: INT./EXT. LOCATION - TIME OF DAY (e.g., INT. COFFEE SHOP - DAY)
-3. Action lines: Present tense, active voice, describing what we see and hear
-4. Character names: ALL CAPS when they first appear and above dialogue
-5. Dialogue: Character name centered, dialogue below
-6. Parentheticals: Brief direction for how a line should be delivered
-7. Transitions: FADE IN:, CUT TO:, FADE OUT: (use sparingly)
-
-STORYTELLING PRINCIPLES:
-- Strong opening hook that establishes the world and protagonist
-- Clear character motivations and goals
-- Rising tension and conflict
-- Well-paced scenes with purpose
-- Subtext in dialogue - show don't tell
-- Visual storytelling over exposition
-- Satisfying character arcs
-- Three-act structure: Setup, Confrontation, Resolution
-
-Generate professional, properly formatted screenplay content. Focus on vivid visual storytelling, 
-authentic dialogue, and compelling character development."""
+    full_prompt = scene_context + "\n\n" + prompt
     
-    elif script_type == 'treatment':
-        base_prompt += """
-
-TREATMENT FORMAT:
-- Write in present tense, third person
-- Describe the story chronologically from beginning to end
-- Include major plot points, character arcs, and turning points
-- Paint a vivid picture of the story world
-- Convey the tone and style of the piece
-- No dialogue, just narrative description
-- 3-5 pages for a short treatment, 10-30 for a full treatment
-
-Focus on compelling story structure and emotional journey."""
+    params = {
+        'model': GENERATION_MODEL,
+        'max_tokens': 2048,
+        'system': get_script_writing_system_prompt(
+            script_type='scene',
+            genre=script.get_genre_display(),
+            tone=scene.tone or script.get_tone_display(),
+            characters=characters
+        ),
+        'messages': [
+            {"role": "user", "content": full_prompt}
+        ],
+    }
+    return params, missing_summaries
+
+
+def build_job_request(job):
+    """Messages API parameters for a script or scene generation job"""
+    if job.job_type == 'scene_generation' and job.scene_id:
+        scene = Scene.objects.select_related('script_version__script').get(pk=job.scene_id)
+        params, _ = build_scene_request(scene, job.prompt)
+        return params
+    return build_script_request(job.prompt, job.script, job.script_type)
+
+
+def record_telemetry(job, write_started, called_model):
+    """Save how long storing the result took and add the finished job to the metrics"""
+    job.db_write_ms = round((time.monotonic() - write_started) * 1000)
+    Job.objects.filter(pk=job.pk).update(db_write_ms=job.db_write_ms)
+    metrics.observe_job(job, called_model)
+
+
+def complete_script_job(job, script, script_content, message=None, **fields):
+    """
+    Store a generated script on its job and, if given, as a new version of ``script``.
+    
+    ``fields`` are further Job fields to set (such as a buffer's timings).
+    Returns False, storing nothing else, if the job had already finished.
+    """
+    if message is not None:
+        fields.update(Job.usage_fields(message))
+    write_started = time.monotonic()
+    blob = TextBlob.objects.intern(script_content)
+    if not job.finish('completed', result_blob=blob, partial_result='', **fields):
+        return False
     
-    elif script_type == 'scene':
-        base_prompt += """
-
-SCENE GENERATION:
-- Write a complete, well-structured scene
-- Include proper scene heading
-- Clear visual action and character behavior
-- Authentic dialogue with subtext
-- Scene should have a clear beginning, middle, and end
-- Advance the plot or develop character
-- Maintain consistent tone and pacing"""
+    # If script is provided, create a new version
+    scenes = []
+    if script:
+        version = ScriptVersion.objects.append(script, script_content)
+        scenes = create_scenes(version, script_content)
+    record_telemetry(job, write_started, called_model=message is not None)
+    if scenes:
+        request_scene_summaries(version.pk)
+    publish_job_event(
+        job, 'completed', status=job.status, completed_at=job.completed_at, script_id=job.script_id
+    )
+    return True
+
+
+def complete_scene_job(job, scene, scene_content, message=None, **fields):
+    """
+    Store generated text as the scene's content and as the job's result.
     
-    else:  # outline
-        base_prompt += """
-
-OUTLINE FORMAT:
-- Organized by acts and sequences
-- Clear beat sheet of major story moments
-- Character introductions and arc progressions
-- Key plot points and turning points
-- Theme development
-- Conflict escalation
-
-Structure:
-ACT ONE: Setup
-- Opening Image
-- Inciting Incident
-- First Plot Point
-
-ACT TWO: Confrontation
-- Rising Action
-- Midpoint
-- Complications
-- Crisis
-
-ACT THREE: Resolution
-- Climax
-- Falling Action
-- Resolution
-- Closing Image
-
-Provide a comprehensive story outline with dramatic beats."""
+    Returns False, leaving the scene untouched, if the job had already finished.
+    """
+    if message is not None:
+        fields.update(Job.usage_fields(message))
+    write_started = time.monotonic()
+    blob = TextBlob.objects.intern(scene_content)
+    if not job.finish('completed', result_blob=blob, partial_result='', **fields):
+        return False
     
-    return base_prompt
+    scene.content = ''
+    scene.content_blob = blob
+    scene.save(update_fields=['content', 'content_blob', 'updated_at'])
+    record_telemetry(job, write_started, called_model=message is not None)
+    request_scene_summaries(scene.script_version_id)
+    publish_job_event(
+        job, 'completed', status=job.status, completed_at=job.completed_at, scene_id=scene.pk
+    )
+    return True
 
 
-@shared_task(bind=True)
+def fail_job(job, error):
+    """Mark the job failed; False if there is no job or it had already finished"""
+    if job is None or not job.finish('failed', error_message=error):
+        return False
+    metrics.observe_job(job)
+    publish_job_event(job, 'failed', status=job.status, completed_at=job.completed_at, error=job.error_message)
+    return True
+
+
+def report_child_progress(child):
+    """
+    Count a finished child job on its parent and publish the parent's progress.
+
+    Returns the parent; exactly one child sees its ``segments_completed``
+    reach ``segments_total``, and that child starts the parent's final step.
+    """
+    while True:
+        parent = (
+            Job.objects
+            .only('job_id', 'user', 'parent', 'status', 'segments_total', 'segments_completed')
+            .get(pk=child.parent_id)
+        )
+        counted = parent.segments_completed
+        # Compare-and-set, so concurrent children each see a different count
+        if Job.objects.filter(pk=parent.pk, segments_completed=counted).update(segments_completed=counted + 1):
+            parent.segments_completed = counted + 1
+            break
+    publish_job_event(
+        parent, 'segment', status=parent.status, segment_index=child.segment_index, segment_status=child.status,
+        segments_total=parent.segments_total, segments_completed=parent.segments_completed,
+    )
+    return parent
+
+
+def sum_child_usage(job):
+    """Job fields for the token usage summed over the job's children"""
+    return job.children.aggregate(
+        input_tokens=Sum('input_tokens'),
+        output_tokens=Sum('output_tokens'),
+        cache_creation_input_tokens=Sum('cache_creation_input_tokens'),
+        cache_read_input_tokens=Sum('cache_read_input_tokens'),
+    )
+
+
+def complete_job_from_cache(job, script_type='screenplay'):
+    """
+    Complete a pending job from an identical earlier generation.
+    
+    Returns False, leaving the job untouched, when there is none.
+    """
+    if job.job_type == 'long_form_generation':
+        # Assembled from several generations; only its segments are cached
+        return False
+    
+    if job.job_type == 'scene_generation' and job.scene_id:
+        scene = (
+            Scene.objects
+            .select_related('script_version__script')
+            .filter(pk=job.scene_id, script_version__script__user_id=job.user_id)
+            .first()
+        )
+        if scene is None:
+            return False
+        params, _ = build_scene_request(scene, job.prompt)
+        blob = generation_cache.lookup(params)
+        if blob is None:
+            return False
+        return complete_scene_job(job, scene, blob.content, served_from_cache=True, started_at=timezone.now())
+    
+    script = None
+    if job.script_id:
+        script = Script.objects.filter(pk=job.script_id, user_id=job.user_id).first()
+        if script is None:
+            return False
+    blob = generation_cache.lookup(build_script_request(job.prompt, script, script_type))
+    if blob is None:
+        return False
+    return complete_script_job(job, script, blob.content, served_from_cache=True, started_at=timezone.now())
+
+
+@shared_task(**GENERATION_TASK_OPTIONS)
 def generate_script_task(self, job_id, prompt, script_id=None, script_type='screenplay'):
     """
     Async task to generate a script using Claude AI.
     """
+    job = None
     try:
         job = Job.objects.get(job_id=job_id)
-        job.status = 'running'
-        job.started_at = timezone.now()
-        job.save()
+        if not job.start():
+            # Redelivered after it already ran (tasks are acknowledged late)
+            return {'job_id': job_id, 'status': job.status}
+        publish_job_event(job, 'running', status=job.status, started_at=job.started_at)
         
         # Get script and related data if provided
-        script = None
-        characters = []
-        genre = ''
-        tone = ''
-        
-        if script_id:
-            script = Script.objects.get(id=script_id)
-            characters = list(script.characters.all())
-            genre = script.get_genre_display()
-            tone = script.get_tone_display()
-        
-        # Get API key from environment
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY not found in environment")
-        
-        # Initialize Claude AI client
-        client = Anthropic(api_key=api_key)
-        
-        # System prompt for script writing
-        system_prompt = get_script_writing_system_prompt(
-            script_type=script_type,
-            genre=genre,
-            tone=tone,
-            characters=characters
-        )
+        script = Script.objects.get(id=script_id) if script_id else None
+        params = build_script_request(prompt, script, script_type)
         
-        # Generate script using Claude
-        message = client.messages.create(
-            model="claude-opus-4-5-20251101",
-            max_tokens=4096,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            stream=False
-        )
+        # Shared Claude AI client for this worker process
+        client = get_task_client()
+        
+        # Generate script using Claude, streaming tokens into the partial buffer
+        buffer = PartialBuffer(job)
+        message = stream_message(client, buffer, **params)
         
         script_content = message.content[0].text
         
         # Update job with result
-        job.status = 'completed'
-        job.result = script_content
-        job.completed_at = timezone.now()
-        job.save()
-        
-        # If script is provided, create a new version
-        if script:
-            latest_version = script.get_latest_version()
-            version_number = (latest_version.version_number + 1) if latest_version else 1
-            
-            ScriptVersion.objects.create(
-                script=script,
-                version_number=version_number,
-                content=script_content
-            )
+        complete_script_job(job, script, script_content, message, **buffer.timings())
+        buffer.discard()
+        generation_cache.store(params, job.result_blob)
         
-        return {'status': 'completed', 'result': script_content}
+        return {'job_id': job_id, 'status': 'completed'}
         
     except Exception as e:
-        # Update job with error
-        job = Job.objects.get(job_id=job_id)
-        job.status = 'failed'
-        job.error_message = str(e)
-        job.completed_at = timezone.now()
-        job.save()
+        retry_if_transient(self, job, e)
+        fail_job(job, str(e))
         
         return {'status': 'failed', 'error': str(e)}
 
 
-@shared_task(bind=True)
+@shared_task(**GENERATION_TASK_OPTIONS)
 def generate_scene_task(self, job_id, scene_id, prompt):
     """
     Async task to generate or regenerate a scene.
     """
+    job = None
     try:
         job = Job.objects.get(job_id=job_id)
-        job.status = 'running'
-        job.started_at = timezone.now()
-        job.save()
+        if not job.start():
+            # Redelivered after it already ran (tasks are acknowledged late)
+            return {'job_id': job_id, 'status': job.status}
+        publish_job_event(job, 'running', status=job.status, started_at=job.started_at)
         
-        scene = Scene.objects.get(id=scene_id)
-        script_version = scene.script_version
-        script = script_version.script
+        scene = Scene.objects.select_related('script_version__script').get(id=scene_id)
+        params, missing_summaries = build_scene_request(scene, prompt)
+        if missing_summaries:
+            request_scene_summaries(scene.script_version_id)
         
-        # Get characters
-        characters = list(script.characters.all())
+        # Shared Claude AI client for this worker process
+        client = get_task_client()
         
-        # Get API key from environment
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY not found in environment")
+        # Generate scene using Claude, streaming tokens into the partial buffer
+        buffer = PartialBuffer(job)
+        message = stream_message(client, buffer, **params)
         
-        # Initialize Claude AI client
-        client = Anthropic(api_key=api_key)
+        scene_content = message.content[0].text
         
-        # Build scene-specific prompt
-        scene_context = f"""
-Scene {scene.scene_number}:
-Setting: {scene.setting}
-Goal: {scene.goal}
-Tension: {scene.tension}
-"""
-        if scene.tone:
-            scene_context += f"Tone: {scene.tone}\n"
+        # Update scene and job with result
+        complete_scene_job(job, scene, scene_content, message, **buffer.timings())
+        buffer.discard()
+        generation_cache.store(params, job.result_blob)
         
-        full_prompt = scene_context + "\n\n" + prompt
+        return {'job_id': job_id, 'status': 'completed'}
         
-        # System prompt for scene writing
-        system_prompt = get_script_writing_system_prompt(
-            script_type='scene',
-            genre=script.get_genre_display(),
-            tone=scene.tone or script.get_tone_display(),
-            characters=characters
+    except Exception as e:
+        retry_if_transient(self, job, e)
+        fail_job(job, str(e))
+        
+        return {'status': 'failed', 'error': str(e)}
+
+
+@shared_task(**GENERATION_TASK_OPTIONS)
+def generate_long_form_task(self, job_id, prompt, script_id=None, segments=None):
+    """
+    Async task to generate a feature-length script.
+    
+    Writes an outline (as a child job), then fans out one child job per
+    outline sequence; the last of them to finish stitches them into the result.
+    """
+    job = None
+    try:
+        job = Job.objects.get(job_id=job_id)
+        if not job.start():
+            # Redelivered after it already ran (tasks are acknowledged late)
+            return {'job_id': job_id, 'status': job.status}
+        publish_job_event(job, 'running', status=job.status, started_at=job.started_at)
+        
+        script = Script.objects.get(id=script_id) if script_id else None
+        count = segments or settings.LONG_FORM_DEFAULT_SEGMENTS
+        
+        # Outline first, streamed like any other generation
+        outline_job = Job.objects.create(
+            user_id=job.user_id,
+            job_id=str(uuid.uuid4()),
+            job_type='outline_generation',
+            status='running',
+            prompt=prompt,
+            script=script,
+            parent=job,
+            started_at=timezone.now(),
         )
+        params = build_script_request(prompt + outline_instructions(count), script, 'outline')
+        buffer = PartialBuffer(outline_job)
+        message = stream_message(get_task_client(), buffer, **params)
+        outline = message.content[0].text
+        complete_script_job(outline_job, None, outline, message, **buffer.timings())
+        buffer.discard()
         
-        # Generate scene using Claude
-        message = client.messages.create(
-            model="claude-opus-4-5-20251101",
-            max_tokens=2048,
-            system=system_prompt,
-            messages=[
-                {"role": "user", "content": full_prompt}
-            ],
-            stream=False
+        parsed = parse_outline(outline) or [OutlineSegment(number=1, title='Full story', beats=outline)]
+        children = [
+            Job.objects.create(
+                user_id=job.user_id,
+                job_id=str(uuid.uuid4()),
+                job_type='segment_generation',
+                status='pending',
+                prompt=segment_prompt(outline, segment, len(parsed)),
+                script=script,
+                parent=job,
+                segment_index=segment.number,
+            )
+            for segment in parsed
+        ]
+        Job.objects.filter(pk=job.pk).update(segments_total=len(children))
+        publish_job_event(job, 'segment', status=job.status, segments_total=len(children), segments_completed=0)
+        
+        # Segments run concurrently within the user's long-form lane cap; the last one to finish stitches
+        for child in children:
+            scheduler.submit(child, generate_segment_task, child.job_id)
+        
+        return {'status': 'running', 'segments': len(children)}
+        
+    except Exception as e:
+        # The outline attempt that was interrupted, if any
+        Job.objects.filter(parent__job_id=job_id, job_type='outline_generation', status='running').update(
+            status='failed', error_message=str(e), completed_at=timezone.now()
         )
+        retry_if_transient(self, job, e)
+        fail_job(job, str(e))
         
-        scene_content = message.content[0].text
+        return {'status': 'failed', 'error': str(e)}
+
+
+@shared_task(**GENERATION_TASK_OPTIONS)
+def generate_segment_task(self, job_id):
+    """
+    Async task to generate one sequence of a long-form script.
+    
+    All segments share the script's system prompt (characters included), so
+    after the first one they read it from the prompt cache.
+    """
+    job = None
+    try:
+        job = Job.objects.select_related('script').get(job_id=job_id)
+        if not job.start():
+            # Redelivered after it already ran (tasks are acknowledged late)
+            return {'job_id': job_id, 'status': job.status}
+        publish_job_event(job, 'running', status=job.status, started_at=job.started_at)
         
-        # Update scene
-        scene.content = scene_content
-        scene.save()
+        params = build_script_request(job.prompt, job.script, 'screenplay')
+        buffer = PartialBuffer(job)
+        message = stream_message(get_task_client(), buffer, **params)
         
-        # Update job with result
-        job.status = 'completed'
-        job.result = scene_content
-        job.completed_at = timezone.now()
-        job.save()
+        # The stitch step writes the version; segments only keep their own text
+        finished = complete_script_job(job, None, message.content[0].text, message, **buffer.timings())
+        buffer.discard()
+        result = {'job_id': job_id, 'status': 'completed'}
+        
+    except Exception as e:
+        retry_if_transient(self, job, e)
+        finished = fail_job(job, str(e))
+        result = {'job_id': job_id, 'status': 'failed', 'error': str(e)}
+    
+    if finished:
+        parent = report_child_progress(job)
+        if parent.segments_completed == parent.segments_total:
+            stitch_segments_task.delay(parent.job_id)
+    return result
+
+
+@shared_task(bind=True)
+def stitch_segments_task(self, job_id):
+    """
+    Run after the last segment: join the finished segments of a long-form
+    job, in outline order, into its result and a single new ScriptVersion.
+    """
+    job = None
+    try:
+        job = Job.objects.select_related('script').get(job_id=job_id)
+        segments = list(
+            job.children
+            .filter(job_type='segment_generation')
+            .select_related('result_blob')
+            .order_by('segment_index')
+        )
+        failed = [str(segment.segment_index) for segment in segments if segment.status != 'completed']
+        if failed:
+            raise ValueError(f"Segments {', '.join(failed)} failed")
         
-        return {'status': 'completed', 'result': scene_content}
+        complete_script_job(job, job.script, stitch(segment.get_result() for segment in segments), **sum_child_usage(job))
+        return {'status': 'completed', 'segments': len(segments)}
         
     except Exception as e:
-        # Update job with error
+        fail_job(job, str(e))
+        
+        return {'status': 'failed', 'error': str(e)}
+
+
+def dispatch_scene_batch(job, children, version_id, concurrency):
+    """
+    Run a batch's scene jobs (in segment_index order) with at most
+    ``concurrency`` in flight.
+    
+    The first ``concurrency`` are submitted through the scheduler, so they
+    also count against the user's cap in the scenes lane; each scene that
+    finishes submits the next one, and the last applies the batch.
+    """
+    for child in children[:concurrency]:
+        scheduler.submit(child, generate_batch_scene_task, child.job_id, version_id, concurrency)
+
+
+def continue_scene_batch(parent, version_id, concurrency):
+    """Submit the batch's next scene after one finished, or apply the batch after the last"""
+    if parent.segments_completed >= parent.segments_total:
+        apply_scene_batch_task.delay(parent.job_id, version_id)
+        return
+    # The n-th scene to finish hands its place to scene number concurrency + n
+    position = concurrency + parent.segments_completed - 1
+    child = Job.objects.filter(parent=parent).order_by('segment_index', 'pk')[position:position + 1].first()
+    if child is not None:
+        scheduler.submit(child, generate_batch_scene_task, child.job_id, version_id, concurrency)
+
+
+@shared_task(**GENERATION_TASK_OPTIONS)
+def generate_batch_scene_task(self, job_id, version_id, concurrency):
+    """
+    Async task to rewrite one scene of a batch.
+    
+    Unlike generate_scene_task the scene is left untouched; the text is kept
+    on the job until the whole batch is applied.
+    """
+    job = None
+    try:
+        job = Job.objects.get(job_id=job_id)
+        if not job.start():
+            # Redelivered after it already ran (tasks are acknowledged late)
+            return {'job_id': job_id, 'status': job.status}
+        
+        scene = Scene.objects.select_related('script_version__script').get(id=job.scene_id)
+        params, missing_summaries = build_scene_request(scene, job.prompt)
+        if missing_summaries:
+            request_scene_summaries(scene.script_version_id)
+        buffer = PartialBuffer(job)
+        message = stream_message(get_task_client(), buffer, **params)
+        
+        finished = complete_script_job(job, None, message.content[0].text, message, **buffer.timings())
+        buffer.discard()
+        generation_cache.store(params, job.result_blob)
+        result = {'job_id': job_id, 'status': 'completed'}
+        
+    except Exception as e:
+        retry_if_transient(self, job, e)
+        finished = fail_job(job, str(e))
+        result = {'job_id': job_id, 'status': 'failed', 'error': str(e)}
+    
+    if finished:
+        continue_scene_batch(report_child_progress(job), version_id, concurrency)
+    return result
+
+
+@shared_task(bind=True)
+def apply_scene_batch_task(self, job_id, version_id):
+    """
+    Run after the batch's last scene: if every scene succeeded, write all of
+    them as one new version; otherwise change nothing.
+    """
+    job = None
+    try:
         job = Job.objects.get(job_id=job_id)
-        job.status = 'failed'
-        job.error_message = str(e)
-        job.completed_at = timezone.now()
-        job.save()
+        children = list(job.children.select_related('result_blob'))
+        failed = [str(child.segment_index) for child in children if child.status != 'completed']
+        if failed:
+            raise ValueError(f"Scenes {', '.join(failed)} failed; no new version was created")
+        empty = [str(child.segment_index) for child in children if not child.get_result().strip()]
+        if empty:
+            raise ValueError(f"Scenes {', '.join(empty)} came back empty; no new version was created")
+        
+        version = ScriptVersion.objects.select_related('script').get(pk=version_id)
+        new_version = replace_scenes(
+            version,
+            {child.scene_id: child.get_result() for child in children},
+            notes=f"Regenerated {len(children)} scenes of version {version.version_number}: {job.prompt}",
+        )
+        
+        complete_script_job(job, None, new_version.get_content(), **sum_child_usage(job))
+        request_scene_summaries(new_version.pk)
+        return {'status': 'completed', 'version_id': new_version.pk}
+        
+    except Exception as e:
+        fail_job(job, str(e))
         
         return {'status': 'failed', 'error': str(e)}
+
+
+def request_scene_summaries(version_id):
+    """
+    Queue summaries of a version's new scene texts, at most once per
+    SCENE_SUMMARY_DEBOUNCE seconds per version; never fails the caller.
+    """
+    try:
+        if cache.add(f'scene-summaries:{version_id}', 1, timeout=settings.SCENE_SUMMARY_DEBOUNCE):
+            summarize_scenes_task.delay(version_id)
+    except (RedisError, OperationalError) as e:
+        logger.warning("Could not queue scene summaries of version %s: %s", version_id, e)
+
+
+@shared_task
+def summarize_scenes_task(version_id):
+    """Summarize the scenes of a version whose text has no cached summary yet"""
+    version = ScriptVersion.objects.filter(pk=version_id).first()
+    if version is None:
+        return {'summarized': 0}
+    return {'summarized': summarize_version(version)}
+
+
+# batch_id of jobs claimed by a submit_batch_jobs run that has not recorded its batch yet
+BATCH_CLAIM_PREFIX = 'claim:'
+
+
+def _claim_key(claim):
+    """Cache key remembering the batch submitted for ``claim``"""
+    return f'batch-{claim}'
+
+
+@shared_task
+def submit_batch_jobs():
+    """
+    Periodic: submit pending batch-priority jobs as one Message Batch.
+    
+    The jobs are first claimed (running, with a claim token as batch_id) and
+    committed, so overlapping runs never submit a job twice and no row lock
+    is held during the request. If submission fails the jobs go back to
+    pending; claims left behind by a run that died are resolved by
+    ``reconcile_batch_claims``.
+    """
+    claim = f'{BATCH_CLAIM_PREFIX}{uuid.uuid4().hex}'
+    submitted = []
+    with transaction.atomic():
+        jobs = list(
+            Job.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('script')
+            .filter(priority='batch', status='pending')
+            .order_by('created_at')[:settings.BATCH_MAX_REQUESTS]
+        )
+        requests = []
+        for job in jobs:
+            try:
+                requests.append((job.job_id, build_job_request(job)))
+            except Exception as e:
+                fail_job(job, str(e))
+                continue
+            submitted.append(job)
+        if not requests:
+            return {'submitted': 0}
+        
+        now = timezone.now()
+        Job.objects.filter(pk__in=[job.pk for job in submitted], status='pending').update(
+            status='running', batch_id=claim, started_at=now
+        )
+    
+    claimed = Job.objects.filter(batch_id=claim, status='running')
+    try:
+        batch_id = get_batch_provider().submit(requests)
+    except Exception:
+        claimed.update(status='pending', batch_id='', started_at=None)
+        raise
+    try:
+        # Lets reconcile_batch_claims find the batch if the update below fails
+        cache.set(_claim_key(claim), batch_id, timeout=settings.BATCH_LOCAL_TIMEOUT)
+    except RedisError:
+        pass
+    claimed.update(batch_id=batch_id)
+    
+    for job in submitted:
+        job.status = 'running'
+        publish_job_event(job, 'running', status=job.status, started_at=now)
+    return {'submitted': len(submitted), 'batch_id': batch_id}
+
+
+def reconcile_batch_claims():
+    """
+    Resolve claims older than BATCH_CLAIM_TIMEOUT whose batch id was never
+    recorded: attach the batch if its id was remembered, otherwise return
+    the jobs to pending to be submitted again. Returns how many claims.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.BATCH_CLAIM_TIMEOUT)
+    claims = list(
+        Job.objects
+        .filter(priority='batch', status='running', batch_id__startswith=BATCH_CLAIM_PREFIX, started_at__lt=cutoff)
+        .order_by()
+        .values_list('batch_id', flat=True)
+        .distinct()
+    )
+    for claim in claims:
+        claimed = Job.objects.filter(batch_id=claim, status='running')
+        batch_id = cache.get(_claim_key(claim))
+        if batch_id:
+            claimed.update(batch_id=batch_id)
+        else:
+            logger.warning("Batch claim %s has no recorded batch; returning its jobs to pending", claim)
+            claimed.update(status='pending', batch_id='', started_at=None)
+    return len(claims)
+
+
+@shared_task
+def poll_batch_jobs():
+    """
+    Periodic: write the results of ended Message Batches back to their jobs.
+    
+    Each batch is read under a cache lock, so a poll that overlaps a slow
+    one skips the batches still being written.
+    """
+    provider = get_batch_provider()
+    reconciled = reconcile_batch_claims()
+    batch_ids = list(
+        Job.objects
+        .filter(priority='batch', status='running')
+        .exclude(batch_id='')
+        .exclude(batch_id__startswith=BATCH_CLAIM_PREFIX)
+        .order_by()
+        .values_list('batch_id', flat=True)
+        .distinct()
+    )
+    completed = failed = 0
+    for batch_id in batch_ids:
+        lock = f'batch-poll:{batch_id}'
+        if not cache.add(lock, 1, timeout=settings.BATCH_POLL_LOCK_TIMEOUT):
+            continue
+        try:
+            if not provider.is_finished(batch_id):
+                continue
+            jobs = {
+                job.job_id: job
+                for job in Job.objects.select_related('script').filter(batch_id=batch_id, status='running')
+            }
+            for result in provider.results(batch_id):
+                job = jobs.pop(result.custom_id, None)
+                if job is None:
+                    continue
+                if result.message is None:
+                    failed += fail_job(job, result.error)
+                    continue
+                
+                content = result.message.content[0].text
+                if job.job_type == 'scene_generation' and job.scene_id:
+                    scene = Scene.objects.get(pk=job.scene_id)
+                    completed += complete_scene_job(job, scene, content, result.message)
+                else:
+                    completed += complete_script_job(job, job.script, content, result.message)
+            
+            for job in jobs.values():
+                failed += fail_job(job, "No result returned for this job's batch request")
+        finally:
+            cache.delete(lock)
+    return {'batches': len(batch_ids), 'reconciled': reconciled, 'completed': completed, 'failed': failed}
+
+
+@shared_task
+def dispatch_jobs():
+    """
+    Periodic: free scheduler slots of jobs that have finished and dispatch
+    every lane. Slots are normally freed as each task ends; this catches
+    tasks whose worker died before it could.
+    """
+    released = 0
+    for lane in sorted(set(scheduler.LANES.values())):
+        job_ids = scheduler.in_flight(lane)
+        active = set(
+            Job.objects.filter(job_id__in=job_ids).exclude(status__in=FINISHED_STATUSES).values_list('job_id', flat=True)
+        )
+        for job_id in job_ids:
+            if job_id not in active:
+                scheduler.release(job_id, redispatch=False)
+                released += 1
+    dispatched = sum(scheduler.dispatch(lane) for lane in sorted(set(scheduler.LANES.values())))
+    return {'released': released, 'dispatched': dispatched}
+
+
+@shared_task
+def archive_old_jobs():
+    """
+    Periodic retention sweep, scheduled by celery beat.
+    """
+    archived = archive_finished_jobs()
+    pruned = prune_text_blobs()
+    return {'archived': archived, 'pruned_blobs': pruned}
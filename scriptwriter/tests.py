@@ -1,3 +1,1291 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import unittest
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from anthropic import APIStatusError
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import anthropic_clients, async_worker, events, metrics, payload_cache, prompts, rate_limit, scheduler, search, status_cache
+from .batch_providers import LocalBatchProvider
+from .etags import job_etag
+from .events import publish_job_event
+from .long_form import parse_outline, stitch
+from .models import ArchivedJob, Character, Job, Scene, Script, ScriptVersion, TextBlob, text_hash
+from .prompts import get_script_writing_system_prompt
+from .redis_client import get_redis
+from .retention import archive_finished_jobs, prune_text_blobs
+from .scene_summaries import SUMMARY_LINE, fallback_summary
+from .screenplay import create_scenes, parse_scenes, replace_scenes
+from .streaming import PartialBuffer
+from .tasks import (
+    TransientGenerationError, apply_scene_batch_task, complete_script_job, generate_batch_scene_task,
+    generate_script_task, generate_segment_task, is_transient, poll_batch_jobs, reconcile_batch_claims,
+    retry_if_transient, stitch_segments_task, submit_batch_jobs, summarize_scenes_task,
+)
+from .versioning import MissingFullText, apply_delta, is_keyframe, make_delta, rebuilt_texts
+from .views import JobViewSet, job_status
+
+try:
+    import fakeredis
+    import fakeredis.aioredis
+except ImportError:  # pip install 'fakeredis[lua]' to run the Redis-backed tests
+    fakeredis = None
+
+# Django's cache is Redis at REDIS_URL outside tests; keep every test off it
+_locmem_caches = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+def setUpModule():
+    _locmem_caches.enable()
+    cache.clear()
+
+
+def tearDownModule():
+    _locmem_caches.disable()
+
+
+class FakeRedisMixin:
+    """Runs with get_redis() answered by an in-memory fakeredis server"""
+
+    def setUp(self):
+        super().setUp()
+        self.redis_server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.redis_server)
+        patcher = mock.patch('redis.Redis.from_url', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clear_clients()
+        self.addCleanup(self.clear_clients)
+
+    @staticmethod
+    def clear_clients():
+        # Connections and registered Lua scripts are cached per process
+        for cached in (get_redis, scheduler._take_next_script, rate_limit._take_script):
+            cached.cache_clear()
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis[lua] is not installed")
+class RedisTestCase(FakeRedisMixin, TestCase):
+    pass
+
+
+class ParseScenesTests(SimpleTestCase):
+    def test_headings(self):
+        text = (
+            "Title page\n\n"
+            "INT. COFFEE SHOP - DAY\nAnna waits.\n\n"
+            "**EXT. ROOFTOP - NIGHT**\nWind.\n\n"
+            "### 12 INT./EXT. CAR - MOVING\nThey drive.\n\n"
+            "EXT.CAR - NIGHT\nParked."
+        )
+        scenes = parse_scenes(text)
+        self.assertEqual(
+            [scene.heading for scene in scenes],
+            ['INT. COFFEE SHOP - DAY', 'EXT. ROOFTOP - NIGHT', 'INT./EXT. CAR - MOVING', 'EXT.CAR - NIGHT'],
+        )
+        self.assertEqual([scene.number for scene in scenes], [1, 2, 3, 4])
+        self.assertTrue(text[scenes[0].start:scenes[0].end].startswith('INT. COFFEE SHOP'))
+        self.assertEqual(scenes[-1].end, len(text))
+        self.assertEqual(scenes[0].end, scenes[1].start)
+
+    def test_words_starting_like_a_prefix_are_not_headings(self):
+        self.assertEqual(parse_scenes("INTERIOR SHOT of the house\nEXTRA takes a bow\n"), [])
+
+
+class OutlineTests(SimpleTestCase):
+    def test_parse_outline(self):
+        outline = (
+            "Logline first.\n\n"
+            "SEQUENCE 1: The Setup\nAnna meets Bob.\n\n"
+            "**Sequence 2 - The Heist**\nThey break in.\n"
+            "## SEQUENCE 3.\nThey escape."
+        )
+        segments = parse_outline(outline)
+        self.assertEqual(
+            [(segment.number, segment.title, segment.beats) for segment in segments],
+            [(1, 'The Setup', 'Anna meets Bob.'), (2, 'The Heist', 'They break in.'), (3, 'Sequence 3', 'They escape.')],
+        )
+        self.assertEqual(parse_outline("No sequences here"), [])
+
+    def test_stitch(self):
+        self.assertEqual(stitch(["FADE IN:\nOne.\n\n", "", "  Two.\nFADE OUT."]), "FADE IN:\nOne.\n\nTwo.\nFADE OUT.\n")
+
+
+class SystemPromptTests(SimpleTestCase):
+    def test_static_block_is_identical_across_calls(self):
+        first = get_script_writing_system_prompt('screenplay', genre='Noir')
+        second = get_script_writing_system_prompt('screenplay', genre='Western')
+        self.assertEqual(json.dumps(first[0]), json.dumps(second[0]))
+        self.assertEqual(first[0]['cache_control'], {'type': 'ephemeral'})
+        self.assertEqual(first[1]['cache_control'], {'type': 'ephemeral'})
+        self.assertNotEqual(first[1]['text'], second[1]['text'])
+
+    def test_unknown_types_share_the_outline_entry(self):
+        outline = get_script_writing_system_prompt('outline')[0]
+        before = prompts._static_block.cache_info().currsize
+        for n in range(50):
+            self.assertIs(get_script_writing_system_prompt(f'unknown-{n}')[0], outline)
+            self.assertEqual(prompts.static_system_prompt(f'unknown-{n}'), outline['text'])
+        self.assertEqual(prompts._static_block.cache_info().currsize, before)
+        self.assertLessEqual(prompts._static_prompt.cache_info().currsize, len(prompts.FORMAT_INSTRUCTIONS))
+
+
+class SceneSummaryTests(SimpleTestCase):
+    def test_summary_lines(self):
+        for line, number, summary in [
+            ('3: Anna leaves.', '3', 'Anna leaves.'),
+            ('**Scene 3.** Anna leaves.', '3', 'Anna leaves.'),
+            ('Scene 12: Anna leaves.', '12', 'Anna leaves.'),
+            ('4) Bob arrives.', '4', 'Bob arrives.'),
+        ]:
+            match = SUMMARY_LINE.match(line)
+            self.assertIsNotNone(match, line)
+            self.assertEqual((match.group(1), match.group(2).strip()), (number, summary))
+        self.assertIsNone(SUMMARY_LINE.match('Here are the summaries'))
+
+    def test_fallback_summary(self):
+        scene = Scene(goal='Anna confronts Bob.')
+        text = "INT. KITCHEN - DAY\n\n**ANNA**\nYou lied.\n"
+        self.assertEqual(fallback_summary(scene, text), 'Anna confronts Bob. ANNA You lied.')
+
+        summary = fallback_summary(Scene(goal=''), "INT. HALL - DAY\n" + "word " * 200)
+        self.assertTrue(summary.endswith('...'))
+        self.assertLessEqual(len(summary), 303)
+
+
+class DeltaTests(SimpleTestCase):
+    def assertRoundTrip(self, base, target):
+        self.assertEqual(apply_delta(base, make_delta(base, target)), target)
+
+    def test_round_trip(self):
+        base = "INT. HOUSE - DAY\nAnna waits.\n\nEXT. STREET - NIGHT\nRain.\n"
+        target = "INT. HOUSE - DAY\nAnna paces.\n\nEXT. STREET - NIGHT\nRain.\nThunder.\n"
+        self.assertRoundTrip(base, target)
+        self.assertRoundTrip(target, base)
+
+    def test_last_line_without_newline(self):
+        self.assertRoundTrip("one\ntwo\nthree", "one\ntwo\nthree\n")
+        self.assertRoundTrip("one\ntwo\nthree\n", "one\ntwo\nthree")
+        self.assertRoundTrip("one\ntwo", "one\nTWO")
+
+    def test_empty_and_unrelated_texts(self):
+        self.assertRoundTrip("", "new text")
+        self.assertRoundTrip("old text\n", "")
+        self.assertRoundTrip("a\nb\nc\n", "x\ny\n")
+
+    def test_unchanged_text_copies_lines(self):
+        text = "a\nb\nc\n"
+        self.assertEqual(make_delta(text, text), '[[0,3]]')
+
+    @override_settings(SCRIPT_VERSION_KEYFRAME_INTERVAL=3)
+    def test_keyframes(self):
+        self.assertEqual([number for number in range(1, 11) if is_keyframe(number)], [1, 4, 7, 10])
+
+
+@override_settings(SCRIPT_VERSION_KEYFRAME_INTERVAL=3)
+class ScriptVersionContentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        self.texts = [
+            "INT. ROOM - DAY\n" + "".join(f"Line {line} of the scene.\n" for line in range(20))
+            + f"Revised in version {number}.\n" + ("Last line" if number % 2 else "")
+            for number in range(1, 8)
+        ]
+        self.versions = [ScriptVersion.objects.append(self.script, text) for text in self.texts]
+        rebuilt_texts.clear()
+
+    def tearDown(self):
+        rebuilt_texts.clear()
+
+    def stored(self, version):
+        return ScriptVersion.objects.get(pk=version.pk)
+
+    def test_keyframes_and_latest_keep_full_text(self):
+        deltas = [self.stored(version).is_delta for version in self.versions]
+        self.assertEqual(deltas, [False, True, True, False, True, True, False])
+
+    def test_get_content_rebuilds_every_version(self):
+        for version, text in zip(self.versions, self.texts):
+            self.assertEqual(self.stored(version).get_content(), text)
+
+    def test_get_content_across_keyframe(self):
+        # Version 3 rebuilds from keyframe 4; version 2 goes through version 3
+        rebuilt_texts.clear()
+        self.assertEqual(self.stored(self.versions[1]).get_content(), self.texts[1])
+        rebuilt_texts.clear()
+        self.assertEqual(self.stored(self.versions[2]).get_content(), self.texts[2])
+
+    def test_deleting_a_version_keeps_the_older_one_readable(self):
+        self.stored(self.versions[5]).delete()
+        older = self.stored(self.versions[4])
+        self.assertFalse(older.is_delta)
+        self.assertEqual(older.get_content(), self.texts[4])
+
+        ScriptVersion.objects.filter(pk__in=[self.versions[2].pk, self.versions[3].pk]).delete()
+        rebuilt_texts.clear()
+        self.assertEqual(self.stored(self.versions[1]).get_content(), self.texts[1])
+
+    def test_deleting_versions_keeps_the_latest_pointer(self):
+        self.stored(self.versions[6]).delete()
+        self.script.refresh_from_db()
+        self.assertEqual(self.script.get_latest_version(), self.versions[5])
+        self.assertEqual(self.script.version_count, 6)
+
+        self.stored(self.versions[2]).delete()
+        self.script.refresh_from_db()
+        self.assertEqual(self.script.get_latest_version(), self.versions[5])
+        self.assertEqual(self.script.version_count, 5)
+
+        version = ScriptVersion.objects.append(self.script, "INT. ROOM - NIGHT\n")
+        self.assertEqual(version.version_number, 7)
+        self.assertEqual(self.script.version_count, 6)
+
+    def test_missing_full_copy(self):
+        # Every newer full copy lost, e.g. rows removed without the delete signals
+        ScriptVersion.objects.filter(script=self.script, version_number__gt=3).update(content_blob=None, is_delta=True)
+        with self.assertRaises(MissingFullText):
+            self.stored(self.versions[2]).get_content()
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('scriptwriter:version-detail', args=[self.versions[2].pk]))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('error', response.json())
+
+
+class JobCreationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.url = reverse('scriptwriter:create_job')
+
+    def create(self, key, **data):
+        # Batch priority: queued for the next batch submission, nothing is sent yet
+        payload = {'prompt': 'A heist on the moon', 'job_type': 'script_generation', 'priority': 'batch', **data}
+        return self.client.post(self.url, payload, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeated_idempotency_key_returns_the_same_job(self):
+        first = self.create('key-1')
+        second = self.create('key-1')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        self.assertEqual(Job.objects.filter(user=self.user).count(), 1)
+
+    def test_reused_key_with_other_parameters_is_rejected(self):
+        self.create('key-1')
+        response = self.create('key-1', prompt='A heist on Mars')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Job.objects.filter(user=self.user).count(), 1)
+
+    def test_unknown_script_type_is_rejected(self):
+        response = self.create('key-1', script_type='x' * 30)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('script_type', response.json())
+        self.assertFalse(Job.objects.exists())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        self.version = ScriptVersion.objects.append(self.script, "INT. ROOM - DAY\nSilence.\n")
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], etag)
+        return etag
+
+    def test_script(self):
+        url = reverse('scriptwriter:script-detail', args=[self.script.pk])
+        etag = self.assertNotModified(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'title': 'Final'}, content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Final')
+
+    def test_version(self):
+        self.assertNotModified(reverse('scriptwriter:version-detail', args=[self.version.pk]))
+
+    def test_job(self):
+        job = Job.objects.create(user=self.user, job_id='job-1', job_type='script_generation', prompt='p')
+        url = reverse('scriptwriter:job-detail', args=[job.pk])
+        etag = self.assertNotModified(url)
+
+        job.start()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_long_form_job_after_outline(self):
+        job = Job.objects.create(user=self.user, job_id='job-1', job_type='long_form_generation', prompt='p')
+        job.start()
+        url = reverse('scriptwriter:job-detail', args=[job.pk])
+        etag = self.assertNotModified(url)
+
+        # Splitting the outline sets segments_total while the job stays running
+        Job.objects.filter(pk=job.pk).update(segments_total=3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['segments_total'], 3)
+
+    def test_script_after_parse_scenes(self):
+        url = reverse('scriptwriter:script-detail', args=[self.script.pk])
+        etag = self.assertNotModified(url)
+
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(summarize_scenes_task, 'delay'):
+            response = self.client.post(reverse('scriptwriter:version-parse-scenes', args=[self.version.pk]))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_script_after_character_delete(self):
+        character = Character.objects.create(user=self.user, name='Anna')
+        self.script.characters.add(character)
+        url = reverse('scriptwriter:script-detail', args=[self.script.pk])
+        etag = self.assertNotModified(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            character.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['characters'], [])
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.script = Script.objects.create(user=self.user, title='Draft', logline='A long logline')
+        self.script.characters.add(Character.objects.create(user=self.user, name='Anna'))
+        ScriptVersion.objects.append(self.script, "INT. ROOM - DAY\nSilence.\n", notes='First pass')
+
+    def get(self, name, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'scriptwriter:{name}'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'], ' '.join(query['sql'] for query in queries)
+
+    def test_unrequested_text_columns_are_deferred(self):
+        results, sql = self.get('version-list', fields='version_number')
+        self.assertEqual(results, [{'id': self.script.latest_version_id, 'version_number': 1}])
+        self.assertNotIn('"notes"', sql)
+        self.assertNotIn('"delta"', sql)
+
+        results, sql = self.get('script-list', fields='title')
+        self.assertEqual(results, [{'id': self.script.pk, 'title': 'Draft'}])
+        self.assertNotIn('"logline"', sql)
+
+        results, sql = self.get('script-list')
+        self.assertEqual(results[0]['logline'], 'A long logline')
+        self.assertIn('"logline"', sql)
+
+    def test_expand_adds_nested_data(self):
+        results, _ = self.get('script-list')
+        self.assertNotIn('characters', results[0])
+        self.assertNotIn('versions', results[0])
+
+        results, _ = self.get('script-list', fields='title', expand='characters,versions')
+        self.assertEqual(set(results[0]), {'id', 'title', 'characters', 'versions'})
+        self.assertEqual([character['name'] for character in results[0]['characters']], ['Anna'])
+        self.assertEqual(results[0]['versions'][0]['notes'], 'First pass')
+
+    def test_unknown_names_are_ignored(self):
+        results, _ = self.get('script-list', fields='title,budget', expand='crew')
+        self.assertEqual(results, [{'id': self.script.pk, 'title': 'Draft'}])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        for n in range(3):
+            Script.objects.create(user=self.user, title=f'Draft {n}')
+
+    def test_count_only_on_first_page(self):
+        url = reverse('scriptwriter:script-list')
+        with mock.patch('scriptwriter.pagination.estimate_count', return_value=3) as estimate:
+            first = self.client.get(url, {'page_size': 2})
+            self.assertEqual(first['X-Total-Count-Estimate'], '3')
+            second = self.client.get(first.json()['next'])
+        self.assertEqual(estimate.call_count, 1)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotIn('X-Total-Count-Estimate', second)
+        self.assertEqual(len(second.json()['results']), 1)
+
+
+@mock.patch.dict('os.environ', {'ANTHROPIC_API_KEY': 'server-key'})
+class AnthropicClientTests(SimpleTestCase):
+    def setUp(self):
+        anthropic_clients._reset_after_fork()
+        self.addCleanup(anthropic_clients._reset_after_fork)
+
+    def test_task_client_makes_no_sdk_retries(self):
+        client = anthropic_clients.get_client()
+        task_client = anthropic_clients.get_task_client()
+        self.assertEqual(client.max_retries, settings.ANTHROPIC_MAX_RETRIES)
+        self.assertEqual(task_client.max_retries, 0)
+        self.assertIs(task_client._client, client._client)
+        self.assertIs(anthropic_clients.get_task_client(), task_client)
+
+    def test_server_client_is_reused(self):
+        self.assertIs(anthropic_clients.get_client(), anthropic_clients.get_client())
+        with mock.patch.dict('os.environ', {'ANTHROPIC_API_KEY': ''}):
+            anthropic_clients._reset_after_fork()
+            with self.assertRaises(ValueError):
+                anthropic_clients.get_client()
+
+    @override_settings(ANTHROPIC_CLIENT_CACHE_SIZE=2)
+    def test_keyed_clients_are_evicted_least_recently_used(self):
+        first = anthropic_clients.get_client('key-1')
+        second = anthropic_clients.get_client('key-2')
+        self.assertIs(anthropic_clients.get_client('key-1'), first)
+        anthropic_clients.get_client('key-3')
+
+        self.assertEqual(len(anthropic_clients._keyed_clients), 2)
+        self.assertIs(anthropic_clients.get_client('key-1'), first)
+        self.assertIsNot(anthropic_clients.get_client('key-2'), second)
+        self.assertNotEqual(first.api_key, second.api_key)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs os.fork")
+    def test_fork_drops_the_parent_clients(self):
+        client = anthropic_clients.get_client()
+        anthropic_clients.get_client('key-1')
+
+        pid = os.fork()
+        if pid == 0:
+            emptied = anthropic_clients._default_client is None and not anthropic_clients._keyed_clients
+            os._exit(0 if emptied else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(anthropic_clients.get_client(), client)
+
+        anthropic_clients._reset_after_fork()
+        self.assertEqual(len(anthropic_clients._keyed_clients), 0)
+        self.assertIsNot(anthropic_clients.get_client(), client)
+        # The parent's connections are left open for the parent
+        self.assertFalse(client._client.is_closed)
+
+
+@override_settings(SCHEDULER_MAX_IN_FLIGHT_PER_USER=2, ASYNC_GENERATION_LANES=[])
+class SchedulerTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.anna = User.objects.create_user('anna', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+        self.sent = []
+        patcher = mock.patch.object(scheduler, '_send', side_effect=lambda lane, payload: self.sent.append(
+            payload['args'][0]
+        ))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, user, *job_ids):
+        for job_id in job_ids:
+            job = Job(user=user, job_id=job_id, job_type='script_generation', prompt='p')
+            scheduler.submit(job, generate_script_task, job_id)
+
+    def finish(self, job_id, state='SUCCESS'):
+        scheduler._release_after_task(sender=generate_script_task, args=[job_id], state=state)
+
+    def test_per_user_cap(self):
+        self.submit(self.anna, 'a1', 'a2', 'a3')
+        self.assertEqual(self.sent, ['a1', 'a2'])
+        self.assertEqual(sorted(scheduler.in_flight('scripts')), ['a1', 'a2'])
+
+        # Another user is not held up by the first user's backlog
+        self.submit(self.bob, 'b1')
+        self.assertEqual(self.sent, ['a1', 'a2', 'b1'])
+
+    def test_users_take_turns(self):
+        self.submit(self.anna, 'a1', 'a2', 'a3', 'a4', 'a5', 'a6')
+        self.submit(self.bob, 'b1', 'b2', 'b3', 'b4')
+        self.assertEqual(self.sent, ['a1', 'a2', 'b1', 'b2'])
+
+        for job_id in ['a1', 'a2', 'b1', 'b2']:
+            scheduler.release(job_id, redispatch=False)
+        self.assertEqual(scheduler.dispatch('scripts'), 4)
+        self.assertEqual(self.sent[4:], ['a3', 'b3', 'a4', 'b4'])
+
+    def test_slot_released_when_the_task_finishes(self):
+        self.submit(self.anna, 'a1', 'a2', 'a3')
+        self.finish('a1')
+        self.assertEqual(self.sent, ['a1', 'a2', 'a3'])
+        self.assertEqual(sorted(scheduler.in_flight('scripts')), ['a2', 'a3'])
+
+    def test_slot_kept_while_the_task_retries(self):
+        self.submit(self.anna, 'a1', 'a2', 'a3')
+        self.finish('a1', state='RETRY')
+        self.assertEqual(self.sent, ['a1', 'a2'])
+        self.assertEqual(sorted(scheduler.in_flight('scripts')), ['a1', 'a2'])
+
+    def test_job_that_cannot_be_sent_goes_back_first(self):
+        self.submit(self.anna, 'a1')
+        with mock.patch.object(scheduler, '_send', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.submit(self.anna, 'a2')
+        self.assertEqual(scheduler.in_flight('scripts'), ['a1'])
+        self.assertEqual(scheduler.dispatch('scripts'), 1)
+        self.assertEqual(self.sent, ['a1', 'a2'])
+
+
+def api_error(status_code):
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    return APIStatusError(f'Error {status_code}', response=httpx.Response(status_code, request=request), body=None)
+
+
+@override_settings(ANTHROPIC_RATE_LIMIT_RPM=2, ANTHROPIC_RATE_LIMIT_TPM=0, ANTHROPIC_RATE_LIMIT_MAX_WAIT=300)
+class RateLimitTests(RedisTestCase):
+    params = {'system': '', 'messages': [{'role': 'user', 'content': 'x' * 400}], 'max_tokens': 500}
+
+    def setUp(self):
+        super().setUp()
+        # Sleeping refills the buckets instead of waiting
+        patcher = mock.patch.object(rate_limit.time, 'sleep', side_effect=lambda seconds: self.redis.flushall())
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_per_minute(self):
+        self.assertEqual(rate_limit.acquire(self.params)[1], 0)
+        self.assertEqual(rate_limit.acquire(self.params)[1], 0)
+        reserved, waited = rate_limit.acquire(self.params)
+        self.sleep.assert_called_once()
+        # The bucket refills two requests a minute, so a third waits about 30s
+        self.assertGreaterEqual(waited, 30)
+        self.assertEqual(reserved, rate_limit.estimate_tokens(self.params))
+
+    @override_settings(ANTHROPIC_RATE_LIMIT_RPM=0, ANTHROPIC_RATE_LIMIT_TPM=1000)
+    def test_tokens_per_minute(self):
+        self.assertEqual(rate_limit.acquire(self.params)[1], 0)
+        self.assertGreater(rate_limit.acquire(self.params)[1], 0)
+        self.sleep.assert_called_once()
+
+    @override_settings(ANTHROPIC_RATE_LIMIT_MAX_WAIT=10)
+    def test_timeout(self):
+        rate_limit.acquire(self.params)
+        rate_limit.acquire(self.params)
+        with self.assertRaises(rate_limit.RateLimitTimeout):
+            rate_limit.acquire(self.params)
+        self.sleep.assert_not_called()
+
+    @override_settings(ANTHROPIC_RATE_LIMIT_RPM=0, ANTHROPIC_RATE_LIMIT_TPM=1000)
+    def test_settle_refunds_unused_tokens(self):
+        reserved, _ = rate_limit.acquire(self.params)
+        usage = SimpleNamespace(input_tokens=100, output_tokens=50, cache_creation_input_tokens=None)
+        rate_limit.settle(reserved, usage)
+        level = float(self.redis.hget(rate_limit.key('rate-limit', 'tokens'), 'level'))
+        self.assertAlmostEqual(level, 1000 - 150, delta=1)
+
+        self.assertEqual(rate_limit.acquire(self.params)[1], 0)
+        self.sleep.assert_not_called()
+
+
+@override_settings(ANTHROPIC_RATE_LIMIT_RPM=0, ANTHROPIC_RATE_LIMIT_TPM=0)
+class TransientErrorTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.job = Job.objects.create(user=self.user, job_id='job-1', job_type='script_generation', prompt='p')
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient(api_error(429)))
+        self.assertTrue(is_transient(api_error(529)))
+        self.assertTrue(is_transient(rate_limit.RateLimitTimeout()))
+        self.assertFalse(is_transient(api_error(400)))
+
+    def test_retry_puts_the_job_back_to_pending(self):
+        self.job.start()
+        task = SimpleNamespace(request=SimpleNamespace(retries=0), max_retries=5)
+        with self.assertRaises(TransientGenerationError):
+            retry_if_transient(task, self.job, api_error(529))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'pending')
+
+        # Once retries are used up the caller fails the job as usual
+        self.job.start()
+        task.request.retries = 5
+        self.assertIsNone(retry_if_transient(task, self.job, api_error(529)))
+
+    def run_task(self, error):
+        client = mock.Mock()
+        client.messages.stream.side_effect = error
+        with mock.patch('scriptwriter.tasks.get_task_client', return_value=client):
+            return generate_script_task(self.job.job_id, self.job.prompt)
+
+    def test_overloaded_request_is_retried(self):
+        with self.assertRaises(TransientGenerationError):
+            self.run_task(api_error(529))
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'pending')
+
+    def test_bad_request_fails_the_job(self):
+        self.assertEqual(self.run_task(api_error(400))['status'], 'failed')
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'failed')
+
+
+class JobTransitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        self.job = Job.objects.create(
+            user=self.user, job_id='job-1', job_type='script_generation', prompt='p', script=self.script
+        )
+
+    def test_finish_only_once(self):
+        self.assertTrue(self.job.start())
+        self.assertTrue(self.job.finish('completed'))
+        self.assertFalse(self.job.finish('failed', error_message='late'))
+        self.assertFalse(self.job.start())
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.error_message), ('completed', ''))
+
+    def test_completing_a_finished_job_stores_nothing(self):
+        self.job.start()
+        self.assertTrue(complete_script_job(self.job, self.script, "INT. ROOM - DAY\nFirst.\n"))
+        stale = Job.objects.get(pk=self.job.pk)
+        stale.status = 'running'
+        self.assertFalse(complete_script_job(stale, self.script, "INT. ROOM - DAY\nSecond.\n"))
+        self.assertEqual(ScriptVersion.objects.filter(script=self.script).count(), 1)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.get_result(), "INT. ROOM - DAY\nFirst.\n")
+
+
+class JobStatusRecordTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.job = Job.objects.create(user=self.user, job_id='job-1', job_type='script_generation', prompt='p')
+        self.job.start()
+        self.factory = APIRequestFactory()
+
+    def get(self, view, url, **kwargs):
+        request = self.factory.get(url, HTTP_IF_NONE_MATCH=kwargs.pop('etag', ''))
+        force_authenticate(request, user=self.user)
+        return view(request, **kwargs)
+
+    def test_missing_record_is_filled_from_the_row(self):
+        self.assertIsNone(status_cache.read(self.user, job_id='job-1'))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('scriptwriter:job_status', args=['job-1']))
+        self.assertEqual(response.json()['status'], 'running')
+
+        record = status_cache.read(self.user, pk=self.job.pk)
+        self.assertEqual((record['job_id'], record['status']), ('job-1', 'running'))
+        self.assertIsNone(status_cache.read(User.objects.create_user('other'), job_id='job-1'))
+
+    def test_status_served_from_the_record(self):
+        status_cache.fill(self.job)
+        view = JobViewSet.as_view({'get': 'status'})
+        with self.assertNumQueries(0):
+            response = self.get(view, f'/api/jobs/{self.job.pk}/status/', pk=str(self.job.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['job_id'], response.data['status']), ('job-1', 'running'))
+
+    def test_not_modified_without_a_query(self):
+        status_cache.fill(self.job)
+        etag = self.get(job_status, '/api/jobs/job-1/status/', job_id='job-1')['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(job_status, '/api/jobs/job-1/status/', job_id='job-1', etag=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # A later event changes the record and its ETag
+        self.job.finish('completed')
+        publish_job_event(self.job, 'completed', status=self.job.status, completed_at=self.job.completed_at)
+        response = self.get(job_status, '/api/jobs/job-1/status/', job_id='job-1', etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'completed')
+
+    def test_record_and_row_give_the_same_etag(self):
+        self.job.add_rate_limit_wait(1500)
+        self.job.refresh_from_db()
+        status_cache.fill(self.job)
+        record = status_cache.read(self.user, job_id='job-1')
+        self.assertEqual(status_cache.record_etag(record), job_etag(self.user, job_id='job-1'))
+
+        # A poller keeps its 304 when the record expires and is rebuilt
+        etag = self.get(job_status, '/api/jobs/job-1/status/', job_id='job-1')['ETag']
+        self.redis.flushall()
+        response = self.get(job_status, '/api/jobs/job-1/status/', job_id='job-1', etag=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(JOB_EVENTS_HEARTBEAT=0.05)
+class JobEventTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+        self.job = Job.objects.create(user=self.user, job_id='job-1', job_type='script_generation', prompt='p')
+        self.other_job = Job.objects.create(user=self.other, job_id='job-2', job_type='script_generation', prompt='p')
+        async_redis = fakeredis.aioredis.FakeRedis(server=self.redis_server)
+        patcher = mock.patch('redis.asyncio.Redis.from_url', return_value=async_redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stream_relays_only_the_users_events(self):
+        async def read_stream():
+            stream = events._relay(self.user.pk)
+            chunks = [await anext(stream)]
+            # Subscribed once the retry line is out
+            publish_job_event(self.other_job, 'running', status='running')
+            publish_job_event(self.job, 'completed', status='completed')
+            for _ in range(5):
+                chunks.append(await anext(stream))
+            await stream.aclose()
+            return chunks
+
+        chunks = asyncio.run(read_stream())
+        self.assertEqual(chunks[0], f'retry: {settings.JOB_EVENTS_RETRY_MS}\n\n')
+        # Idle polls send keepalive comments
+        self.assertIn(': keepalive\n\n', chunks)
+        messages = [chunk for chunk in chunks[1:] if chunk != ': keepalive\n\n']
+        self.assertEqual(len(messages), 1)
+        name, data = messages[0].strip().split('\n')
+        self.assertEqual(name, 'event: completed')
+        self.assertEqual(json.loads(data.removeprefix('data: ')), {'event': 'completed', 'job_id': 'job-1', 'status': 'completed'})
+
+    def test_stream_requires_a_login(self):
+        self.assertEqual(self.client.get(reverse('scriptwriter:job_events')).status_code, 403)
+
+
+class PayloadCacheTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        self.version = ScriptVersion.objects.append(self.script, "INT. ROOM - DAY\nSilence.\n\nEXT. ROAD - NIGHT\nRain.\n")
+        self.script_url = reverse('scriptwriter:script-detail', args=[self.script.pk])
+        self.version_url = reverse('scriptwriter:version-detail', args=[self.version.pk])
+        patcher = mock.patch('scriptwriter.views.request_scene_summaries')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_retrieve_is_a_hit(self):
+        self.client.get(self.script_url)
+        self.client.get(self.script_url)
+        self.assertEqual(payload_cache.stats()['script']['hits'], 1)
+
+    def test_retrieve_after_edit(self):
+        self.assertEqual(self.client.get(self.script_url).json()['title'], 'Draft')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(self.script_url, {'title': 'Final'}, content_type='application/json')
+            # Invalidated only once the edit commits, so no reader caches the old row as new
+            cached = payload_cache.get_or_build('script', self.user.pk, self.script.pk, '*|*', dict)
+            self.assertEqual(cached['title'], 'Draft')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(self.script_url).json()['title'], 'Final')
+
+    def test_retrieve_after_parse_scenes(self):
+        self.assertEqual(self.client.get(self.version_url).json()['scenes'], [])
+        self.client.get(self.script_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('scriptwriter:version-parse-scenes', args=[self.version.pk]))
+        self.assertEqual(len(self.client.get(self.version_url).json()['scenes']), 2)
+        self.assertEqual(len(self.client.get(self.script_url).json()['versions'][0]['scenes']), 2)
+
+    def test_retrieve_after_replace_scenes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('scriptwriter:version-parse-scenes', args=[self.version.pk]))
+        self.assertEqual(self.client.get(self.script_url).json()['version_count'], 1)
+        scene = self.version.scenes.get(scene_number=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_version = replace_scenes(self.version, {scene.pk: "EXT. ROAD - NIGHT\nSnow."})
+        data = self.client.get(self.script_url).json()
+        self.assertEqual((data['version_count'], data['latest_version']), (2, new_version.pk))
+        self.assertIn('Snow.', data['versions'][0]['content'])
+
+
+def fake_message(text):
+    usage = SimpleNamespace(
+        input_tokens=10, output_tokens=20, cache_creation_input_tokens=0, cache_read_input_tokens=0
+    )
+    return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage, model='claude-test')
+
+
+@override_settings(
+    BATCH_PROVIDER='scriptwriter.batch_providers.LocalBatchProvider', ANTHROPIC_RATE_LIMIT_RPM=0, ANTHROPIC_RATE_LIMIT_TPM=0
+)
+class BatchJobTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.script = Script.objects.create(user=self.user, title='Heist')
+        self.jobs = [
+            Job.objects.create(
+                user=self.user, job_id=f'job-{n}', job_type='script_generation', prompt=f'Heist {n}',
+                priority='batch', script=self.script if n == 0 else None,
+            )
+            for n in range(2)
+        ]
+
+    def statuses(self):
+        return dict(Job.objects.values_list('job_id', 'status'))
+
+    def test_submit_and_poll(self):
+        self.assertEqual(submit_batch_jobs()['submitted'], 2)
+        batch_ids = set(Job.objects.values_list('batch_id', flat=True))
+        self.assertEqual(len(batch_ids), 1)
+        self.assertTrue(batch_ids.pop().startswith('local_'))
+        self.assertEqual(set(self.statuses().values()), {'running'})
+        # Claimed jobs are not submitted again
+        self.assertEqual(submit_batch_jobs(), {'submitted': 0})
+
+        client = mock.Mock()
+        client.messages.create.side_effect = [fake_message("FADE IN:"), api_error(400)]
+        with mock.patch('scriptwriter.batch_providers.get_client', return_value=client):
+            result = poll_batch_jobs()
+        self.assertEqual((result['completed'], result['failed']), (1, 1))
+        self.assertEqual(self.statuses(), {'job-0': 'completed', 'job-1': 'failed'})
+        self.assertEqual(self.script.versions.get().get_content(), "FADE IN:")
+
+    def test_failed_submission_returns_jobs_to_pending(self):
+        with mock.patch.object(LocalBatchProvider, 'submit', side_effect=api_error(529)):
+            with self.assertRaises(APIStatusError):
+                submit_batch_jobs()
+        self.assertEqual(set(self.statuses().values()), {'pending'})
+        self.assertEqual(set(Job.objects.values_list('batch_id', flat=True)), {''})
+
+    def test_stale_claims_are_reconciled(self):
+        started = timezone.now() - timedelta(seconds=settings.BATCH_CLAIM_TIMEOUT + 1)
+        recorded, lost = self.jobs
+        Job.objects.filter(pk=recorded.pk).update(status='running', batch_id='claim:recorded', started_at=started)
+        Job.objects.filter(pk=lost.pk).update(status='running', batch_id='claim:lost', started_at=started)
+        cache.set('batch-claim:recorded', 'batch-1')
+
+        self.assertEqual(reconcile_batch_claims(), 2)
+        recorded.refresh_from_db()
+        lost.refresh_from_db()
+        self.assertEqual((recorded.status, recorded.batch_id), ('running', 'batch-1'))
+        self.assertEqual((lost.status, lost.batch_id, lost.started_at), ('pending', '', None))
+
+    def test_recent_claims_are_left_alone(self):
+        Job.objects.filter(pk=self.jobs[0].pk).update(status='running', batch_id='claim:busy', started_at=timezone.now())
+        self.assertEqual(reconcile_batch_claims(), 0)
+        self.assertEqual(Job.objects.get(pk=self.jobs[0].pk).batch_id, 'claim:busy')
+
+
+class LongFormTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.script = Script.objects.create(user=self.user, title='Feature')
+        self.parent = Job.objects.create(
+            user=self.user, job_id='feature', job_type='long_form_generation', status='running', prompt='p',
+            script=self.script, segments_total=2,
+        )
+        self.segments = [
+            Job.objects.create(
+                user=self.user, job_id=f'segment-{index}', job_type='segment_generation', prompt=f'p{index}',
+                script=self.script, parent=self.parent, segment_index=index,
+            )
+            for index in (1, 2)
+        ]
+        for target, patcher in [
+            ('stitch', mock.patch.object(stitch_segments_task, 'delay')),
+            ('events', mock.patch('scriptwriter.tasks.publish_job_event')),
+        ]:
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def run_segment(self, job, result):
+        """Run the segment task with the model answering ``result`` (text, or an error to raise)"""
+        if isinstance(result, Exception):
+            stream = mock.patch('scriptwriter.tasks.stream_message', side_effect=result)
+        else:
+            stream = mock.patch('scriptwriter.tasks.stream_message', return_value=fake_message(result))
+        with stream:
+            return generate_segment_task(job.job_id)
+
+    def test_last_segment_hands_off_to_the_stitch(self):
+        # The second sequence finishes first; the version still follows outline order
+        self.run_segment(self.segments[1], "EXT. ROAD - NIGHT\nThe end.")
+        self.stitch.assert_not_called()
+        self.run_segment(self.segments[0], "INT. ROOM - DAY\nThe start.")
+        self.stitch.assert_called_once_with('feature')
+        self.assertIn(
+            mock.call(mock.ANY, 'running', status='running', started_at=mock.ANY), self.events.call_args_list
+        )
+
+        stitch_segments_task(self.parent.job_id)
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.status, 'completed')
+        self.assertEqual(self.parent.output_tokens, 40)
+        self.script.refresh_from_db()
+        self.assertEqual(
+            self.script.get_latest_version().get_content(),
+            "INT. ROOM - DAY\nThe start.\n\nEXT. ROAD - NIGHT\nThe end.\n",
+        )
+
+    def test_failed_segment_fails_the_parent(self):
+        self.run_segment(self.segments[0], api_error(400))
+        self.run_segment(self.segments[1], "EXT. ROAD - NIGHT\nThe end.")
+        self.stitch.assert_called_once_with('feature')
+
+        stitch_segments_task(self.parent.job_id)
+        self.parent.refresh_from_db()
+        self.assertEqual((self.parent.status, self.parent.error_message), ('failed', 'Segments 1 failed'))
+        self.assertEqual(self.script.versions.count(), 0)
+
+
+class SceneBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        text = "".join(f"INT. ROOM {number} - DAY\nScene {number}.\n\n" for number in range(1, 6))
+        self.version = ScriptVersion.objects.append(self.script, text)
+        create_scenes(self.version)
+        for target, patcher in [
+            ('submit', mock.patch.object(scheduler, 'submit')),
+            ('apply', mock.patch.object(apply_scene_batch_task, 'delay')),
+            ('summaries', mock.patch('scriptwriter.tasks.request_scene_summaries')),
+        ]:
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+
+        response = self.client.post(
+            reverse('scriptwriter:version-regenerate-scenes', args=[self.version.pk]),
+            {'prompt': 'Make it rain', 'concurrency': 2}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.parent = Job.objects.get(job_id=response.json()['job_id'])
+        self.children = list(self.parent.children.order_by('segment_index'))
+
+    def submitted(self):
+        return [call.args[0].segment_index for call in self.submit.call_args_list]
+
+    def run_scene(self, child, result):
+        if isinstance(result, Exception):
+            stream = mock.patch('scriptwriter.tasks.stream_message', side_effect=result)
+        else:
+            stream = mock.patch('scriptwriter.tasks.stream_message', return_value=fake_message(result))
+        with stream:
+            generate_batch_scene_task(child.job_id, self.version.pk, 2)
+
+    def test_each_finished_scene_submits_the_next(self):
+        self.assertEqual(self.submitted(), [1, 2])
+        # Scenes finish out of order; each hands its place to the next unsubmitted scene
+        for child, expected in zip([self.children[1], self.children[0], self.children[3], self.children[2]],
+                                   [[1, 2, 3], [1, 2, 3, 4], [1, 2, 3, 4, 5], [1, 2, 3, 4, 5]]):
+            self.run_scene(child, f"INT. ROOM {child.segment_index} - DAY\nRain.")
+            self.assertEqual(self.submitted(), expected)
+        self.apply.assert_not_called()
+
+        self.run_scene(self.children[4], "INT. ROOM 5 - DAY\nRain.")
+        self.apply.assert_called_once_with(self.parent.job_id, self.version.pk)
+
+        apply_scene_batch_task(self.parent.job_id, self.version.pk)
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.status, 'completed')
+        self.assertEqual(self.script.versions.count(), 2)
+
+    def test_one_failed_scene_changes_nothing(self):
+        for child in self.children:
+            self.run_scene(child, api_error(400) if child.segment_index == 3 else "INT. ROOM - DAY\nRain.")
+        self.apply.assert_called_once()
+
+        apply_scene_batch_task(self.parent.job_id, self.version.pk)
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.status, 'failed')
+        self.assertIn('Scenes 3 failed', self.parent.error_message)
+        self.assertEqual(self.script.versions.count(), 1)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        self.first = ScriptVersion.objects.append(self.script, "INT. LIGHTHOUSE - NIGHT\nThe keeper waits.\n")
+        create_scenes(self.first)
+
+    def hits(self, query, **kwargs):
+        return [(hit['kind'], hit['object_id']) for hit in search.search(query, user=self.user, **kwargs)]
+
+    def assertSearches(self):
+        self.assertIn(('version', self.first.pk), self.hits('keeper'))
+        self.assertEqual(self.hits('nobody', kinds=['version']), [])
+
+        second = ScriptVersion.objects.append(self.script, "INT. LIGHTHOUSE - NIGHT\nThe captain arrives.\n")
+        create_scenes(second)
+        scene = second.scenes.get()
+        self.assertCountEqual(self.hits('captain'), [('version', second.pk), ('scene', scene.pk)])
+        # The superseded version and its scene keep only their notes, goal and tension
+        self.assertEqual(self.hits('keeper'), [])
+        self.assertEqual(search.search('captain', user=User.objects.create_user('other')), [])
+
+    def test_sqlite_fts5(self):
+        self.assertTrue(search._sqlite_fts_available('default'))
+        self.assertSearches()
+        self.assertIn('<mark>', search.search('captain', user=self.user)[0]['snippet'])
+
+    def test_icontains_fallback(self):
+        with mock.patch.object(search, '_sqlite_fts_available', return_value=False):
+            self.assertSearches()
+
+
+class TextBlobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.script = Script.objects.create(user=self.user, title='Draft')
+        self.version = ScriptVersion.objects.append(self.script, "INT. ROOM - DAY\nSilence.\n")
+
+    def scene(self, number, **fields):
+        return Scene.objects.create(
+            script_version=self.version, scene_number=number, setting='ROOM', goal='', tension='', **fields
+        )
+
+    def test_identical_texts_share_a_blob(self):
+        first = self.scene(1, content="Anna waits.")
+        second = self.scene(2, content="Anna waits.")
+        self.assertEqual(first.content_blob_id, second.content_blob_id)
+        self.assertEqual(TextBlob.objects.filter(hash=text_hash("Anna waits.")).count(), 1)
+        self.assertEqual(Scene.objects.get(pk=second.pk).content, '')
+        self.assertEqual(Scene.objects.get(pk=second.pk).get_content(), "Anna waits.")
+
+    def test_clearing_content_drops_the_blob(self):
+        scene = self.scene(1, content="Anna waits.")
+        self.client.force_login(self.user)
+        response = self.client.patch(
+            reverse('scriptwriter:scene-detail', args=[scene.pk]), {'content': ''}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['content'], '')
+        scene.refresh_from_db()
+        self.assertIsNone(scene.content_blob_id)
+        self.assertIn(text_hash("Anna waits."), TextBlob.objects.unreferenced().values_list('hash', flat=True))
+
+        # Saving other columns keeps stored text
+        other = self.scene(2, content="Bob leaves.")
+        other.goal = 'Leave'
+        other.save(update_fields=['goal', 'updated_at'])
+        self.assertEqual(Scene.objects.get(pk=other.pk).get_content(), "Bob leaves.")
+
+    def test_backfill_moves_inline_text(self):
+        text = "INT. ROOM - DAY\nSilence.\n"
+        ScriptVersion.objects.filter(pk=self.version.pk).update(content=text, content_blob=None, content_hash='')
+        scene = self.scene(1)
+        Scene.objects.filter(pk=scene.pk).update(content=text)
+        job = Job.objects.create(user=self.user, job_id='job-1', job_type='script_generation', prompt='p', result=text)
+
+        call_command('backfill_text_blobs', batch_size=1, stdout=StringIO())
+        version = ScriptVersion.objects.get(pk=self.version.pk)
+        scene.refresh_from_db()
+        job.refresh_from_db()
+        digest = text_hash(text)
+        self.assertEqual((version.content, version.content_hash, version.content_blob_id), ('', digest, digest))
+        self.assertEqual((scene.content, scene.content_blob_id), ('', digest))
+        self.assertEqual((job.result, job.result_blob_id), ('', digest))
+        self.assertEqual(TextBlob.objects.count(), 1)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.old = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS + 1)
+
+    def job(self, job_id, status='completed', completed_at=None, **fields):
+        return Job.objects.create(
+            user=self.user, job_id=job_id, job_type=fields.pop('job_type', 'script_generation'), prompt='p',
+            status=status, completed_at=completed_at or self.old, **fields
+        )
+
+    def test_archives_old_finished_jobs(self):
+        blob = TextBlob.objects.intern("FADE OUT.")
+        self.job('old', result_blob=blob)
+        self.job('failed', status='failed', error_message='boom')
+        self.job('recent', completed_at=timezone.now())
+        self.job('running', status='running')
+
+        self.assertEqual(archive_finished_jobs(batch_size=1), 2)
+        self.assertCountEqual(Job.objects.values_list('job_id', flat=True), ['recent', 'running'])
+        archived = ArchivedJob.objects.get(job_id='old')
+        self.assertEqual((archived.result_hash, archived.result_size), (blob.hash, len("FADE OUT.")))
+        self.assertEqual(ArchivedJob.objects.get(job_id='failed').error_message, 'boom')
+
+    def test_children_are_archived_with_their_parent(self):
+        parent = self.job('long', job_type='long_form_generation')
+        self.job('outline', job_type='outline_generation', parent=parent)
+        for n in range(2):
+            self.job(f'segment-{n}', job_type='segment_generation', parent=parent, segment_index=n)
+        busy = self.job('busy', job_type='long_form_generation', status='failed')
+        self.job('busy-outline', job_type='outline_generation', status='running', parent=busy)
+
+        self.assertEqual(archive_finished_jobs(batch_size=1), 4)
+        self.assertCountEqual(
+            ArchivedJob.objects.values_list('job_id', flat=True), ['long', 'outline', 'segment-0', 'segment-1']
+        )
+        self.assertCountEqual(Job.objects.values_list('job_id', flat=True), ['busy', 'busy-outline'])
+
+    def test_prunes_only_old_unreferenced_blobs(self):
+        kept = TextBlob.objects.intern("kept")
+        self.job('job', completed_at=timezone.now(), result_blob=kept)
+        stale = TextBlob.objects.intern("stale")
+        fresh = TextBlob.objects.intern("fresh")
+        TextBlob.objects.filter(pk__in=[kept.pk, stale.pk]).update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(prune_text_blobs(batch_size=1), 1)
+        self.assertCountEqual(TextBlob.objects.values_list('hash', flat=True), [kept.hash, fresh.hash])
+
+
+class PartialOutputTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.job = Job.objects.create(user=self.user, job_id='job-1', job_type='script_generation', prompt='p')
+        self.job.start()
+        self.url = reverse('scriptwriter:job_partial', args=['job-1'])
+
+    def read(self, offset):
+        data = self.client.get(self.url, {'offset': offset}).json()
+        return data['text'], data['next_offset']
+
+    def test_byte_offsets_over_multibyte_text(self):
+        buffer = PartialBuffer(self.job)
+        buffer.append("Café ")
+        buffer.append("naïve ☕")
+        text, offset = self.read(0)
+        self.assertEqual(text, "Café naïve ☕")
+        self.assertEqual(offset, len("Café naïve ☕".encode('utf-8')))
+
+        buffer.append(" — fin")
+        self.assertEqual(self.read(offset), (" — fin", offset + len(" — fin".encode('utf-8'))))
+        self.assertEqual(self.read(len("Café ".encode('utf-8'))), ("naïve ☕ — fin", offset + 8))
+
+        # Without the Redis buffer the last DB flush is read with the same offsets
+        buffer.flush()
+        buffer.discard()
+        self.assertEqual(self.read(offset), (" — fin", offset + 8))
+        self.assertEqual(self.read(offset + 8), ("", offset + 8))
+
+    def test_completed_job_reads_its_result(self):
+        complete_script_job(self.job, None, "Ünïcode result")
+        self.assertEqual(self.read(3), ("ïcode result", len("Ünïcode result".encode('utf-8'))))
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis[lua] is not installed")
+@override_settings(GENERATION_MAX_RETRIES=2)
+class AsyncWorkerTests(FakeRedisMixin, TransactionTestCase):
+    # The worker reaches the database from sync_to_async threads, outside a test transaction
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.async_redis = fakeredis.FakeAsyncRedis(server=self.redis_server)
+        # Retry backoff drawn as 0 seconds
+        patcher = mock.patch.object(async_worker.random, 'uniform', return_value=0)
+        self.backoff = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_job(self, job_id):
+        return Job.objects.create(user=self.user, job_id=job_id, job_type='script_generation', prompt='p')
+
+    def entry(self, job_id):
+        return json.dumps({'task': 'scriptwriter.tasks.generate_script_task', 'args': [job_id, 'p']})
+
+    def test_leftover_jobs_are_requeued_first(self):
+        self.redis.rpush(async_worker.queue_key(), self.entry('fresh'))
+        self.redis.rpush(async_worker.processing_key('w1'), self.entry('left-1'), self.entry('left-2'))
+        worker = async_worker.AsyncWorker(concurrency=1, worker_id='w1')
+        handled = []
+
+        async def run_job(client, redis, handler, job_id, *args):
+            handled.append(job_id)
+            if len(handled) == 3:
+                worker.stop()
+
+        with mock.patch.object(async_worker, 'run_job', run_job), \
+                mock.patch.object(async_worker.aioredis.Redis, 'from_url', return_value=self.async_redis), \
+                mock.patch.object(async_worker, 'build_async_client', return_value=mock.AsyncMock()):
+            asyncio.run(worker.run())
+
+        self.assertEqual(handled, ['left-1', 'left-2', 'fresh'])
+        self.assertEqual(self.redis.llen(async_worker.processing_key('w1')), 0)
+        self.assertIsNone(self.redis.get(async_worker.worker_lock_key('w1')))
+
+    def run_job(self, job, *results):
+        handler = mock.AsyncMock(side_effect=results)
+        asyncio.run(async_worker.run_job(None, self.async_redis, handler, job.job_id))
+        job.refresh_from_db()
+        return handler
+
+    def test_transient_error_is_retried_in_place(self):
+        job = self.create_job('job-1')
+        handler = self.run_job(job, api_error(529), None)
+        self.assertEqual(handler.await_count, 2)
+        self.assertEqual(job.status, 'running')
+        self.backoff.assert_called_once_with(0, settings.GENERATION_RETRY_BACKOFF)
+
+    def test_retries_run_out(self):
+        job = self.create_job('job-1')
+        handler = self.run_job(job, api_error(529), api_error(529), api_error(529))
+        self.assertEqual(handler.await_count, 3)
+        self.assertEqual(job.status, 'failed')
+
+    def test_permanent_error_fails_the_job(self):
+        job = self.create_job('job-1')
+        handler = self.run_job(job, api_error(400))
+        self.assertEqual(handler.await_count, 1)
+        self.assertEqual(job.status, 'failed')
+
+
+class MetricsTests(RedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.url = reverse('scriptwriter:metrics')
+
+    def test_render(self):
+        job = Job.objects.create(
+            user=self.user, job_id='job-1', job_type='script_generation', prompt='p', status='completed',
+            model='claude-test', input_tokens=100, output_tokens=50, queue_wait_ms=20, model_time_ms=4000,
+        )
+        metrics.observe_job(job, called_model=True)
+        metrics.observe_job(job, called_model=True)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        labels = 'job_type="script_generation",model="claude-test"'
+        self.assertIn(f'spielberg_jobs_total{{{labels},status="completed"}} 2', lines)
+        self.assertIn(f'spielberg_tokens_total{{{labels},kind="output"}} 100', lines)
+        self.assertIn(f'spielberg_queue_wait_seconds_bucket{{{labels},le="0.025"}} 2', lines)
+        self.assertIn(f'spielberg_model_time_seconds_bucket{{{labels},le="2.5"}} 0', lines)
+        self.assertIn(f'spielberg_model_time_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f'spielberg_model_time_seconds_sum{{{labels}}} 8', lines)
+
+    def test_redis_unavailable(self):
+        with mock.patch.object(metrics, 'get_redis', side_effect=RedisConnectionError('down')):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(METRICS_TOKEN='secret-token')
+    def test_token_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret-token')
+        self.assertEqual(response.status_code, 200)
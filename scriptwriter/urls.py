@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import events, views
 
 app_name = 'scriptwriter'
 
@@ -18,6 +18,7 @@ urlpatterns = [
     
     # Health check
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.metrics, name='metrics'),
     
     # Script viewer
     path('viewer/', views.script_viewer, name='script_viewer'),
@@ -26,6 +27,17 @@ urlpatterns = [
     path('api/jobs/create/', views.create_job, name='create_job'),
     path('api/jobs/<str:job_id>/status/', views.job_status, name='job_status'),
     path('api/jobs/<str:job_id>/result/', views.job_result, name='job_result'),
+    path('api/jobs/<str:job_id>/partial/', views.job_partial, name='job_partial'),
+    
+    # Per-user job event stream (Server-Sent Events, ASGI only)
+    path('api/events/', events.job_events, name='job_events'),
+    
+    # Payload cache counters (staff only)
+    path('api/cache/stats/', views.cache_stats, name='cache_stats'),
+    path('api/scheduler/stats/', views.scheduler_stats, name='scheduler_stats'),
+    
+    # Full-text search
+    path('api/search/', views.search, name='search'),
     
     # REST API endpoints
     path('api/', include(router.urls)),
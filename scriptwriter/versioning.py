@@ -0,0 +1,90 @@
+"""
+Delta encoding for script version storage.
+
+Only the newest version of a script and periodic keyframes keep their full
+text. Every other version stores a reverse delta against the version that
+follows it, so older versions are rebuilt by walking forward to the nearest
+full copy and applying deltas backwards.
+"""
+import difflib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class MissingFullText(ValueError):
+    """No full copy is left to rebuild a delta-encoded version from"""
+
+
+def keyframe_interval():
+    """Number of versions between full-text keyframes"""
+    return max(1, getattr(settings, 'SCRIPT_VERSION_KEYFRAME_INTERVAL', 20))
+
+
+def is_keyframe(version_number):
+    """Keyframes are versions 1, N+1, 2N+1, ..."""
+    return (version_number - 1) % keyframe_interval() == 0
+
+
+def make_delta(base, target):
+    """
+    Build a delta that turns ``base`` into ``target``.
+
+    The delta is a JSON list of line operations: ``[start, end]`` copies
+    lines from the base text and a string inserts literal text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(target_lines[j1:j2]))
+    return json.dumps(ops, separators=(',', ':'))
+
+
+def apply_delta(base, delta):
+    """Rebuild the target text from ``base`` and a delta from ``make_delta``"""
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(delta):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+
+class RebuiltTextCache:
+    """Small thread-safe LRU of rebuilt version texts, keyed by version id"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+rebuilt_texts = RebuiltTextCache(getattr(settings, 'SCRIPT_VERSION_CACHE_SIZE', 128))
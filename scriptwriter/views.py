@@ -1,21 +1,46 @@
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import Count, F, Prefetch
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
+from redis.exceptions import RedisError
+import hmac
+import ipaddress
 import json
+import logging
 import uuid
-from anthropic import Anthropic
-from .models import ScriptProject, Character, Script, ScriptVersion, Scene, Job
+from functools import partial
+from .models import ScriptProject, Character, Script, ScriptVersion, Scene, Job, SearchEntry
+from .anthropic_clients import get_client
+from .events import publish_job_event
+from .etags import conditional_response, job_etag, script_etag, version_etag
+from .fieldsets import SparseFieldsViewMixin
+from .metrics import render as render_metrics
+from .payload_cache import CachedRetrieveMixin, stats as payload_cache_stats
+from . import scheduler, status_cache
+from .prompts import get_script_writing_system_prompt
+from .pagination import CreatedAtCursorPagination, UpdatedAtCursorPagination
 from .serializers import (
-    CharacterSerializer, ScriptSerializer, ScriptVersionSerializer, 
-    SceneSerializer, JobSerializer, JobCreateSerializer
+    CharacterSerializer, ScriptSerializer, ScriptSummarySerializer, ScriptVersionSerializer, 
+    SceneSerializer, JobSerializer, JobCreateSerializer, SceneBatchRegenerateSerializer
 )
-from .tasks import generate_script_task, generate_scene_task
+from .screenplay import create_scenes
+from .streaming import read_partial
+from .search import search as full_text_search
+from .tasks import (
+    complete_job_from_cache, dispatch_scene_batch, generate_long_form_task, generate_script_task, generate_scene_task,
+    request_scene_summaries,
+)
+from .versioning import MissingFullText
+
+logger = logging.getLogger(__name__)
 
 
 @ensure_csrf_cookie
@@ -35,26 +60,109 @@ def health_check(request):
     return JsonResponse({'status': 'healthy', 'service': 'spielberg'})
 
 
+def _metrics_allowed(request):
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'.encode()
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected)
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(net.strip(), strict=False) for net in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics(request):
+    """
+    Generation telemetry for Prometheus to scrape (see METRICS_TOKEN and METRICS_ALLOWED_IPS).
+    
+    Answers 503 while Redis is unavailable, so the scrape shows as down
+    instead of as counters that went back to zero.
+    """
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden()
+    try:
+        exposition = render_metrics()
+    except RedisError as e:
+        logger.warning("Could not read metrics from Redis: %s", e)
+        return HttpResponse('Metrics unavailable\n', status=503, content_type='text/plain; charset=utf-8')
+    return HttpResponse(exposition, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # ============================================================================
 # REST API ViewSets
 # ============================================================================
 
-class CharacterViewSet(viewsets.ModelViewSet):
+class VersionTextErrorMixin:
+    """Answer with an error instead of a traceback when a version's text cannot be rebuilt"""
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, MissingFullText):
+            logger.error("%s", exc)
+            return Response({
+                'error': 'The text of this script version cannot be rebuilt'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return super().handle_exception(exc)
+
+
+class CharacterViewSet(CachedRetrieveMixin, viewsets.ModelViewSet):
     """ViewSet for managing characters"""
     serializer_class = CharacterSerializer
     permission_classes = [IsAuthenticated]
+    cache_kind = 'character'
     
     def get_queryset(self):
         return Character.objects.filter(user=self.request.user)
 
 
-class ScriptViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing scripts"""
+class ScriptViewSet(VersionTextErrorMixin, SparseFieldsViewMixin, CachedRetrieveMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for managing scripts.
+    
+    Lists use the lightweight summary representation; detail returns the full
+    tree. Both accept ``?fields=`` and ``?expand=``.
+    """
     serializer_class = ScriptSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UpdatedAtCursorPagination
+    cache_kind = 'script'
+    heavy_fields = {'logline': ['logline']}
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ScriptSummarySerializer
+        return ScriptSerializer
     
     def get_queryset(self):
-        return Script.objects.filter(user=self.request.user).prefetch_related('characters', 'versions')
+        queryset = Script.objects.filter(user=self.request.user)
+        
+        if self.action == 'list':
+            queryset = queryset.only(
+                'id', 'user', 'title', 'genre', 'tone', 'logline', 'latest_version',
+                'version_count', 'created_at', 'updated_at'
+            ).annotate(
+                latest_version_number=F('latest_version__version_number'),
+                scene_count=Count('latest_version__scenes', distinct=True),
+                character_count=Count('characters', distinct=True),
+            )
+        elif self.action == 'retrieve':
+            queryset = queryset.select_related('latest_version').defer(
+                'latest_version__content', 'latest_version__delta', 'latest_version__notes'
+            )
+        
+        if self.action in ('list', 'retrieve'):
+            if self.is_rendered('characters'):
+                queryset = queryset.prefetch_related('characters')
+            if self.is_rendered('versions'):
+                versions = ScriptVersion.objects.select_related('content_blob').prefetch_related(
+                    Prefetch('scenes', queryset=Scene.objects.select_related('content_blob'))
+                )
+                queryset = queryset.prefetch_related(Prefetch('versions', queryset=versions))
+        
+        return self.defer_unrendered(queryset)
+    
+    def retrieve(self, request, *args, **kwargs):
+        etag = script_etag(request.user, kwargs['pk'])
+        return conditional_response(request, etag, partial(super().retrieve, request, *args, **kwargs))
     
     @action(detail=True, methods=['post'])
     def create_version(self, request, pk=None):
@@ -63,15 +171,9 @@ class ScriptViewSet(viewsets.ModelViewSet):
         content = request.data.get('content', '')
         notes = request.data.get('notes', '')
         
-        latest_version = script.get_latest_version()
-        version_number = (latest_version.version_number + 1) if latest_version else 1
-        
-        version = ScriptVersion.objects.create(
-            script=script,
-            version_number=version_number,
-            content=content,
-            notes=notes
-        )
+        version = ScriptVersion.objects.append(script, content, notes=notes)
+        if create_scenes(version, content):
+            request_scene_summaries(version.pk)
         
         serializer = ScriptVersionSerializer(version)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -80,18 +182,35 @@ class ScriptViewSet(viewsets.ModelViewSet):
     def versions(self, request, pk=None):
         """Get all versions for a script"""
         script = self.get_object()
-        versions = script.versions.all()
-        serializer = ScriptVersionSerializer(versions, many=True)
+        versions = script.versions.select_related('content_blob').prefetch_related(
+            Prefetch('scenes', queryset=Scene.objects.select_related('content_blob'))
+        )
+        serializer = ScriptVersionSerializer(versions, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
 
 
-class ScriptVersionViewSet(viewsets.ReadOnlyModelViewSet):
+class ScriptVersionViewSet(VersionTextErrorMixin, SparseFieldsViewMixin, CachedRetrieveMixin,
+                           viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing script versions"""
     serializer_class = ScriptVersionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    cache_kind = 'version'
+    heavy_fields = {'content': ['content', 'delta'], 'notes': ['notes']}
     
     def get_queryset(self):
-        return ScriptVersion.objects.filter(script__user=self.request.user)
+        queryset = ScriptVersion.objects.filter(script__user=self.request.user)
+        if self.is_rendered('content'):
+            queryset = queryset.select_related('content_blob')
+        if self.is_rendered('scenes'):
+            queryset = queryset.prefetch_related(
+                Prefetch('scenes', queryset=Scene.objects.select_related('content_blob'))
+            )
+        return self.defer_unrendered(queryset)
+    
+    def retrieve(self, request, *args, **kwargs):
+        etag = version_etag(request.user, kwargs['pk'])
+        return conditional_response(request, etag, partial(super().retrieve, request, *args, **kwargs))
     
     @action(detail=True, methods=['post'])
     def create_scene(self, request, pk=None):
@@ -106,70 +225,210 @@ class ScriptVersionViewSet(viewsets.ReadOnlyModelViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['post'])
+    def parse_scenes(self, request, pk=None):
+        """Split a version's screenplay text into Scene rows by INT./EXT. headings"""
+        version = self.get_object()
+        if version.scenes.exists():
+            return Response({'error': 'This version already has scenes'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        scenes = create_scenes(version)
+        if scenes:
+            request_scene_summaries(version.pk)
+        serializer = SceneSerializer(scenes, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def regenerate_scenes(self, request, pk=None):
+        """
+        Rewrite many scenes of a version as one parent job.
+        
+        Scenes are generated with bounded concurrency; when all of them
+        succeed they are written together as a new version, otherwise
+        nothing changes.
+        """
+        version = self.get_object()
+        serializer = SceneBatchRegenerateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        scenes = Scene.objects.filter(script_version=version)
+        if 'scene_ids' in data:
+            scenes = scenes.filter(pk__in=data['scene_ids'])
+        if 'scene_numbers' in data:
+            scenes = scenes.filter(scene_number__in=data['scene_numbers'])
+        if 'setting' in data:
+            scenes = scenes.filter(setting__icontains=data['setting'])
+        if 'tone' in data:
+            scenes = scenes.filter(tone__iexact=data['tone'])
+        scenes = list(scenes.only('id', 'scene_number').order_by('scene_number'))
+        if not scenes:
+            return Response({'error': 'No scenes match'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        prompt = data['prompt']
+        with transaction.atomic():
+            job, created = Job.objects.create_idempotent(
+                request.user,
+                idempotency_key,
+                job_id=str(uuid.uuid4()),
+                job_type='scene_batch_regeneration',
+                status='pending',
+                prompt=prompt,
+                script_id=version.script_id,
+                segments_total=len(scenes),
+            )
+            if not created:
+                return _replayed_job_response(job, JobSerializer(job).data, prompt=prompt, script_id=version.script_id)
+            children = Job.objects.bulk_create([
+                Job(
+                    user=request.user,
+                    job_id=str(uuid.uuid4()),
+                    job_type='scene_generation',
+                    status='pending',
+                    prompt=prompt,
+                    script_id=version.script_id,
+                    scene=scene,
+                    parent=job,
+                    segment_index=scene.scene_number,
+                )
+                for scene in scenes
+            ])
+        
+        publish_job_event(job, 'queued', status=job.status, job_type=job.job_type, created_at=job.created_at)
+        dispatch_scene_batch(job, children, version.pk, data['concurrency'])
+        
+        return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 
-class SceneViewSet(viewsets.ModelViewSet):
+class SceneViewSet(VersionTextErrorMixin, SparseFieldsViewMixin, CachedRetrieveMixin, viewsets.ModelViewSet):
     """ViewSet for managing scenes"""
     serializer_class = SceneSerializer
     permission_classes = [IsAuthenticated]
+    cache_kind = 'scene'
+    heavy_fields = {'content': ['content'], 'goal': ['goal'], 'tension': ['tension']}
     
     def get_queryset(self):
-        return Scene.objects.filter(script_version__script__user=self.request.user)
+        queryset = Scene.objects.filter(script_version__script__user=self.request.user)
+        if self.is_rendered('content'):
+            # Parsed scenes slice their text out of the version
+            queryset = queryset.select_related('content_blob', 'script_version__content_blob')
+        return self.defer_unrendered(queryset)
     
     @action(detail=True, methods=['post'])
     def regenerate(self, request, pk=None):
         """Regenerate a scene using AI"""
         scene = self.get_object()
         prompt = request.data.get('prompt', 'Regenerate this scene with improvements.')
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create a job for scene regeneration
-        job_id = str(uuid.uuid4())
-        job = Job.objects.create(
-            user=request.user,
-            job_id=job_id,
+        # Create a job for scene regeneration, or find the one this key already created
+        job, created = Job.objects.create_idempotent(
+            request.user,
+            idempotency_key,
+            job_id=str(uuid.uuid4()),
             job_type='scene_generation',
             status='pending',
             prompt=prompt,
             scene=scene
         )
+        if not created:
+            return _replayed_job_response(job, JobSerializer(job).data, prompt=prompt, scene_id=scene.pk)
+        
+        # Reuse an identical earlier generation if the caller allows it
+        if request.data.get('allow_cached') in (True, 'true', '1') and complete_job_from_cache(job):
+            return Response(JobSerializer(job).data, status=status.HTTP_200_OK)
         
-        # Enqueue Celery task
-        generate_scene_task.delay(job_id, scene.id, prompt)
+        # Queue behind the user's other scene jobs; sent to celery when it is their turn
+        publish_job_event(job, 'queued', status=job.status, job_type=job.job_type, created_at=job.created_at)
+        scheduler.submit(job, generate_scene_task, job.job_id, scene.id, prompt)
         
         serializer = JobSerializer(job)
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
-class JobViewSet(viewsets.ReadOnlyModelViewSet):
+# Fields of JobViewSet.status
+STATUS_FIELDS = ('job_id', 'status', 'created_at', 'started_at', 'completed_at')
+
+
+class JobViewSet(SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing job status"""
     serializer_class = JobSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    heavy_fields = {'prompt': ['prompt'], 'result': ['result'], 'error_message': ['error_message']}
     
     def get_queryset(self):
-        return Job.objects.filter(user=self.request.user)
+        queryset = Job.objects.filter(user=self.request.user).defer('partial_result')
+        if self.action == 'list':
+            # Outline and segment jobs are listed under their parent (see children)
+            queryset = queryset.filter(parent__isnull=True)
+        if self.is_rendered('result'):
+            queryset = queryset.select_related('result_blob')
+        return self.defer_unrendered(queryset)
+    
+    @action(detail=True, methods=['get'])
+    def children(self, request, pk=None):
+        """Outline and segment jobs of a long-form job, in order"""
+        job = self.get_object()
+        children = (
+            job.children
+            .order_by(F('segment_index').asc(nulls_first=True), 'created_at')
+            .only('id', 'job_id', 'job_type', 'status', 'segment_index', 'error_message',
+                  'created_at', 'started_at', 'completed_at')
+        )
+        return Response([
+            {
+                'job_id': child.job_id,
+                'job_type': child.job_type,
+                'status': child.status,
+                'segment_index': child.segment_index,
+                'error': child.error_message,
+                'started_at': child.started_at,
+                'completed_at': child.completed_at,
+            }
+            for child in children
+        ])
+    
+    def retrieve(self, request, *args, **kwargs):
+        etag = job_etag(request.user, pk=kwargs['pk'])
+        return conditional_response(request, etag, partial(super().retrieve, request, *args, **kwargs))
     
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
-        """Get the status of a job"""
+        """Get the status of a job, from its Redis status record when there is one"""
+        record = status_cache.read(request.user, pk=pk)
+        if record is not None:
+            return conditional_response(
+                request, status_cache.record_etag(record), partial(Response, {field: record[field] for field in STATUS_FIELDS})
+            )
+        return conditional_response(request, job_etag(request.user, pk=pk), partial(self._status, request))
+    
+    def _status(self, request):
         job = self.get_object()
-        return Response({
-            'job_id': job.job_id,
-            'status': job.status,
-            'created_at': job.created_at,
-            'started_at': job.started_at,
-            'completed_at': job.completed_at,
-        })
+        status_cache.fill(job)
+        return Response({field: getattr(job, field) for field in STATUS_FIELDS})
     
     @action(detail=True, methods=['get'])
     def result(self, request, pk=None):
         """Get the result of a completed job"""
+        return conditional_response(request, job_etag(request.user, pk=pk), partial(self._result, request))
+    
+    def _result(self, request):
         job = self.get_object()
         
         if job.status == 'completed':
             return Response({
                 'job_id': job.job_id,
                 'status': job.status,
-                'result': job.result,
+                'result': job.get_result(),
             })
         elif job.status == 'failed':
             return Response({
@@ -189,6 +448,22 @@ class JobViewSet(viewsets.ReadOnlyModelViewSet):
 # Job Creation API
 # ============================================================================
 
+IDEMPOTENCY_KEY_MAX_LENGTH = Job._meta.get_field('idempotency_key').max_length
+
+
+def _replayed_job_response(job, data, **expected):
+    """
+    Answer a repeated Idempotency-Key with the job it created, unless the
+    request parameters differ from the original's.
+    """
+    if any(getattr(job, name) != value for name, value in expected.items()):
+        return Response(
+            {'error': 'Idempotency-Key was already used with different parameters'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Idempotent-Replayed': 'true'})
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_job(request):
@@ -204,24 +479,59 @@ def create_job(request):
     script_id = data.get('script_id')
     scene_id = data.get('scene_id')
     script_type = data.get('script_type', 'screenplay')
+    priority = data['priority']
+    
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return Response({'error': 'Idempotency-Key is too long'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Create job
-    job_id = str(uuid.uuid4())
-    job = Job.objects.create(
-        user=request.user,
-        job_id=job_id,
+    # Create job, or find the one an earlier request with the same key created
+    job, created = Job.objects.create_idempotent(
+        request.user,
+        idempotency_key,
+        job_id=str(uuid.uuid4()),
         job_type=job_type,
         status='pending',
         prompt=prompt,
+        script_type=script_type,
+        priority=priority,
         script_id=script_id,
         scene_id=scene_id
     )
+    if not created:
+        return _replayed_job_response(
+            job,
+            {'job_id': job.job_id, 'status': job.status, 'message': 'Job already created for this Idempotency-Key'},
+            job_type=job_type, prompt=prompt, script_id=script_id, scene_id=scene_id, priority=priority,
+        )
     
-    # Enqueue appropriate task
+    # Reuse an identical earlier generation if the caller allows it
+    if data['allow_cached'] and complete_job_from_cache(job, script_type):
+        return Response({
+            'job_id': job.job_id,
+            'status': job.status,
+            'message': 'Job completed from a cached generation'
+        }, status=status.HTTP_200_OK)
+    
+    if priority == 'batch':
+        # Picked up by submit_batch_jobs on its next run
+        publish_job_event(job, 'queued', status=job.status, job_type=job.job_type, created_at=job.created_at)
+        return Response({
+            'job_id': job.job_id,
+            'status': job.status,
+            'message': 'Job created and queued for the next batch submission'
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    # Queued before it is sent, so no event of the running task can precede this one
+    publish_job_event(job, 'queued', status=job.status, job_type=job.job_type, created_at=job.created_at)
+    
+    # Queue the appropriate task in the job's lane; sent to celery when it is the user's turn
     if job_type == 'scene_generation' and scene_id:
-        generate_scene_task.delay(job_id, scene_id, prompt)
+        scheduler.submit(job, generate_scene_task, job.job_id, scene_id, prompt)
+    elif job_type == 'long_form_generation':
+        scheduler.submit(job, generate_long_form_task, job.job_id, prompt, script_id, data.get('segments'))
     else:
-        generate_script_task.delay(job_id, prompt, script_id, script_type)
+        scheduler.submit(job, generate_script_task, job.job_id, prompt, script_id, script_type)
     
     return Response({
         'job_id': job.job_id,
@@ -233,9 +543,24 @@ def create_job(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def job_status(request, job_id):
-    """Get the status of a job by job_id"""
+    """
+    Get the status of a job by job_id.
+    
+    The ETag comes from the job's Redis status record when there is one, so
+    a client polling an unchanged job gets a 304 without a database query.
+    """
+    record = status_cache.read(request.user, job_id=job_id)
+    if record is None:
+        etag = job_etag(request.user, job_id=job_id)
+    else:
+        etag = status_cache.record_etag(record)
+    return conditional_response(request, etag, partial(_job_status, request, job_id))
+
+
+def _job_status(request, job_id):
     try:
-        job = Job.objects.get(job_id=job_id, user=request.user)
+        job = Job.objects.select_related('result_blob').get(job_id=job_id, user=request.user)
+        status_cache.fill(job)
         serializer = JobSerializer(job)
         return Response(serializer.data)
     except Job.DoesNotExist:
@@ -246,6 +571,12 @@ def job_status(request, job_id):
 @permission_classes([IsAuthenticated])
 def job_result(request, job_id):
     """Get the result of a completed job"""
+    return conditional_response(
+        request, job_etag(request.user, job_id=job_id), partial(_job_result, request, job_id)
+    )
+
+
+def _job_result(request, job_id):
     try:
         job = Job.objects.get(job_id=job_id, user=request.user)
         
@@ -253,7 +584,7 @@ def job_result(request, job_id):
             return Response({
                 'job_id': job.job_id,
                 'status': job.status,
-                'result': job.result,
+                'result': job.get_result(),
                 'script': job.script.id if job.script else None,
             })
         elif job.status == 'failed':
@@ -272,6 +603,93 @@ def job_result(request, job_id):
         return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_partial(request, job_id):
+    """
+    Get the output a job has streamed so far.
+    
+    ``?offset=N`` is the ``next_offset`` of the previous call; only text
+    after it is returned.
+    """
+    try:
+        offset = int(request.query_params.get('offset', 0))
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        return Response({'error': 'offset must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        job = Job.objects.select_related('result_blob').get(job_id=job_id, user=request.user)
+    except Job.DoesNotExist:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    text, next_offset = read_partial(job, offset)
+    return Response({
+        'job_id': job.job_id,
+        'status': job.status,
+        'offset': offset,
+        'next_offset': next_offset,
+        'text': text,
+        'done': job.status in ('completed', 'failed'),
+    })
+
+
+# ============================================================================
+# Payload Cache API
+# ============================================================================
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """Hit and miss counters of the API payload cache"""
+    return Response(payload_cache_stats())
+
+
+# ============================================================================
+# Scheduler API
+# ============================================================================
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def scheduler_stats(request):
+    """Per-lane queue depths of the fair-share job scheduler"""
+    return Response(scheduler.lane_stats())
+
+
+# ============================================================================
+# Search API
+# ============================================================================
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search(request):
+    """Ranked full-text search across the user's scripts, versions, scenes and characters"""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Query parameter q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    valid_kinds = {kind for kind, _ in SearchEntry.KIND_CHOICES}
+    kinds = [kind for kind in request.query_params.get('kind', '').split(',') if kind in valid_kinds]
+    
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    
+    # Fetch one extra hit to know whether there is a next page without counting
+    hits = full_text_search(query, user=request.user, kinds=kinds, limit=page_size + 1,
+                            offset=(page - 1) * page_size)
+    
+    return Response({
+        'query': query,
+        'page': page,
+        'has_next': len(hits) > page_size,
+        'results': hits[:page_size],
+    })
+
+
 # ============================================================================
 # Legacy API Endpoints (for backwards compatibility)
 # ============================================================================
@@ -290,8 +708,8 @@ def generate_script(request):
                 'error': 'API key and prompt are required'
             }, status=400)
         
-        # Initialize Claude AI client
-        client = Anthropic(api_key=api_key)
+        # Claude AI client for this key, reused across requests
+        client = get_client(api_key)
         
         # System prompt for script writing
         system_prompt = get_script_writing_system_prompt(script_type)
@@ -347,82 +765,3 @@ def save_script(request):
         return JsonResponse({
             'error': str(e)
         }, status=500)
-
-
-def get_script_writing_system_prompt(script_type):
-    """Get the system prompt for script writing based on type"""
-    
-    base_prompt = """You are an expert screenwriter and script consultant with deep knowledge of storytelling, 
-    character development, and screenplay formatting. You understand the principles of dramatic structure, 
-    including the three-act structure, character arcs, and compelling dialogue."""
-    
-    if script_type == 'screenplay':
-        return base_prompt + """
-
-SCREENPLAY FORMAT RULES:
-1. Use proper screenplay formatting with scene headings, action lines, character names, and dialogue
-2. Scene headings: INT./EXT. LOCATION - TIME OF DAY (e.g., INT. COFFEE SHOP - DAY)
-3. Action lines: Present tense, active voice, describing what we see and hear
-4. Character names: ALL CAPS when they first appear and above dialogue
-5. Dialogue: Character name centered, dialogue below
-6. Parentheticals: Brief direction for how a line should be delivered
-7. Transitions: FADE IN:, CUT TO:, FADE OUT: (use sparingly)
-
-STORYTELLING PRINCIPLES:
-- Strong opening hook that establishes the world and protagonist
-- Clear character motivations and goals
-- Rising tension and conflict
-- Well-paced scenes with purpose
-- Subtext in dialogue - show don\'t tell
-- Visual storytelling over exposition
-- Satisfying character arcs
-- Three-act structure: Setup, Confrontation, Resolution
-
-Generate professional, properly formatted screenplay content. Focus on vivid visual storytelling, 
-authentic dialogue, and compelling character development."""
-    
-    elif script_type == 'treatment':
-        return base_prompt + """
-
-TREATMENT FORMAT:
-- Write in present tense, third person
-- Describe the story chronologically from beginning to end
-- Include major plot points, character arcs, and turning points
-- Paint a vivid picture of the story world
-- Convey the tone and style of the piece
-- No dialogue, just narrative description
-- 3-5 pages for a short treatment, 10-30 for a full treatment
-
-Focus on compelling story structure and emotional journey."""
-    
-    else:  # outline
-        return base_prompt + """
-
-OUTLINE FORMAT:
-- Organized by acts and sequences
-- Clear beat sheet of major story moments
-- Character introductions and arc progressions
-- Key plot points and turning points
-- Theme development
-- Conflict escalation
-
-Structure:
-ACT ONE: Setup
-- Opening Image
-- Inciting Incident
-- First Plot Point
-
-ACT TWO: Confrontation
-- Rising Action
-- Midpoint
-- Complications
-- Crisis
-
-ACT THREE: Resolution
-- Climax
-- Falling Action
-- Resolution
-- Closing Image
-
-Provide a comprehensive story outline with dramatic beats."""
-
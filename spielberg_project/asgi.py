@@ -3,6 +3,10 @@ ASGI config for spielberg_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Production runs this app (gunicorn with uvicorn workers, see Dockerfile) so
+the long-lived job event stream at /api/events/ is held by the event loop
+instead of occupying a worker per connection.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 import os
 
@@ -47,7 +48,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'django_celery_results',
     'django_celery_beat',
     'scriptwriter',
 ]
@@ -164,14 +164,146 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0')
-CELERY_RESULT_BACKEND = 'django-db'
+# Job rows hold results and statuses (scriptwriter/status_cache.py serves status polling) and
+# no task reads another's return value, so there is no result backend and results are not stored
+CELERY_TASK_IGNORE_RESULT = True
 CELERY_CACHE_BACKEND = 'default'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
-CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
-CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
+# Generation tasks hold a worker for minutes of network I/O: take one message at a time and
+# acknowledge it only once it has run, so a killed worker's task is redelivered
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Unacknowledged messages are redelivered after this; longer than any task plus retry countdown
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 2 * 60 * 60}
+# One queue per lane, so quick scene rewrites never wait behind long scripts
+# (scriptwriter/scheduler.py decides when each user's jobs enter their queue)
+CELERY_TASK_DEFAULT_QUEUE = 'maintenance'
+CELERY_TASK_ROUTES = {
+    'scriptwriter.tasks.generate_scene_task': {'queue': 'scenes'},
+    'scriptwriter.tasks.generate_batch_scene_task': {'queue': 'scenes'},
+    'scriptwriter.tasks.apply_scene_batch_task': {'queue': 'scenes'},
+    'scriptwriter.tasks.generate_script_task': {'queue': 'scripts'},
+    'scriptwriter.tasks.generate_long_form_task': {'queue': 'long-form'},
+    'scriptwriter.tasks.generate_segment_task': {'queue': 'long-form'},
+    'scriptwriter.tasks.stitch_segments_task': {'queue': 'long-form'},
+    'scriptwriter.tasks.submit_batch_jobs': {'queue': 'batch'},
+    'scriptwriter.tasks.poll_batch_jobs': {'queue': 'batch'},
+}
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'archive-old-jobs': {
+        'task': 'scriptwriter.tasks.archive_old_jobs',
+        'schedule': crontab(minute=15),  # hourly
+    },
+    'submit-batch-jobs': {
+        'task': 'scriptwriter.tasks.submit_batch_jobs',
+        'schedule': crontab(),  # every minute
+    },
+    'poll-batch-jobs': {
+        'task': 'scriptwriter.tasks.poll_batch_jobs',
+        'schedule': crontab(),  # every minute
+    },
+    'dispatch-jobs': {
+        'task': 'scriptwriter.tasks.dispatch_jobs',
+        'schedule': crontab(),  # every minute
+    },
+}
+
+# Job retention: finished jobs older than this move to ArchivedJob in bounded batches
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 30))
+JOB_ARCHIVE_BATCH_SIZE = int(os.environ.get('JOB_ARCHIVE_BATCH_SIZE', 500))
+JOB_ARCHIVE_MAX_BATCHES = int(os.environ.get('JOB_ARCHIVE_MAX_BATCHES', 20))
+
+# Anthropic API clients, shared per process (scriptwriter/anthropic_clients.py)
+ANTHROPIC_MAX_CONNECTIONS = int(os.environ.get('ANTHROPIC_MAX_CONNECTIONS', 20))
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS', 10))
+ANTHROPIC_KEEPALIVE_EXPIRY = float(os.environ.get('ANTHROPIC_KEEPALIVE_EXPIRY', 60))
+ANTHROPIC_TIMEOUT = float(os.environ.get('ANTHROPIC_TIMEOUT', 600))
+ANTHROPIC_CONNECT_TIMEOUT = float(os.environ.get('ANTHROPIC_CONNECT_TIMEOUT', 10))
+# SDK retries for calls with no retry of their own (legacy endpoint, scene summaries, batches).
+# Generation tasks and the async worker make none: they retry behind the rate limiter instead
+ANTHROPIC_MAX_RETRIES = int(os.environ.get('ANTHROPIC_MAX_RETRIES', 2))
+# Clients kept for per-request keys sent to the legacy /api/generate/ endpoint
+ANTHROPIC_CLIENT_CACHE_SIZE = int(os.environ.get('ANTHROPIC_CLIENT_CACHE_SIZE', 8))
+
+# Cluster-wide Anthropic rate limits shared by all workers (scriptwriter/rate_limit.py), set to
+# the account's limits; 0 turns a limit off. Requests wait at most ANTHROPIC_RATE_LIMIT_MAX_WAIT seconds.
+ANTHROPIC_RATE_LIMIT_RPM = int(os.environ.get('ANTHROPIC_RATE_LIMIT_RPM', 50))
+ANTHROPIC_RATE_LIMIT_TPM = int(os.environ.get('ANTHROPIC_RATE_LIMIT_TPM', 80000))
+ANTHROPIC_RATE_LIMIT_MAX_WAIT = float(os.environ.get('ANTHROPIC_RATE_LIMIT_MAX_WAIT', 300))
+
+# Generation tasks retry rate limit, overloaded, server and connection errors with jittered
+# exponential backoff starting at GENERATION_RETRY_BACKOFF seconds
+GENERATION_MAX_RETRIES = int(os.environ.get('GENERATION_MAX_RETRIES', 5))
+GENERATION_RETRY_BACKOFF = int(os.environ.get('GENERATION_RETRY_BACKOFF', 5))
+GENERATION_RETRY_BACKOFF_MAX = int(os.environ.get('GENERATION_RETRY_BACKOFF_MAX', 600))
+
+# Exact-match generation cache, used when job creation passes allow_cached
+GENERATION_CACHE_TIMEOUT = int(os.environ.get('GENERATION_CACHE_TIMEOUT', 7 * 24 * 60 * 60))
+
+# Long-form generation: outline sequences generated concurrently, then stitched
+LONG_FORM_DEFAULT_SEGMENTS = int(os.environ.get('LONG_FORM_DEFAULT_SEGMENTS', 8))
+LONG_FORM_MAX_SEGMENTS = int(os.environ.get('LONG_FORM_MAX_SEGMENTS', 24))
+
+# Batch scene regeneration: scenes generated at once per batch (default and upper bound)
+SCENE_BATCH_DEFAULT_CONCURRENCY = int(os.environ.get('SCENE_BATCH_DEFAULT_CONCURRENCY', 4))
+SCENE_BATCH_MAX_CONCURRENCY = int(os.environ.get('SCENE_BATCH_MAX_CONCURRENCY', 8))
+
+# Fair-share scheduling: generation jobs a user may have sent to celery at once, per lane
+SCHEDULER_MAX_IN_FLIGHT_PER_USER = int(os.environ.get('SCHEDULER_MAX_IN_FLIGHT_PER_USER', 2))
+
+# Lanes whose script and scene jobs run on the asyncio worker (manage.py run_async_worker)
+# instead of celery, and how many generations one async worker process runs at once
+ASYNC_GENERATION_LANES = [lane for lane in os.environ.get('ASYNC_GENERATION_LANES', '').split(',') if lane]
+ASYNC_WORKER_CONCURRENCY = int(os.environ.get('ASYNC_WORKER_CONCURRENCY', 200))
+
+# Batch-priority jobs, submitted together as Message Batches (scriptwriter/batch_providers.py).
+# LocalBatchProvider answers batches with ordinary requests when no batch API is available.
+BATCH_PROVIDER = os.environ.get('BATCH_PROVIDER', 'scriptwriter.batch_providers.AnthropicBatchProvider')
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 1000))
+BATCH_LOCAL_TIMEOUT = int(os.environ.get('BATCH_LOCAL_TIMEOUT', 24 * 60 * 60))
+# Claimed batch jobs whose batch id was never recorded (the submitting run died) are
+# reconciled after this long; a batch is read by one poll at a time, for at most this long
+BATCH_CLAIM_TIMEOUT = int(os.environ.get('BATCH_CLAIM_TIMEOUT', 10 * 60))
+BATCH_POLL_LOCK_TIMEOUT = int(os.environ.get('BATCH_POLL_LOCK_TIMEOUT', 60 * 60))
+
+# Streaming generation: tokens go to a Redis buffer per job, copied to Job.partial_result
+# every JOB_PARTIAL_FLUSH_INTERVAL seconds
+JOB_PARTIAL_FLUSH_INTERVAL = float(os.environ.get('JOB_PARTIAL_FLUSH_INTERVAL', 5))
+JOB_PARTIAL_BUFFER_TTL = int(os.environ.get('JOB_PARTIAL_BUFFER_TTL', 60 * 60))
+
+# Job event stream (/api/events/, served by the ASGI app): seconds between keepalive
+# comments, EventSource reconnect delay, and minimum seconds between progress events
+JOB_EVENTS_HEARTBEAT = float(os.environ.get('JOB_EVENTS_HEARTBEAT', 15))
+JOB_EVENTS_RETRY_MS = int(os.environ.get('JOB_EVENTS_RETRY_MS', 3000))
+JOB_EVENTS_PROGRESS_INTERVAL = float(os.environ.get('JOB_EVENTS_PROGRESS_INTERVAL', 0.5))
+# Redis status record of each job (status_cache.py), kept this long after its last update
+JOB_STATUS_TTL = int(os.environ.get('JOB_STATUS_TTL', 24 * 60 * 60))
+# ...or, while the job is pending or running, this long, bounding how stale it can be
+JOB_STATUS_ACTIVE_TTL = int(os.environ.get('JOB_STATUS_ACTIVE_TTL', 5))
+
+# Scene rewrites include summaries of the nearest scenes (scriptwriter/scene_summaries.py):
+# at most SCENE_CONTEXT_MAX_NEIGHBOURS on each side, within SCENE_CONTEXT_TOKEN_BUDGET tokens.
+# Summaries are written by SCENE_SUMMARY_MODEL once per distinct scene text.
+SCENE_CONTEXT_TOKEN_BUDGET = int(os.environ.get('SCENE_CONTEXT_TOKEN_BUDGET', 800))
+SCENE_CONTEXT_MAX_NEIGHBOURS = int(os.environ.get('SCENE_CONTEXT_MAX_NEIGHBOURS', 10))
+SCENE_SUMMARY_MODEL = os.environ.get('SCENE_SUMMARY_MODEL', 'claude-haiku-4-5')
+SCENE_SUMMARY_MAX_TOKENS = int(os.environ.get('SCENE_SUMMARY_MAX_TOKENS', 150))
+# Seconds before the same version's summaries are queued again
+SCENE_SUMMARY_DEBOUNCE = int(os.environ.get('SCENE_SUMMARY_DEBOUNCE', 60))
+
+# /metrics/ (Prometheus): with METRICS_TOKEN set, only requests sending "Authorization: Bearer
+# <token>" are served; without it, only clients in METRICS_ALLOWED_IPS (addresses or networks)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [net for net in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if net]
+
+# Script version storage: full text every N versions, reverse deltas in between
+SCRIPT_VERSION_KEYFRAME_INTERVAL = int(os.environ.get('SCRIPT_VERSION_KEYFRAME_INTERVAL', 20))
+SCRIPT_VERSION_CACHE_SIZE = int(os.environ.get('SCRIPT_VERSION_CACHE_SIZE', 128))
 
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
@@ -181,6 +313,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # Large tables (scripts, versions, jobs) opt into cursor pagination per viewset
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
@@ -194,6 +327,10 @@ CACHES = {
     }
 }
 
+# Serialized API payloads (scripts, versions, scenes, characters) cached in Redis;
+# entries are invalidated by signals, the timeout only bounds memory use
+API_PAYLOAD_CACHE_TIMEOUT = int(os.environ.get('API_PAYLOAD_CACHE_TIMEOUT', 60 * 60))
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True